@@ -0,0 +1,83 @@
+"""Deterministic fake catalog shared by the Sanity stand-in and the database seeder."""
+import random
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List
+
+ADJECTIVES = ["Organic", "Classic", "Smart", "Compact", "Premium", "Rustic", "Wireless", "Eco", "Deluxe", "Vintage"]
+NOUNS = ["Lamp", "Chair", "Backpack", "Kettle", "Headphones", "Notebook", "Mug", "Sneakers", "Blanket", "Watch"]
+CATEGORY_NAMES = ["Home", "Kitchen", "Office", "Outdoor", "Fashion", "Electronics", "Sports", "Toys"]
+
+
+def _block(text: str) -> List[Dict[str, Any]]:
+    # Minimal Portable Text, the shape Sanity returns for rich-text fields
+    return [{"_type": "block", "style": "normal", "children": [{"_type": "span", "text": text}]}]
+
+
+def build_catalog(size: int, seed: int = 42) -> Dict[str, Any]:
+    rng = random.Random(seed)
+    categories = [
+        {
+            "_id": f"category-{i}",
+            "title": name,
+            "slug": name.lower(),
+            "description": _block(f"Everything for {name.lower()}."),
+            "imageUrl": f"https://cdn.example.com/categories/{name.lower()}.jpg",
+            "alt": name,
+            "order": i,
+        }
+        for i, name in enumerate(CATEGORY_NAMES)
+    ]
+    created = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    products = []
+    for i in range(size):
+        name = f"{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)} {i}"
+        category = categories[i % len(categories)]
+        products.append({
+            "_id": f"product-{i:06d}",
+            "_createdAt": (created + timedelta(minutes=i)).isoformat(),
+            "name": name,
+            "slug": name.lower().replace(" ", "-"),
+            "price": round(rng.uniform(5, 500), 2),
+            "description": _block(" ".join(rng.choice(NOUNS).lower() for _ in range(40))),
+            "category": {"_id": category["_id"], "title": category["title"], "slug": category["slug"]},
+            "imageUrl": f"https://cdn.example.com/products/{i}.jpg",
+            "alt": name,
+            "stock": rng.randint(0, 200),
+            "isFeatured": i % 10 == 0,
+            "sku": f"SKU-{i:06d}",
+        })
+    content_blocks = [
+        {
+            "_id": f"block-{i}",
+            "title": f"Block {i}",
+            "subtitle": "Fresh picks",
+            "description": _block("Seasonal highlights."),
+            "imageUrl": f"https://cdn.example.com/blocks/{i}.jpg",
+            "alt": f"Block {i}",
+            "imageLeft": i % 2 == 0,
+            "callToActionText": "Shop now",
+            "callToActionUrl": "/products",
+            "order": i,
+        }
+        for i in range(4)
+    ]
+    promos = [
+        {
+            "title": f"Promo {i}",
+            "description": "Limited time offer",
+            "discount": f"{10 + i * 5}%",
+            "validUntil": "2099-12-31",
+            "imageUrl": f"https://cdn.example.com/promos/{i}.jpg",
+        }
+        for i in range(3)
+    ]
+    homepage_sections = {
+        "benefits": {"title": "Why shop with us", "description": _block("Fast shipping."), "imageUrl": None, "alt": None},
+    }
+    return {
+        "categories": categories,
+        "products": products,
+        "content_blocks": content_blocks,
+        "promos": promos,
+        "homepage_sections": homepage_sections,
+    }
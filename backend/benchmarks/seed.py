@@ -0,0 +1,48 @@
+"""
+Prepares the benchmark database: applies migrations and loads the generated catalog
+into the `product` table the cart and checkout endpoints read. Run with the same
+environment as the app under test (DIRECT_URL pointing at the benchmark database).
+
+    python -m benchmarks.seed --catalog-size 1000
+"""
+import argparse
+import asyncio
+from sqlalchemy import delete
+from benchmarks.catalog import build_catalog
+from database.db import AsyncSessionLocal, async_engine
+from database.migrations import upgrade
+from models.models import Product
+
+
+async def seed(catalog_size: int, seed_value: int) -> int:
+    await upgrade()
+    catalog = build_catalog(catalog_size, seed_value)
+    async with AsyncSessionLocal() as session:
+        await session.execute(delete(Product))
+        session.add_all([
+            Product(
+                id=p["_id"],
+                name=p["name"],
+                description=p["description"][0]["children"][0]["text"],
+                price=p["price"],
+                stock=p["stock"],
+                category=p["category"]["title"],
+                imageUrl=p["imageUrl"],
+                alt=p["alt"],
+                isFeatured=p["isFeatured"],
+                sku=p["sku"],
+                slug=p["slug"],
+            )
+            for p in catalog["products"]
+        ])
+        await session.commit()
+    await async_engine.dispose()
+    return len(catalog["products"])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migrate and seed the benchmark database.")
+    parser.add_argument("--catalog-size", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    print(f"seeded {asyncio.run(seed(args.catalog_size, args.seed))} products")
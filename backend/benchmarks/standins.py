@@ -0,0 +1,183 @@
+"""
+Local stand-ins for the external services the API calls, all on one port:
+
+- /sanity/<version>/data/query/<dataset>  GROQ queries the app sends, answered from the
+  generated catalog (benchmarks/catalog.py)
+- /paypal/...                              OAuth token, create order, capture order
+- /supabase/rest/v1/<table>                PostgREST writes from the Sanity webhook
+
+Each service can add latency (mean and jitter) so runs can model real upstreams.
+
+    python -m benchmarks.standins --port 8900 --catalog-size 1000 --sanity-latency-ms 40
+"""
+import argparse
+import asyncio
+import json
+import random
+import re
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from benchmarks.catalog import build_catalog
+
+_TYPE = re.compile(r'_type == "(\w+)"')
+_CATEGORY_SLUG = re.compile(r'category->slug\.current == "([^"]*)"')
+_SLUG = re.compile(r'(?<!>)slug\.current == "([^"]*)"')
+_ID = re.compile(r'_id == "([^"]*)"')
+_PRICE = re.compile(r"price (>=|<=) ([0-9.]+)")
+_ORDER = re.compile(r"order\((\w+) (asc|desc)\)")
+
+
+def run_groq(query: str, catalog: Dict[str, Any], params: Optional[Dict[str, Any]] = None) -> Any:
+    """Answers the GROQ shapes used by services/sanity_service.py; anything else returns null."""
+    params = params or {}
+    match = _TYPE.search(query)
+    doc_type = match.group(1) if match else None
+    single = "][0]" in query
+
+    if doc_type == "homepageSection":
+        slug = _SLUG.search(query)
+        if slug:
+            return catalog["homepage_sections"].get(slug.group(1))
+        return [{"slug": slug, **section} for slug, section in catalog["homepage_sections"].items()]
+    if doc_type == "contentBlock":
+        return catalog["content_blocks"]
+    if doc_type == "category":
+        return catalog["categories"]
+    if doc_type == "promo":
+        return catalog["promos"]
+    if doc_type != "product":
+        return None
+
+    items: List[Dict[str, Any]] = catalog["products"]
+    if "isFeatured == true" in query:
+        items = [p for p in items if p["isFeatured"]]
+    category = _CATEGORY_SLUG.search(query)
+    if category:
+        items = [p for p in items if p["category"]["slug"] == category.group(1)]
+    slug = _SLUG.search(query)
+    if slug:
+        items = [p for p in items if p["slug"] == slug.group(1)]
+    doc_id = _ID.search(query)
+    if doc_id:
+        items = [p for p in items if p["_id"] == doc_id.group(1)]
+    if "_id in $ids" in query:
+        ids, slugs = set(params.get("ids", [])), set(params.get("slugs", []))
+        items = [p for p in items if p["_id"] in ids or p["slug"] in slugs]
+    for op, value in _PRICE.findall(query):
+        bound = float(value)
+        items = [p for p in items if (p["price"] >= bound if op == ">=" else p["price"] <= bound)]
+    order = _ORDER.search(query)
+    if order:
+        field = order.group(1)
+        items = sorted(items, key=lambda p: p.get(field) or "", reverse=order.group(2) == "desc")
+    if '"categoryTitle"' in query:
+        items = [{**p, "categoryTitle": p["category"]["title"]} for p in items]
+    if single:
+        return items[0] if items else None
+    return items
+
+
+class Latency:
+    def __init__(self, mean_ms: float, jitter: float, rng: random.Random):
+        self.mean_ms = mean_ms
+        self.jitter = jitter
+        self.rng = rng
+
+    async def wait(self) -> None:
+        if self.mean_ms > 0:
+            await asyncio.sleep(max(0.0, self.rng.gauss(self.mean_ms, self.mean_ms * self.jitter)) / 1000)
+
+
+def create_app(
+    catalog_size: int = 500,
+    seed: int = 42,
+    sanity_latency_ms: float = 0.0,
+    paypal_latency_ms: float = 0.0,
+    supabase_latency_ms: float = 0.0,
+    jitter: float = 0.2,
+) -> FastAPI:
+    app = FastAPI(title="Benchmark stand-ins")
+    catalog = build_catalog(catalog_size, seed)
+    rng = random.Random(seed)
+    sanity_latency = Latency(sanity_latency_ms, jitter, rng)
+    paypal_latency = Latency(paypal_latency_ms, jitter, rng)
+    supabase_latency = Latency(supabase_latency_ms, jitter, rng)
+    paypal_orders: Dict[str, Dict[str, Any]] = {}
+
+    @app.get("/health")
+    async def health():
+        return {"status": "ok", "products": len(catalog["products"])}
+
+    # The app's client requests "<base>/" with a trailing slash
+    @app.get("/sanity/{version}/data/query/{dataset}/")
+    @app.get("/sanity/{version}/data/query/{dataset}")
+    async def sanity_query(version: str, dataset: str, query: str, request: Request):
+        started = time.perf_counter()
+        await sanity_latency.wait()
+        params = {k[1:]: json.loads(v) for k, v in request.query_params.items() if k.startswith("$")}
+        result = run_groq(query, catalog, params)
+        return {"ms": int((time.perf_counter() - started) * 1000), "query": query, "result": result}
+
+    @app.post("/paypal/v1/oauth2/token")
+    async def paypal_token():
+        await paypal_latency.wait()
+        return {"access_token": f"bench-{uuid.uuid4().hex}", "token_type": "Bearer", "expires_in": 32400}
+
+    @app.post("/paypal/v2/checkout/orders")
+    async def paypal_create_order(request: Request):
+        await paypal_latency.wait()
+        payload = await request.json()
+        order_id = uuid.uuid4().hex[:17].upper()
+        paypal_orders[order_id] = payload
+        return JSONResponse({"id": order_id, "status": "CREATED", "links": []}, status_code=201)
+
+    @app.post("/paypal/v2/checkout/orders/{order_id}/capture")
+    async def paypal_capture_order(order_id: str):
+        await paypal_latency.wait()
+        payload: Optional[Dict[str, Any]] = paypal_orders.pop(order_id, None)
+        if payload is None:
+            return JSONResponse({"name": "RESOURCE_NOT_FOUND"}, status_code=404)
+        unit = payload["purchase_units"][0]
+        return JSONResponse({
+            "id": order_id,
+            "status": "COMPLETED",
+            "purchase_units": [{
+                "custom_id": unit.get("custom_id"),
+                "shipping": {
+                    "name": {"full_name": "Bench User"},
+                    "address": {"address_line_1": "1 Main St", "admin_area_2": "Springfield", "country_code": "US"},
+                },
+                "payments": {"captures": [{"id": uuid.uuid4().hex, "status": "COMPLETED", "amount": unit["amount"]}]},
+            }],
+        }, status_code=201)
+
+    @app.api_route("/supabase/rest/v1/{table}", methods=["GET", "POST", "PATCH", "DELETE"])
+    async def supabase_table(table: str, request: Request):
+        await supabase_latency.wait()
+        body = await request.body()
+        rows = await request.json() if body else []
+        return JSONResponse(rows if isinstance(rows, list) else [rows], status_code=201 if request.method == "POST" else 200)
+
+    return app
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Run the Sanity/PayPal/Supabase stand-ins.")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--catalog-size", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--sanity-latency-ms", type=float, default=0.0)
+    parser.add_argument("--paypal-latency-ms", type=float, default=0.0)
+    parser.add_argument("--supabase-latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.2, help="latency standard deviation as a fraction of the mean")
+    args = parser.parse_args()
+    uvicorn.run(
+        create_app(args.catalog_size, args.seed, args.sanity_latency_ms, args.paypal_latency_ms,
+                   args.supabase_latency_ms, args.jitter),
+        host="127.0.0.1", port=args.port, log_level="warning",
+    )
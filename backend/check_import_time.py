@@ -0,0 +1,53 @@
+"""
+Fails (exit 1) when importing the app takes longer than IMPORT_TIME_BUDGET_MS.
+
+    python check_import_time.py            # measure `import main`
+    python check_import_time.py --top 15   # also list the slowest modules (-X importtime)
+
+Run from the backend directory with the same environment as the app. Import happens
+in a fresh interpreter so earlier imports in this process can't hide any cost.
+"""
+import argparse
+import re
+import subprocess
+import sys
+from config.settings import settings
+
+MEASURE = "import time; t = time.perf_counter(); import main; print(f'{(time.perf_counter() - t) * 1000:.1f}')"
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)")
+
+
+def measure_import_ms() -> float:
+    result = subprocess.run([sys.executable, "-c", MEASURE], capture_output=True, text=True, check=True)
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def slowest_modules(top: int):
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"], capture_output=True, text=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            rows.append((int(match.group(2)), match.group(4)))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--budget-ms", type=float, default=settings.IMPORT_TIME_BUDGET_MS)
+    parser.add_argument("--top", type=int, default=0, help="show the N slowest modules (cumulative)")
+    args = parser.parse_args()
+
+    elapsed = measure_import_ms()
+    print(f"import main: {elapsed:.0f} ms (budget {args.budget_ms:.0f} ms)")
+    if args.top:
+        for cumulative_us, module in slowest_modules(args.top):
+            print(f"  {cumulative_us / 1000:8.1f} ms  {module}")
+    if elapsed > args.budget_ms:
+        print("Import time is over budget.")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
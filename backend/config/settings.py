@@ -1,11 +1,9 @@
 from pydantic_settings import BaseSettings, SettingsConfigDict # Import SettingsConfigDict
-import os
-from dotenv import load_dotenv
-
-load_dotenv()
+from typing import Optional
 
 class Settings(BaseSettings):
-    model_config = SettingsConfigDict(env_file='.env', extra='ignore') # Ensure it looks for .env
+    # .env is read once, here; the rest of the app reads configuration from `settings`
+    model_config = SettingsConfigDict(env_file='.env', extra='ignore')
 
     # Supabase Credentials
     NEXT_PUBLIC_SUPABASE_URL: str
@@ -13,13 +11,179 @@ class Settings(BaseSettings):
     SUPABASE_SECRET_KEY: str # This is crucial for server-side
     DIRECT_URL: str
 
+    # Database engine profile ("dev" or "prod"); the DB_* values below override the profile when set
+    DB_ENGINE_PROFILE: str = "dev"
+    DB_POOL_SIZE: Optional[int] = None
+    DB_MAX_OVERFLOW: Optional[int] = None
+    DB_POOL_TIMEOUT: Optional[float] = None
+    DB_POOL_RECYCLE: Optional[int] = None
+    DB_POOL_PRE_PING: Optional[bool] = None
+    DB_ECHO: Optional[bool] = None
+    DB_PGBOUNCER: Optional[bool] = None # None = detect from DIRECT_URL
+    # Apply pending migrations at startup (under the migration advisory lock, so one instance
+    # migrates while the others wait) instead of failing; off = only the deploy step migrates
+    DB_AUTO_MIGRATE: bool = True
+
+    # Optional read replica for /cart and /orders reads; a user's reads stay on the primary
+    # for READ_YOUR_WRITES_SECONDS after they write
+    READ_REPLICA_URL: Optional[str] = None
+    READ_YOUR_WRITES_SECONDS: float = 5.0
+
     # Sanity.io CMS Credentials
     SANITY_PROJECT_ID: str
     SANITY_DATASET: str = "production" # Default value if not found in .env
     SANITY_API_TOKEN: str # This might be optional if your backend only reads public Sanity data
+    SANITY_API_VERSION: str = "v2023-05-25"
+    SANITY_API_BASE: Optional[str] = None # overrides https://<project>.api.sanity.io (e.g. the benchmark stand-in)
+    SANITY_WEBHOOK_SECRET: Optional[str] = None # /webhook/sanity rejects requests while unset
+    # Per-worker cache of Sanity query results (services/sanity_service.py), off by default:
+    # product reads, prices and stock included, may be up to this many seconds stale, and the
+    # Sanity webhook only clears the cache of the worker that receives it. 0 = off.
+    SANITY_CACHE_TTL_SECONDS: float = 0.0
+    # Serve content reads (categories, content blocks, homepage sections, promos, featured
+    # products) from Sanity's CDN (apicdn.sanity.io); product and catalog reads stay live
+    SANITY_USE_CDN: bool = False
+
+    # PayPal REST credentials; PAYPAL_API_BASE overrides the live/sandbox URL (e.g. a local stand-in)
+    PAYPAL_MODE: str = "sandbox"
+    PAYPAL_CLIENT_ID: Optional[str] = None
+    PAYPAL_CLIENT_SECRET: Optional[str] = None
+    PAYPAL_API_BASE: Optional[str] = None
+    PAYPAL_WEBHOOK_ID: Optional[str] = None
+    PAYPAL_CERT_CACHE_TTL_SECONDS: int = 24 * 60 * 60
+
+    # Outbound HTTP (services/http_clients.py): negotiate HTTP/2 with upstreams that offer it
+    HTTP_CLIENT_HTTP2: bool = True
+
+    # Background workers draining the PayPal webhook inbox
+    PAYMENT_WEBHOOK_WORKERS: int = 2
+    PAYMENT_WEBHOOK_MAX_ATTEMPTS: int = 8
+    PAYMENT_WEBHOOK_RETRY_BASE_SECONDS: float = 2.0
+    PAYMENT_WEBHOOK_POLL_SECONDS: float = 5.0
+
+    # /api/orders/{id}/status long-poll: longest wait per request and open waits per process.
+    # "local" wakes waits in this process only; "postgres" also uses LISTEN/NOTIFY so any
+    # worker's commit wakes them (needs a direct connection; ORDER_NOTIFY_DSN defaults to DIRECT_URL)
+    ORDER_STATUS_MAX_WAIT_SECONDS: float = 25.0
+    ORDER_STATUS_MAX_WAITERS: int = 1000
+    ORDER_NOTIFY_BACKEND: str = "local"
+    ORDER_NOTIFY_DSN: Optional[str] = None
+
+    # Idempotency-Key replay window for checkout and PayPal endpoints, and how long an
+    # in_progress key is held before another request may take it over (keep it above the
+    # slowest checkout/capture, PayPal call included)
+    IDEMPOTENCY_TTL_SECONDS: int = 24 * 60 * 60
+    IDEMPOTENCY_LEASE_SECONDS: int = 60
+
+    # Clerk token verification. Session tokens (RS256) are checked against Clerk's JWKS;
+    # CLERK_JWKS_URL defaults to <CLERK_ISSUER>/.well-known/jwks.json. Tokens from Clerk's
+    # "supabase" JWT template (HS256, sent by the cart and checkout) are checked with
+    # SUPABASE_JWT_SECRET (Supabase > Settings > API > JWT secret). A token whose verifier
+    # isn't set is rejected, except with the "dev" DB_ENGINE_PROFILE, where it is decoded unverified.
+    CLERK_ISSUER: Optional[str] = None
+    CLERK_JWKS_URL: Optional[str] = None
+    SUPABASE_JWT_SECRET: Optional[str] = None
+    CLERK_JWKS_REFRESH_SECONDS: float = 60 * 60
+    AUTH_CLAIMS_CACHE_SIZE: int = 10_000
+
+    # Tracing: slow-query / slow-upstream / slow-request log thresholds, and whether
+    # responses carry a Server-Timing breakdown (exposes timings to clients; off by default)
+    SLOW_QUERY_MS: float = 200.0
+    SLOW_UPSTREAM_MS: float = 750.0
+    SLOW_REQUEST_MS: float = 1500.0
+    SERVER_TIMING_HEADER: bool = False
+
+    # Logging: level, "json" lines or "text", share of requests whose INFO/DEBUG logs are
+    # kept, and whether request/webhook payloads may be logged (debugging only)
+    LOG_LEVEL: str = "INFO"
+    LOG_FORMAT: str = "json"
+    LOG_SAMPLE_RATE: float = 1.0
+    LOG_PAYLOADS: bool = False
+
+    # On-demand request profiling: requests with `X-Profile-Token: <PROFILE_TOKEN>`, or a
+    # PROFILE_SAMPLE_RATE share of all requests, are sampled every PROFILE_INTERVAL_MS and
+    # written to PROFILE_OUTPUT_DIR ("collapsed" stacks or "speedscope" JSON). Off when neither is set.
+    PROFILE_TOKEN: Optional[str] = None
+    PROFILE_SAMPLE_RATE: float = 0.0
+    PROFILE_INTERVAL_MS: float = 5.0
+    PROFILE_OUTPUT_DIR: str = "profiles"
+    PROFILE_FORMAT: str = "collapsed"
+    PROFILE_MAX_CONCURRENT: int = 2
+
+    # Admission control: concurrent requests and queue length per priority class ("payment" =
+    # checkout and PayPal create/capture, "write" = cart changes, "read" = catalog/cart/order
+    # reads). A request that finds the queue full or waits longer than *_WAIT_SECONDS gets
+    # 503 with Retry-After. Keep the payment limit below the DB pool size so reads always get a connection.
+    ADMISSION_CONTROL: bool = True
+    ADMISSION_PAYMENT_CONCURRENCY: int = 4
+    ADMISSION_PAYMENT_QUEUE: int = 24
+    ADMISSION_PAYMENT_WAIT_SECONDS: float = 5.0
+    ADMISSION_WRITE_CONCURRENCY: int = 16
+    ADMISSION_WRITE_QUEUE: int = 64
+    ADMISSION_WRITE_WAIT_SECONDS: float = 2.0
+    ADMISSION_READ_CONCURRENCY: int = 64
+    ADMISSION_READ_QUEUE: int = 256
+    ADMISSION_READ_WAIT_SECONDS: float = 1.0
+    ADMISSION_RETRY_AFTER_SECONDS: int = 2
+
+    # In-memory product catalog behind /products/search: full reload from Sanity this often
+    # (webhook updates are applied in between)
+    CATALOG_REFRESH_SECONDS: float = 5 * 60
+    # Default lower bounds of the /products/facets price buckets (the last one is open-ended)
+    FACET_PRICE_BUCKETS: str = "0,25,50,100,250,500"
+    # Most IDs + slugs one /products/batch request may ask for
+    BATCH_MAX_PRODUCTS: int = 50
+    # Catalog shared by the workers on a host: a memory-mapped snapshot file (put it on tmpfs,
+    # e.g. /dev/shm/ai-mart-catalog) that one worker writes and every worker reads. Workers
+    # check it for a newer version every *_POLL_SECONDS; webhook changes are written to it
+    # after *_WRITE_DELAY_SECONDS (batching bursts). Unset = each worker keeps its own catalog.
+    CATALOG_SNAPSHOT_PATH: Optional[str] = None
+    CATALOG_SNAPSHOT_POLL_SECONDS: float = 1.0
+    CATALOG_SNAPSHOT_WRITE_DELAY_SECONDS: float = 1.0
+    # Warm starts: the last catalog, categories, content blocks and homepage sections from
+    # Sanity are saved to this file (on persistent disk) and loaded before the app takes
+    # traffic, then revalidated against Sanity in the background. Unset = start empty.
+    CATALOG_WARM_START_PATH: Optional[str] = None
+
+    # /events/catalog: buffered events per subscriber before it is dropped as too slow,
+    # open streams per process, and the keep-alive comment interval. "local" streams the
+    # webhooks this worker received; "postgres" relays them to every worker over
+    # LISTEN/NOTIFY (needs a direct connection; CATALOG_EVENTS_NOTIFY_DSN defaults to DIRECT_URL)
+    CATALOG_EVENTS_BUFFER: int = 64
+    CATALOG_EVENTS_MAX_SUBSCRIBERS: int = 1000
+    CATALOG_EVENTS_PING_SECONDS: int = 15
+    CATALOG_EVENTS_BACKEND: str = "local"
+    CATALOG_EVENTS_NOTIFY_DSN: Optional[str] = None
+
+    # /promos: the merged Sanity + Supabase promo feed is cached until its first promo expires
+    # or a promo is written through this worker; writes made elsewhere (other workers, the
+    # Supabase dashboard) show within PROMO_FEED_MAX_AGE_SECONDS
+    PROMO_FEED_MAX_AGE_SECONDS: float = 5 * 60
+
+    # Background jobs (services/jobs.py), on 5-field UTC cron schedules ("" disables a job).
+    # Each run starts up to SCHEDULER_JITTER_SECONDS late so workers don't fire together.
+    # Cache warming runs in every worker (only while SANITY_CACHE_TTL_SECONDS is set), so keep
+    # its schedule within that TTL; the other jobs run on one instance, the holder of a
+    # Postgres advisory lock taken over SCHEDULER_LEADER_DSN (a direct connection; defaults
+    # to DIRECT_URL).
+    SCHEDULER_ENABLED: bool = True
+    SCHEDULER_JITTER_SECONDS: float = 10.0
+    SCHEDULER_JOB_TIMEOUT_SECONDS: float = 10 * 60
+    SCHEDULER_LEADER_DSN: Optional[str] = None
+    SCHEDULER_LEADER_RETRY_SECONDS: float = 15.0
+    SCHEDULE_WARM_CACHES: str = "* * * * *"
+    SCHEDULE_EXPIRE_PROMOS: str = "5 0 * * *"
+    SCHEDULE_RECONCILE_CATALOG: str = "30 3 * * *"
+    SCHEDULE_PURGE_IDEMPOTENCY_KEYS: str = "15 * * * *"
+
+    # Startup: optional background warm-up once the server is listening, and the
+    # import-time budget enforced by check_import_time.py
+    WARMUP_ON_START: bool = False
+    WARMUP_DELAY_SECONDS: float = 1.0
+    IMPORT_TIME_BUDGET_MS: int = 1500
 
 # Create an instance of the Settings class.
-# Pydantic-settings will automatically read from environment variables (including those loaded by dotenv).
+# Pydantic-settings reads environment variables first, then falls back to .env.
 settings = Settings()
 
 # Optional: Add a quick check to see if critical variables are loaded
@@ -31,8 +195,3 @@ if not settings.DIRECT_URL:
 if not settings.SUPABASE_SECRET_KEY:
     print("ERROR: SUPABASE_SECRET_KEY is not set! Check your .env file.")
     raise ValueError("SUPABASE_SECRET_KEY is not configured.")
-
-print("SANITY_PROJECT_ID:", os.getenv("SANITY_PROJECT_ID"))
-
-
-
@@ -1,50 +1,273 @@
 import os
-from supabase import Client, create_client
+import time
+import logging
+from supabase import AsyncClient, AsyncClientOptions
 from config.settings import settings
 from sqlmodel.ext.asyncio.session import AsyncSession
-from sqlmodel import SQLModel
-from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy import exc as sa_exc
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import URL, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
 from sqlalchemy.orm import sessionmaker
-from typing import AsyncGenerator
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from typing import AsyncGenerator, Dict, Any, Optional, Tuple
+from collections import OrderedDict
+from fastapi import Depends
+from services.auth_service import get_current_user_id
+from observability.metrics import instrument_engine
+from services.http_clients import http_clients
+
+logger = logging.getLogger("main")
 
 supabase_url = settings.NEXT_PUBLIC_SUPABASE_URL
 supabase_key = settings.NEXT_PUBLIC_SUPABASE_ANON_KEY
 supabase_secret_key = settings.SUPABASE_SECRET_KEY
 
-# Initialize Supabase clients
-supabase_public: Client = create_client(supabase_url, supabase_key)
-supabase_admin: Client = create_client(supabase_url, supabase_secret_key)
+# Supabase clients are created on first use, not at import, to keep cold starts short.
+# Both talk through the pooled "supabase" connections of services/http_clients.py, each
+# with its own httpx client because PostgREST sets the API key as a client header.
+_supabase_public: Optional[AsyncClient] = None
+_supabase_admin: Optional[AsyncClient] = None
+
+
+def _supabase_client(name: str, key: str) -> AsyncClient:
+    return AsyncClient(supabase_url, key, AsyncClientOptions(httpx_client=http_clients.client("supabase", name)))
+
+
+def get_supabase_public() -> AsyncClient:
+    global _supabase_public
+    if _supabase_public is None:
+        _supabase_public = _supabase_client("public", supabase_key)
+    return _supabase_public
+
+
+def get_supabase_admin() -> AsyncClient:
+    global _supabase_admin
+    if _supabase_admin is None:
+        _supabase_admin = _supabase_client("admin", supabase_secret_key)
+    return _supabase_admin
+
+
+def close_supabase_clients() -> None:
+    """Drops the Supabase clients; their connections are closed with the HTTP pools."""
+    global _supabase_public, _supabase_admin
+    _supabase_public = _supabase_admin = None
 
 # Use create_async_engine for asynchronous database operations
 # Replace 'postgresql' with 'postgresql+asyncpg' to use asyncpg driver
 connection_string = str(settings.DIRECT_URL.replace('postgresql', 'postgresql+asyncpg'))
 
-# Best Practice: Configure asyncpg to disable statement caching and manage connection pooling
-async_engine = create_async_engine(
-    connection_string,
-    echo=True, # Set to False in production for less verbose logs
-    future=True,
-    # Crucial for PgBouncer/Supavisor transaction mode: disable prepared statement cache
-    connect_args={"statement_cache_size": 0},
-    # Recommended for pooled connections:
-    pool_pre_ping=True, # Pings connections before use to ensure they are alive
-    pool_recycle=3600 # Recycles connections after 1 hour (3600 seconds) to prevent stale connections
-)
+# Engine profiles selected by DB_ENGINE_PROFILE; individual DB_* settings override a profile's values.
+# dev: small pool, SQL echo and pre-ping for a flaky laptop connection.
+# prod: no echo, no per-checkout ping (pool_recycle retires stale connections instead),
+#       and a short pool_timeout so a saturated pool fails fast instead of queueing requests.
+ENGINE_PROFILES: Dict[str, Dict[str, Any]] = {
+    "dev": {
+        "pool_size": 5,
+        "max_overflow": 5,
+        "pool_timeout": 30.0,
+        "pool_recycle": 3600,
+        "pool_pre_ping": True,
+        "echo": True,
+    },
+    "prod": {
+        "pool_size": 10,
+        "max_overflow": 10,
+        "pool_timeout": 5.0,
+        "pool_recycle": 1800,
+        "pool_pre_ping": False,
+        "echo": False,
+    },
+}
+
+# Supabase's Supavisor/PgBouncer transaction pooler listens on 6543
+PGBOUNCER_PORTS = {6543}
+
+
+def uses_pgbouncer(url: URL) -> bool:
+    """
+    True when the URL points at a transaction-mode pooler, where prepared statements
+    can't be cached across transactions. DB_PGBOUNCER forces the answer either way.
+    """
+    if settings.DB_PGBOUNCER is not None:
+        return settings.DB_PGBOUNCER
+    if url.query.get("pgbouncer") == "true":
+        return True
+    return url.port in PGBOUNCER_PORTS or "pooler.supabase.com" in (url.host or "")
+
+
+class PoolWaitStats:
+    """Running totals of time spent waiting for a pooled connection."""
+
+    def __init__(self):
+        self.checkouts = 0
+        self.timeouts = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def observe(self, seconds: float) -> None:
+        self.checkouts += 1
+        self.total_wait_seconds += seconds
+        self.max_wait_seconds = max(self.max_wait_seconds, seconds)
+
+
+class InstrumentedAsyncPool(AsyncAdaptedQueuePool):
+    """AsyncAdaptedQueuePool that times every checkout, including waits for a free slot."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.wait_stats = PoolWaitStats()
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except sa_exc.TimeoutError:
+            self.wait_stats.timeouts += 1
+            raise
+        finally:
+            self.wait_stats.observe(time.perf_counter() - started)
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.wait_stats = self.wait_stats
+        return pool
+
+
+def build_engine_options(url: URL) -> Tuple[URL, Dict[str, Any]]:
+    """Resolves the configured engine profile into create_async_engine() arguments."""
+    profile_name = settings.DB_ENGINE_PROFILE.lower()
+    if profile_name not in ENGINE_PROFILES:
+        raise ValueError(f"Unknown DB_ENGINE_PROFILE '{settings.DB_ENGINE_PROFILE}'. Use one of: {', '.join(ENGINE_PROFILES)}")
+    options = dict(ENGINE_PROFILES[profile_name])
+    overrides = {
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+        "echo": settings.DB_ECHO,
+    }
+    options.update({k: v for k, v in overrides.items() if v is not None})
+    # echo=True would attach SQLAlchemy's own blocking stdout handler; route SQL through
+    # the app's (queued) logging pipeline instead
+    if options.pop("echo", False):
+        logging.getLogger("sqlalchemy.engine").setLevel(logging.INFO)
+
+    if url.get_backend_name() == "postgresql" and url.get_driver_name() == "asyncpg":
+        pgbouncer = uses_pgbouncer(url)
+        url = url.difference_update_query(["pgbouncer"])
+        if pgbouncer:
+            # Transaction-mode poolers hand each transaction a different server connection,
+            # so neither asyncpg's nor SQLAlchemy's prepared statement cache is safe
+            options["connect_args"] = {"statement_cache_size": 0, "prepared_statement_cache_size": 0}
+        logger.info(f"Database engine profile '{profile_name}' (pgbouncer={pgbouncer}, prepared statement cache={'off' if pgbouncer else 'on'})")
+    options["poolclass"] = InstrumentedAsyncPool
+    return url, options
+
+
+engine_url, engine_options = build_engine_options(make_url(connection_string))
+async_engine = create_async_engine(engine_url, future=True, **engine_options)
+instrument_engine(async_engine, "primary")
+
+# Optional read replica for read-only endpoints; without one, reads share the primary engine
+if settings.READ_REPLICA_URL:
+    replica_url, replica_options = build_engine_options(
+        make_url(settings.READ_REPLICA_URL.replace('postgresql', 'postgresql+asyncpg'))
+    )
+    read_engine = create_async_engine(replica_url, future=True, **replica_options)
+    instrument_engine(read_engine, "replica")
+else:
+    read_engine = async_engine
+
+
+def get_pool_metrics(engine: AsyncEngine = async_engine) -> Dict[str, Any]:
+    """Snapshot of pool occupancy and checkout wait times for the given engine."""
+    pool = engine.pool
+    metrics: Dict[str, Any] = {"pool_class": type(pool).__name__}
+    if isinstance(pool, AsyncAdaptedQueuePool):
+        metrics.update({
+            "size": pool.size(),
+            "checked_in": pool.checkedin(),
+            "in_use": pool.checkedout(),
+            "overflow": max(pool.overflow(), 0),
+            "max_overflow": pool._max_overflow,
+        })
+    stats = getattr(pool, "wait_stats", None)
+    if stats:
+        metrics.update({
+            "checkouts": stats.checkouts,
+            "checkout_timeouts": stats.timeouts,
+            "checkout_wait_seconds_total": round(stats.total_wait_seconds, 6),
+            "checkout_wait_seconds_avg": round(stats.total_wait_seconds / stats.checkouts, 6) if stats.checkouts else 0.0,
+            "checkout_wait_seconds_max": round(stats.max_wait_seconds, 6),
+        })
+    return metrics
+
+def dialect_insert(table):
+    """
+    INSERT for the primary engine's dialect, with on_conflict_do_nothing() available on
+    both PostgreSQL and SQLite (the benchmark harness can run on a local SQLite file).
+    """
+    if async_engine.dialect.name == "sqlite":
+        return sqlite.insert(table)
+    return postgresql.insert(table)
 
 # Define an async sessionmaker
 AsyncSessionLocal = sessionmaker(
     async_engine, class_=AsyncSession, expire_on_commit=False
 )
+ReadSessionLocal = sessionmaker(
+    read_engine, class_=AsyncSession, expire_on_commit=False
+)
 
-# Function to create database tables
-async def create_db_tables():
-    # DDL operations (like create_all) should use the engine's connection directly
-    async with async_engine.begin() as conn:
-        await conn.run_sync(SQLModel.metadata.create_all)
-    # print("DEBUG: SQLModel.metadata.create_all completed.")
+
+class RecentWriters:
+    """
+    Remembers which users wrote recently so their reads can stick to the primary
+    until the replica has caught up (read-your-writes). Bounded, per process.
+    """
+
+    def __init__(self, window_seconds: float, max_users: int = 10_000):
+        self.window_seconds = window_seconds
+        self.max_users = max_users
+        self._deadlines: "OrderedDict[str, float]" = OrderedDict()
+
+    def mark(self, user_id: str) -> None:
+        self._deadlines.pop(user_id, None)
+        self._deadlines[user_id] = time.monotonic() + self.window_seconds
+        while len(self._deadlines) > self.max_users:
+            self._deadlines.popitem(last=False)
+
+    def is_recent(self, user_id: str) -> bool:
+        deadline = self._deadlines.get(user_id)
+        if deadline is None:
+            return False
+        if deadline < time.monotonic():
+            del self._deadlines[user_id]
+            return False
+        return True
+
+
+recent_writers = RecentWriters(settings.READ_YOUR_WRITES_SECONDS)
+
+
+def mark_user_write(user_id: str) -> None:
+    """Call after committing a user's write so their next reads go to the primary."""
+    if read_engine is not async_engine:
+        recent_writers.mark(user_id)
 
 # Dependency to get an async session
 async def get_session() -> AsyncGenerator[AsyncSession, None]:
     async with AsyncSessionLocal() as session:
         yield session
 
+# Dependency to get a session for read-only endpoints: the replica, unless the caller wrote recently
+async def get_read_session(user_id: str = Depends(get_current_user_id)) -> AsyncGenerator[AsyncSession, None]:
+    session_factory = ReadSessionLocal
+    if read_engine is not async_engine:
+        if recent_writers.is_recent(user_id):
+            session_factory = AsyncSessionLocal
+    async with session_factory() as session:
+        yield session
+
@@ -0,0 +1,357 @@
+"""
+Versioned schema migrations.
+
+Run as a deploy step, before the new release starts serving:
+
+    python -m database.migrations upgrade
+    python -m database.migrations status
+
+At startup the app compares the recorded schema version with LATEST_VERSION (one
+indexed query) instead of introspecting the catalog with create_all. When it is behind
+and DB_AUTO_MIGRATE is set (the default, since hosts like Render's free plan skip the
+deploy step), startup applies the pending migrations under the same advisory lock, so
+only one instance migrates, and fails if that fails.
+
+Migrations never use the live models: each one works on the frozen table definitions
+below, so a fresh database goes through exactly the steps an existing one went through.
+"""
+import argparse
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, List, Optional
+from sqlalchemy import (
+    JSON, TIMESTAMP, Boolean, Column, Date, DateTime, Float, Index, Integer, MetaData, PrimaryKeyConstraint, String,
+    Table, Uuid, func, inspect, select, text,
+)
+from sqlalchemy.schema import CreateTable
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+from config.settings import settings
+from database.db import async_engine
+
+logger = logging.getLogger("main")
+
+schema_metadata = MetaData()
+schema_version_table = Table(
+    "schema_version",
+    schema_metadata,
+    Column("version", Integer, primary_key=True),
+    Column("description", String, nullable=False),
+    Column("applied_at", DateTime(timezone=True), nullable=False),
+)
+
+# Advisory lock key so two deploys can't migrate at the same time
+MIGRATION_LOCK_KEY = 7_310_032
+
+
+class SchemaVersionError(RuntimeError):
+    """Raised at startup when the database schema is older than the code expects."""
+
+
+class Migration:
+    """
+    One schema step. `transactional=False` runs the step on an AUTOCOMMIT connection,
+    which PostgreSQL requires for CREATE INDEX CONCURRENTLY.
+    """
+
+    def __init__(
+        self,
+        version: int,
+        description: str,
+        upgrade: Callable[[AsyncConnection], Awaitable[None]],
+        transactional: bool = True,
+    ):
+        self.version = version
+        self.description = description
+        self.upgrade = upgrade
+        self.transactional = transactional
+
+
+# --- Migration 1: baseline tables, frozen as the app created them before migrations ---
+baseline_metadata = MetaData()
+product_table = Table(
+    "product", baseline_metadata,
+    Column("id", String, primary_key=True),
+    Column("name", String, nullable=False),
+    Column("description", String),
+    Column("price", Float, nullable=False),
+    Column("stock", Integer, nullable=False),
+    Column("category", String),
+    Column("imageUrl", String),
+    Column("alt", String),
+    Column("isFeatured", Boolean),
+    Column("sku", String),
+    Column("slug", String),
+)
+dynamic_promo_table = Table(
+    "dynamic_promo", baseline_metadata,
+    Column("id", String, primary_key=True),
+    Column("title", String, nullable=False),
+    Column("description", String),
+    Column("discount", String),
+    Column("valid_until", Date),
+    Column("imageUrl", String),
+    Column("is_active", Boolean),
+)
+cartitem_table = Table(
+    "cartitem", baseline_metadata,
+    Column("user_id", String, nullable=False),
+    Column("product_id", String, nullable=False),
+    Column("name", String, nullable=False),
+    Column("price", Float, nullable=False),
+    Column("quantity", Integer, nullable=False),
+    Column("imageUrl", String),
+    Column("slug", String),
+    Column("sku", String),
+    PrimaryKeyConstraint("user_id", "product_id"),
+)
+order_table = Table(
+    "order", baseline_metadata,
+    Column("id", Uuid, primary_key=True),
+    Column("payment_order_id", String),
+    Column("user_id", String, nullable=False),
+    Column("shipping_address", String, nullable=False),
+    Column("total_amount", Float, nullable=False),
+    Column("status", String, nullable=False),
+    Column("created_at", TIMESTAMP(timezone=True), nullable=False),
+)
+orderitem_table = Table(
+    "orderitem", baseline_metadata,
+    Column("id", Uuid, primary_key=True),
+    Column("order_id", Uuid, nullable=False),
+    Column("product_id", String, nullable=False),
+    Column("quantity", Integer, nullable=False),
+    Column("price", Float, nullable=False),
+)
+idempotency_key_table = Table(
+    "idempotency_key", baseline_metadata,
+    Column("key", String(255), nullable=False),
+    Column("user_id", String, nullable=False),
+    Column("scope", String, nullable=False),
+    Column("status", String, nullable=False),
+    Column("response_status", Integer),
+    Column("response_body", JSON),
+    Column("created_at", TIMESTAMP(timezone=True), nullable=False),
+    Column("expires_at", TIMESTAMP(timezone=True), nullable=False),
+    PrimaryKeyConstraint("key", "user_id"),
+)
+payment_webhook_inbox_table = Table(
+    "payment_webhook_inbox", baseline_metadata,
+    Column("id", String, primary_key=True),
+    Column("event_type", String, nullable=False),
+    Column("payload", JSON, nullable=False),
+    Column("status", String, nullable=False),
+    Column("attempts", Integer, nullable=False),
+    Column("last_error", String),
+    Column("next_attempt_at", TIMESTAMP(timezone=True), nullable=False),
+    Column("received_at", TIMESTAMP(timezone=True), nullable=False),
+    Column("processed_at", TIMESTAMP(timezone=True)),
+)
+
+
+BASELINE_INDEXES: List[Index] = [
+    Index("ix_idempotency_key_expires_at", idempotency_key_table.c.expires_at),
+]
+
+
+def _create_baseline(sync_conn) -> None:
+    # CREATE TABLE alone: indexes declared on these tables by later migrations stay theirs.
+    # Tables that predate migrations are left alone.
+    existing = set(inspect(sync_conn).get_table_names())
+    for table in baseline_metadata.sorted_tables:
+        if table.name not in existing:
+            sync_conn.execute(CreateTable(table))
+    for index in BASELINE_INDEXES:
+        index.create(sync_conn, checkfirst=True)
+
+
+async def _create_baseline_tables(conn: AsyncConnection) -> None:
+    await conn.run_sync(_create_baseline)
+
+
+def _create_indexes(indexes: List[Index]) -> Callable[[AsyncConnection], Awaitable[None]]:
+    async def create(conn: AsyncConnection) -> None:
+        for index in indexes:
+            await conn.run_sync(lambda sync_conn, index=index: index.create(sync_conn, checkfirst=True))
+    return create
+
+
+# --- Migration 2 ---
+# Index set for the hot queries in main.py, utils.py and services/:
+# - orders for a user, newest first (GET /orders)
+# - order lookup by PayPal order id (capture / webhook existing-order check)
+# - items of an order (GET /orders/{order_id})
+# - due events in the payment inbox (worker claim query)
+# cartitem needs no extra index: its primary key (user_id, product_id) already leads with user_id.
+HOT_PATH_INDEXES: List[Index] = [
+    Index("ix_order_user_id_created_at", order_table.c.user_id, order_table.c.created_at.desc(),
+          postgresql_concurrently=True),
+    Index("ix_order_payment_order_id", order_table.c.payment_order_id, postgresql_concurrently=True),
+    Index("ix_orderitem_order_id", orderitem_table.c.order_id, postgresql_concurrently=True),
+    Index("ix_payment_webhook_inbox_due", payment_webhook_inbox_table.c.next_attempt_at,
+          postgresql_where=text("status = 'pending'"), sqlite_where=text("status = 'pending'"),
+          postgresql_concurrently=True),
+]
+
+
+# --- Migration 3 ---
+# Active, unexpired promos (services/promo_feed.py): filters on is_active and a
+# valid_until range, ordered by valid_until. Partial, so deactivated promos stay out of it.
+PROMO_INDEXES: List[Index] = [
+    Index("ix_dynamic_promo_active_valid_until", dynamic_promo_table.c.valid_until,
+          postgresql_where=text("is_active"), sqlite_where=text("is_active"),
+          postgresql_concurrently=True),
+]
+
+
+# --- Migration 4 ---
+# One order per PayPal payment: the capture endpoint and the webhook inbox both create
+# orders for the same payment, and only a unique index stops the loser of that race
+# (services/order_service.py falls back to the winner's order). Replaces the plain
+# ix_order_payment_order_id from migration 2, which the unique index makes redundant.
+PAYMENT_ORDER_ID_UNIQUE_INDEX = Index(
+    "ux_order_payment_order_id", order_table.c.payment_order_id, unique=True, postgresql_concurrently=True,
+)
+
+
+async def _make_payment_order_id_unique(conn: AsyncConnection) -> None:
+    duplicates = (await conn.execute(
+        select(order_table.c.payment_order_id)
+        .where(order_table.c.payment_order_id.is_not(None))
+        .group_by(order_table.c.payment_order_id)
+        .having(func.count() > 1)
+        .limit(10)
+    )).scalars().all()
+    if duplicates:
+        raise RuntimeError(
+            f"Orders share PayPal order ids ({', '.join(duplicates)}); "
+            f"merge or delete the duplicates before applying migration 4."
+        )
+    if conn.dialect.name == "postgresql":
+        # A failed CREATE INDEX CONCURRENTLY leaves an invalid index behind, which checkfirst
+        # would take for the real one; drop it so a retry builds it again
+        invalid = (await conn.execute(text(
+            "SELECT 1 FROM pg_index WHERE indexrelid = to_regclass('ux_order_payment_order_id') AND NOT indisvalid"
+        ))).first()
+        if invalid:
+            await conn.execute(text("DROP INDEX CONCURRENTLY ux_order_payment_order_id"))
+    await conn.run_sync(lambda sync_conn: PAYMENT_ORDER_ID_UNIQUE_INDEX.create(sync_conn, checkfirst=True))
+    plain_index = next(index for index in HOT_PATH_INDEXES if index.name == "ix_order_payment_order_id")
+    await conn.run_sync(lambda sync_conn: plain_index.drop(sync_conn, checkfirst=True))
+
+
+
+# --- Migration 5 ---
+# The request an Idempotency-Key was first used with (services/idempotency_service.py), so
+# reusing the key for a different request is refused instead of replaying the wrong
+# response. Nullable: keys stored before it replay without the check until they expire.
+def _add_request_fingerprint(sync_conn) -> None:
+    columns = {column["name"] for column in inspect(sync_conn).get_columns("idempotency_key")}
+    if "request_fingerprint" not in columns:
+        sync_conn.execute(text("ALTER TABLE idempotency_key ADD COLUMN request_fingerprint VARCHAR(64)"))
+
+
+async def _add_idempotency_fingerprint(conn: AsyncConnection) -> None:
+    await conn.run_sync(_add_request_fingerprint)
+
+
+MIGRATIONS: List[Migration] = [
+    Migration(1, "baseline tables", _create_baseline_tables),
+    Migration(2, "hot-path indexes for orders, order items and the payment inbox",
+              _create_indexes(HOT_PATH_INDEXES), transactional=False),
+    Migration(3, "partial index for active dynamic promos", _create_indexes(PROMO_INDEXES), transactional=False),
+    Migration(4, "unique index on order.payment_order_id", _make_payment_order_id_unique, transactional=False),
+    Migration(5, "idempotency_key.request_fingerprint", _add_idempotency_fingerprint),
+]
+LATEST_VERSION = MIGRATIONS[-1].version
+
+
+async def get_schema_version(engine: AsyncEngine = async_engine) -> Optional[int]:
+    """Returns the applied schema version, or None when migrations have never run."""
+    async with engine.connect() as conn:
+        try:
+            result = await conn.execute(select(func.max(schema_version_table.c.version)))
+        except Exception:
+            # Table doesn't exist yet
+            return None
+        return result.scalar()
+
+
+async def check_schema_version(engine: AsyncEngine = async_engine) -> None:
+    """
+    Startup check. When the deploy step hasn't migrated the database, applies the pending
+    migrations (DB_AUTO_MIGRATE) or fails fast; a failed migration fails startup too.
+    """
+    version = await get_schema_version(engine)
+    if version is not None and version >= LATEST_VERSION:
+        logger.info(f"Database schema is at version {version}.")
+        return
+    if settings.DB_AUTO_MIGRATE:
+        logger.warning(f"Database schema at version {version}, expected {LATEST_VERSION}; upgrading at startup.")
+        await upgrade(engine)
+        return
+    raise SchemaVersionError(
+        f"Database schema is at version {version}, expected {LATEST_VERSION}. "
+        f"Run `python -m database.migrations upgrade` before starting the app."
+    )
+
+
+async def upgrade(engine: AsyncEngine = async_engine) -> int:
+    """Applies every pending migration in order and returns the resulting version."""
+    is_postgres = engine.dialect.name == "postgresql"
+    async with engine.connect() as lock_conn:
+        if is_postgres:
+            await lock_conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": MIGRATION_LOCK_KEY})
+            await lock_conn.commit()
+        try:
+            async with engine.begin() as conn:
+                await conn.run_sync(schema_metadata.create_all)
+            current = await get_schema_version(engine) or 0
+
+            for migration in MIGRATIONS:
+                if migration.version <= current:
+                    continue
+                logger.info(f"Applying migration {migration.version}: {migration.description}")
+                if migration.transactional:
+                    async with engine.begin() as conn:
+                        await migration.upgrade(conn)
+                        await _record(conn, migration)
+                else:
+                    async with engine.connect() as conn:
+                        autocommit_conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+                        await migration.upgrade(autocommit_conn)
+                    async with engine.begin() as conn:
+                        await _record(conn, migration)
+                current = migration.version
+            logger.info(f"Database schema is at version {current}.")
+            return current
+        finally:
+            if is_postgres:
+                await lock_conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": MIGRATION_LOCK_KEY})
+                await lock_conn.commit()
+
+
+async def _record(conn: AsyncConnection, migration: Migration) -> None:
+    await conn.execute(schema_version_table.insert().values(
+        version=migration.version,
+        description=migration.description,
+        applied_at=datetime.now(timezone.utc),
+    ))
+
+
+async def _main(command: str) -> None:
+    try:
+        if command == "upgrade":
+            await upgrade()
+        else:
+            version = await get_schema_version()
+            print(f"schema version: {version} (latest: {LATEST_VERSION})")
+    finally:
+        await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s %(message)s")
+    parser = argparse.ArgumentParser(description="Apply or inspect database schema migrations.")
+    parser.add_argument("command", choices=["upgrade", "status"])
+    asyncio.run(_main(parser.parse_args().command))
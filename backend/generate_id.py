@@ -19,4 +19,6 @@ def generate_base64_uuid() -> str:
     b64 = base64.urlsafe_b64encode(u.bytes).rstrip(b'=').decode('ascii')
     return b64
 
-print(generate_base64_uuid())  # e.g., "e6vK1nGqR7qQ9XJv0a5X4Q"
+
+if __name__ == "__main__":
+    print(generate_base64_uuid())  # e.g., "e6vK1nGqR7qQ9XJv0a5X4Q"
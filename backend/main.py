@@ -1,4 +1,7 @@
-import logging, json, asyncio, os, requests, paypalrestsdk
+import time
+_import_started = time.perf_counter()
+
+import logging, json, asyncio
 from uuid import UUID
 from typing import List, Optional, Dict, Any
 from fastapi import FastAPI, Depends, HTTPException, Request, Header, Body, Query
@@ -7,67 +10,102 @@ from fastapi.middleware.cors import CORSMiddleware
 from postgrest.exceptions import APIError
 from sqlalchemy import select
 from datetime import datetime, timezone
-from database.db import create_db_tables, get_session, supabase_public, supabase_admin
+from database.db import (
+    get_session, get_read_session, mark_user_write, get_pool_metrics, AsyncSessionLocal,
+    async_engine, read_engine, get_supabase_public, get_supabase_admin, close_supabase_clients
+)
+from database.migrations import check_schema_version
 from sqlmodel.ext.asyncio.session import AsyncSession
 from services.sanity_service import (
-    fetch_static_promos, fetch_homepage_section, fetch_content_blocks,
-    fetch_categories, fetch_featured_products, fetch_all_products, fetch_product_by_id, fetch_product_by_slug
+    invalidate_sanity_cache, fetch_static_promos, fetch_homepage_section, fetch_content_blocks,
+    fetch_categories, fetch_featured_products, fetch_all_products, fetch_product_by_id, fetch_product_by_slug,
+    fetch_products_by_keys
 )
 from models.models import (
     Product, DynamicPromo, CartItem, CheckoutPayload, Order, OrderItem,
     SanityProductAPIModel, HomepageSection, ContentBlock, Category,
     ProductDisplayAPIModel, SanityProductData, OrderDetailsResponse,
-    OrderItemResponse, PayPalWebhookRequest
+    OrderItemResponse, PayPalWebhookRequest, ProductFacetsResponse, ProductBatchResponse, PromoFeedItem
 )
 from utils import (
     SignatureValidationError, verify_sanity_webhook_signature, normalize_product_id,
-    get_clerk_sub_from_jwt, get_supabase_client_and_user,
     fetch_product_by_id_async, fetch_products_async,
     fetch_cart_items_async, fetch_orders_for_user_async,
     
 )
+from services.auth_service import clerk_auth, get_current_user_id
+from services.idempotency_service import IDEMPOTENCY_HEADER, IdempotentRequest
+from services.paypal_service import PayPalAPIError, close_paypal_clients, get_paypal_client
+from services.order_service import create_order_from_cart, find_order_by_payment_id, format_shipping_address
+from services.order_notifier import order_notifier
+from services.payment_inbox import payment_inbox, record_webhook_event
+from services.paypal_webhook_verifier import (
+    WebhookVerificationError, get_paypal_webhook_verifier
+)
+from services.warmup import (
+    fallback_content, fallback_homepage_section, restore_warm_start, revalidate_warm_start, warm_up,
+)
+from services.jobs import scheduler
+from services.promo_feed import promo_feed
+from services.catalog_store import SORT_ORDERS, catalog_store
+from services.catalog_events import catalog_events
+from sse_starlette.sse import EventSourceResponse
+from services.admission import AdmissionMiddleware
+from services.http_clients import http_clients
+from observability.metrics import (
+    MetricsMiddleware, observe_upstream, register_http_client_collector, register_pool_collector, render_metrics,
+)
+from observability.tracing import REQUEST_ID_HEADER, TracingMiddleware, span
+from observability.logging_setup import configure_logging
+from observability.profiling import ProfilingMiddleware, profiling_enabled
+from config.settings import settings
 from pydantic import BaseModel, Field
-from dotenv import load_dotenv
 from fastapi import Response
-import logging, pytz
 
 
-logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s %(message)s")
+configure_logging()
 logger = logging.getLogger("main")
 
-load_dotenv()
-
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Startup tasks
-    logger.info("Starting up application.")
-
-    # --- Configure PayPal SDK ---
-    paypal_mode = os.getenv("PAYPAL_MODE", "sandbox")
-    paypal_client_id = os.getenv("PAYPAL_CLIENT_ID")
-    paypal_client_secret = os.getenv("PAYPAL_CLIENT_SECRET")
-
-    if not all([paypal_client_id, paypal_client_secret]):
-        logger.error("PayPal credentials (CLIENT_ID, CLIENT_SECRET) are not set in the environment.")
-    else:
-        try:
-            paypalrestsdk.configure({
-                "mode": paypal_mode,
-                "client_id": paypal_client_id,
-                "client_secret": paypal_client_secret
-            })
-            logger.info(f"PayPal SDK configured for '{paypal_mode}' mode.")
-        except Exception as e:
-            logger.error(f"Failed to configure PayPal SDK: {e}")
-    
-    # --- Create database tables ---
-
-    logger.info("CREATING DATABASE TABLES...")
-    await create_db_tables()
-    logger.info("Database tables created successfully.")
+    # Startup tasks: keep this short. External clients (Supabase, Sanity, PayPal) are
+    # created on first use; anything slow belongs in the optional background warm-up.
+    logger.info(f"Starting up application (module import took {IMPORT_SECONDS * 1000:.0f} ms).")
+
+    if not settings.SANITY_WEBHOOK_SECRET:
+        logger.error("SANITY_WEBHOOK_SECRET is not set. /webhook/sanity will reject all requests.")
+
+    # --- Check database schema; pending migrations are applied here when the deploy step didn't run ---
+    await check_schema_version()
+
+    clerk_auth.start()
+    payment_inbox.start()
+    order_notifier.start()
+    catalog_events.start()
+    # Serve the persisted catalog from the first request; Sanity is revalidated behind it
+    revalidate_task = None
+    if settings.CATALOG_WARM_START_PATH and await restore_warm_start():
+        revalidate_task = asyncio.create_task(revalidate_warm_start(), name="warm-start-revalidate")
+    warmup_task = asyncio.create_task(warm_up()) if settings.WARMUP_ON_START else None
+    if settings.SCHEDULER_ENABLED:
+        scheduler.start()
     yield
     # Shutdown tasks
     logger.info("Shutting down the application...")
+    for task in (warmup_task, revalidate_task):
+        if task and not task.done():
+            task.cancel()
+    await scheduler.stop()
+    await payment_inbox.stop()
+    await order_notifier.stop()
+    await catalog_events.stop()
+    await clerk_auth.aclose()
+    close_supabase_clients()
+    close_paypal_clients()
+    await http_clients.aclose()
+    await async_engine.dispose()
+    if read_engine is not async_engine:
+        await read_engine.dispose()
 
 
 app = FastAPI(
@@ -93,13 +131,21 @@ origins = [
     "https://curated-shop-australia.vercel.app"
 ]
 
+# Innermost of the middlewares, so shed requests still get CORS headers, metrics and a request ID
+if settings.ADMISSION_CONTROL:
+    app.add_middleware(AdmissionMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"], 
+    expose_headers=[REQUEST_ID_HEADER],
 )
+app.add_middleware(MetricsMiddleware)
+if profiling_enabled():
+    app.add_middleware(ProfilingMiddleware)
+app.add_middleware(TracingMiddleware)
 
 
 # @app.options("/{rest_of_path:path}")
@@ -112,6 +158,32 @@ def read_root():
     return {"message": "Welcome to the E-commerce API!"}
 
 
+def _product_display(p: Dict[str, Any]) -> ProductDisplayAPIModel:
+    """API model for a product as returned by fetch_all_products() (category expanded)."""
+    slug_data = p.get('slug')
+    slug_value = slug_data.get('current') if isinstance(slug_data, dict) else slug_data
+
+    category_obj = p.get('category') or {}
+    category_data = {
+        "slug": category_obj.get('slug'),
+        "title": category_obj.get('title')
+    } if isinstance(category_obj, dict) else None
+
+    return ProductDisplayAPIModel(
+        id=p.get('_id'),
+        slug=slug_value,
+        name=p.get('name'),
+        price=p.get('price'),
+        description=p.get('description'),
+        category=category_data,  # ✅ full object
+        imageUrl=p.get('imageUrl'),
+        alt=p.get('alt'),
+        stock=p.get('stock'),
+        isFeatured=p.get('isFeatured', False),
+        sku=p.get('sku')
+    )
+
+
 @app.get("/products", response_model=List[ProductDisplayAPIModel])
 async def get_products(
     category: Optional[str] = Query(None, description="Filter products by category slug"),
@@ -127,33 +199,15 @@ async def get_products(
             min_price=minPrice,
             max_price=maxPrice
         )
+        if not raw_products and catalog_store.loaded:
+            # Sanity didn't answer (or nothing matches): serve the catalog held in memory,
+            # which a warm start restores before Sanity is reachable
+            raw_products = catalog_store.browse(category, minPrice, maxPrice, sort)
         if not raw_products:
             return []
 
-        transformed_products = []
-        for p in raw_products:
-            slug_data = p.get('slug')
-            slug_value = slug_data.get('current') if isinstance(slug_data, dict) else slug_data
-
-            category_obj = p.get('category') or {}
-            category_data = {
-                "slug": category_obj.get('slug'),
-                "title": category_obj.get('title')
-            } if isinstance(category_obj, dict) else None
-
-            transformed_products.append(ProductDisplayAPIModel(
-                id=p.get('_id'),
-                slug=slug_value,
-                name=p.get('name'),
-                price=p.get('price'),
-                description=p.get('description'),
-                category=category_data,  # ✅ full object
-                imageUrl=p.get('imageUrl'),
-                alt=p.get('alt'),
-                stock=p.get('stock'),
-                isFeatured=p.get('isFeatured', False),
-                sku=p.get('sku')
-            ))
+        with span("transform_products"):
+            transformed_products = [_product_display(p) for p in raw_products]
         return transformed_products
     except Exception as e:
         logger.error(f"Error fetching products: {str(e)}", exc_info=True)
@@ -167,30 +221,118 @@ async def get_featured_products_endpoint():
         if not raw_products:
             return []
 
-        transformed_products = []
-        for product in raw_products:
-            slug_data = product.get('slug')
-            slug_value = slug_data.get('current') if isinstance(slug_data, dict) else slug_data
-            category_title = product.get('category')
-
-            transformed_products.append(ProductDisplayAPIModel(
-                id=product.get('_id'),
-                slug=slug_value,
-                name=product.get('name'),
-                price=product.get('price'),
-                description=product.get('description'),
-                category=category_title,
-                imageUrl=product.get('imageUrl'),
-                alt=product.get('alt'),
-                stock=product.get('stock'),
-                isFeatured=product.get('isFeatured', False),
-                sku=product.get('sku')
-            ))
+        with span("transform_products"):
+            transformed_products = []
+            for product in raw_products:
+                slug_data = product.get('slug')
+                slug_value = slug_data.get('current') if isinstance(slug_data, dict) else slug_data
+                category_title = product.get('category')
+
+                transformed_products.append(ProductDisplayAPIModel(
+                    id=product.get('_id'),
+                    slug=slug_value,
+                    name=product.get('name'),
+                    price=product.get('price'),
+                    description=product.get('description'),
+                    category=category_title,
+                    imageUrl=product.get('imageUrl'),
+                    alt=product.get('alt'),
+                    stock=product.get('stock'),
+                    isFeatured=product.get('isFeatured', False),
+                    sku=product.get('sku')
+                ))
         return transformed_products
     except Exception as e:
         logger.error(f"Error fetching featured products: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail="Failed to fetch featured products")
 
+# Registered before /products/{product_slug} so "search" isn't taken for a slug
+@app.get("/products/search", response_model=List[ProductDisplayAPIModel])
+async def search_products(
+    q: str = Query(..., min_length=1, max_length=200, description="Search text; the last word also matches as a prefix (typeahead)"),
+    category: Optional[str] = Query(None, description="Filter products by category slug"),
+    sort: str = Query("relevance", description="Sort order: relevance, newest, price-asc, price-desc, name-asc, name-desc"),
+    minPrice: Optional[float] = Query(None, description="Minimum price for filtering"),
+    maxPrice: Optional[float] = Query(None, description="Maximum price for filtering"),
+    limit: int = Query(20, ge=1, le=100, description="Maximum number of results"),
+):
+    """Full-text product search over name, SKU, category and description, served from the in-memory catalog."""
+    if sort not in SORT_ORDERS:
+        raise HTTPException(status_code=400, detail=f"Unknown sort order: {sort}")
+    if not await catalog_store.ensure_loaded():
+        raise HTTPException(status_code=503, detail="Product search is temporarily unavailable")
+    with span("product_search"):
+        results = catalog_store.search(
+            q, category_slug=category, min_price=minPrice, max_price=maxPrice, sort_order=sort, limit=limit
+        )
+        return [_product_display(p) for p in results]
+
+def _parse_price_buckets(value: str) -> List[float]:
+    try:
+        edges = [float(edge) for edge in value.split(",") if edge.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="priceBuckets must be comma-separated numbers")
+    if not edges or len(edges) > 50 or any(b <= a for a, b in zip(edges, edges[1:])):
+        raise HTTPException(status_code=400, detail="priceBuckets must be 1-50 strictly ascending numbers")
+    return edges
+
+@app.get("/products/facets", response_model=ProductFacetsResponse)
+async def get_product_facets(
+    category: Optional[str] = Query(None, description="Filter products by category slug"),
+    minPrice: Optional[float] = Query(None, description="Minimum price for filtering"),
+    maxPrice: Optional[float] = Query(None, description="Maximum price for filtering"),
+    priceBuckets: Optional[str] = Query(None, description="Comma-separated bucket lower bounds, e.g. 0,50,100 (last bucket is open-ended)"),
+):
+    """
+    Filter-sidebar counts for the /products filter set: products per category slug, per
+    price bucket, and in stock vs out of stock. Counts come from the in-memory catalog.
+    """
+    edges = _parse_price_buckets(priceBuckets or settings.FACET_PRICE_BUCKETS)
+    if not await catalog_store.ensure_loaded():
+        raise HTTPException(status_code=503, detail="Product facets are temporarily unavailable")
+    columns = await catalog_store.columns()
+    with span("product_facets"):
+        return columns.facets(category, minPrice, maxPrice, edges)
+
+def _split_keys(value: Optional[str]) -> List[str]:
+    # Comma-separated, blanks dropped, duplicates removed in order
+    return list(dict.fromkeys(key.strip() for key in (value or "").split(",") if key.strip()))
+
+@app.get("/products/batch", response_model=ProductBatchResponse)
+async def get_products_batch(
+    ids: Optional[str] = Query(None, description="Comma-separated product IDs"),
+    slugs: Optional[str] = Query(None, description="Comma-separated product slugs"),
+):
+    """
+    Several products by ID and/or slug in one call, in request order (IDs, then slugs),
+    with the keys that matched nothing listed under `missing`. Served from the in-memory
+    catalog once it is loaded, otherwise with a single GROQ query.
+    """
+    id_keys, slug_keys = _split_keys(ids), _split_keys(slugs)
+    if not id_keys and not slug_keys:
+        raise HTTPException(status_code=400, detail="Pass ids and/or slugs")
+    if len(id_keys) + len(slug_keys) > settings.BATCH_MAX_PRODUCTS:
+        raise HTTPException(status_code=400, detail=f"At most {settings.BATCH_MAX_PRODUCTS} ids and slugs per request")
+
+    if catalog_store.loaded:
+        await catalog_store.ensure_loaded()  # schedules a refresh when stale
+        by_id = {key: catalog_store.get(key) for key in id_keys}
+        by_slug = {key: catalog_store.get_by_slug(key) for key in slug_keys}
+    else:
+        raw_products = await fetch_products_by_keys(tuple(id_keys), tuple(slug_keys))
+        by_id = {p["_id"]: p for p in raw_products if p.get("_id")}
+        by_slug = {p["slug"]: p for p in raw_products if p.get("slug")}
+
+    products, seen = [], set()
+    missing_ids = [key for key in id_keys if not by_id.get(key)]
+    missing_slugs = [key for key in slug_keys if not by_slug.get(key)]
+    for product in [by_id.get(key) for key in id_keys] + [by_slug.get(key) for key in slug_keys]:
+        # The same product asked for by ID and by slug is returned once
+        if product and product["_id"] not in seen:
+            seen.add(product["_id"])
+            products.append(_product_display(product))
+    return {"products": products, "missing": {"ids": missing_ids, "slugs": missing_slugs}}
+
 @app.get("/products/{product_slug}", response_model=ProductDisplayAPIModel)
 async def get_product(product_slug: str):
     logger.info(f"Fetching product by slug: {product_slug}")
@@ -224,13 +366,21 @@ async def get_product(product_slug: str):
         logger.error(f"Error fetching product {product_slug}: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail="Failed to fetch product")
 
-# --- PROMO ENDPOINTS (No changes needed here) ---
+# --- PROMO ENDPOINTS ---
+@app.get("/promos", response_model=List[PromoFeedItem])
+async def get_promos():
+    """Active promos from Sanity and Supabase in one list, soonest-ending first (see services/promo_feed.py)."""
+    feed = await promo_feed.get()
+    return feed["promos"]
+
 @app.post("/promos/dynamic", response_model=DynamicPromo)
 async def create_dynamic_promo(payload: DynamicPromo):
     logger.info(f"Creating dynamic promo: {payload.title}")
     try:
-        result = supabase_public.table('dynamic_promo').insert(payload.model_dump()).execute()
+        with observe_upstream("supabase", "dynamic_promo.insert"):
+            result = await get_supabase_public().table('dynamic_promo').insert(payload.model_dump(mode="json")).execute()
         if result.data:
+            promo_feed.invalidate()
             return DynamicPromo.model_validate(result.data[0], from_attributes=True)
         raise HTTPException(status_code=500, detail="Failed to insert dynamic promo")
     except APIError as e:
@@ -242,23 +392,18 @@ async def create_dynamic_promo(payload: DynamicPromo):
 
 @app.get("/promos/dynamic", response_model=List[DynamicPromo])
 async def get_dynamic_promos():
-    logger.info("Fetching dynamic promos")
-    try:
-        result = supabase_public.table('dynamic_promo').select('*').execute()
-        return [DynamicPromo.model_validate(item, from_attributes=True) for item in result.data]
-    except APIError as e:
-        logger.error(f"Supabase error fetching dynamic promos: {e.message}", exc_info=True)
-        raise HTTPException(status_code=e.code if isinstance(e.code, int) else 500, detail=f"Failed to retrieve dynamic promos: {e.message}")
-    except Exception as e:
-        logger.error(f"Error fetching dynamic promos: {str(e)}", exc_info=True)
-        raise HTTPException(status_code=500, detail=f"Failed to retrieve dynamic promos: {str(e)}")
+    """Active, unexpired dynamic promos (the Supabase part of the /promos feed)."""
+    feed = await promo_feed.get()
+    if feed["dynamic"] is None:
+        raise HTTPException(status_code=500, detail="Failed to retrieve dynamic promos")
+    return [DynamicPromo.model_validate(item, from_attributes=True) for item in feed["dynamic"]]
 
 # --- SANITY CMS (HOMEPAGE SECTIONS) ENDPOINTS (No changes needed here) ---
 @app.get("/homepage/sections/{slug}", response_model=HomepageSection)
 async def get_homepage_section_by_slug(slug: str):
     logger.info(f"Fetching homepage section: {slug}")
     try:
-        data = await fetch_homepage_section(slug)
+        data = await fetch_homepage_section(slug) or fallback_homepage_section(slug)
         if not data:
             raise HTTPException(status_code=404, detail="Homepage section not found")
         return HomepageSection(**data)
@@ -270,7 +415,7 @@ async def get_homepage_section_by_slug(slug: str):
 async def get_content_blocks():
     logger.info("Fetching content blocks")
     try:
-        data = await fetch_content_blocks()
+        data = await fetch_content_blocks() or fallback_content("contentBlocks")
         if not data:
             return []
         return [ContentBlock(**item) for item in data]
@@ -282,7 +427,7 @@ async def get_content_blocks():
 async def get_categories_endpoint():
     logger.info("Fetching categories")
     try:
-        data = await fetch_categories()
+        data = await fetch_categories() or fallback_content("categories")
         if not data:
             return []
         # return [Category(**item) for item in data]
@@ -300,10 +445,9 @@ async def get_categories_endpoint():
 @app.post("/cart", response_model=CartItem)
 async def add_to_cart(
     payload: CartItem,
-    request: Request,
+    request: Request, user_id: str = Depends(get_current_user_id),
     session: AsyncSession = Depends(get_session)
 ):
-    user_id = get_supabase_client_and_user(request)
     product_id = normalize_product_id(payload.product_id)
     # Check product existence
     product = await fetch_product_by_id_async(product_id, session)
@@ -322,24 +466,24 @@ async def add_to_cart(
     if existing_item:
         existing_item.quantity += payload.quantity
         await session.commit()
+        mark_user_write(user_id)
         return existing_item
 
     session.add(payload)
     await session.commit()
+    mark_user_write(user_id)
     await session.refresh(payload)
     return payload
 
 # --- VIEW CART ---
 @app.get("/cart", response_model=Dict[str, Any])
-async def get_cart(request: Request, session: AsyncSession = Depends(get_session)):
-    user_id = get_supabase_client_and_user(request)
+async def get_cart(request: Request, user_id: str = Depends(get_current_user_id), session: AsyncSession = Depends(get_read_session)):
     items = await fetch_cart_items_async(user_id, session)
     return {"message": "Cart retrieved", "cart": items}
 
 # --- UPDATE CART ITEM QUANTITY ---
 @app.put("/cart/{product_id}", response_model=CartItem)
-async def update_cart_item_quantity(request: Request, product_id: str, payload: dict = Body(...), session: AsyncSession = Depends(get_session)):
-    user_id = get_supabase_client_and_user(request)
+async def update_cart_item_quantity(request: Request, product_id: str, user_id: str = Depends(get_current_user_id), payload: dict = Body(...), session: AsyncSession = Depends(get_session)):
     quantity = payload.get("quantity")
     if quantity is None or not isinstance(quantity, int) or quantity < 1:
         raise HTTPException(status_code=400, detail="Quantity must be a positive integer")
@@ -352,12 +496,12 @@ async def update_cart_item_quantity(request: Request, product_id: str, payload:
         raise HTTPException(status_code=404, detail="Cart item not found")
     cart_item.quantity = quantity
     await session.commit()
+    mark_user_write(user_id)
     return cart_item
 
 # --- REMOVE FROM CART ---
 @app.delete("/cart/{product_id}")
-async def remove_from_cart(product_id: str, request: Request, session: AsyncSession = Depends(get_session)):
-    user_id = get_supabase_client_and_user(request)
+async def remove_from_cart(product_id: str, request: Request, user_id: str = Depends(get_current_user_id), session: AsyncSession = Depends(get_session)):
     statement = select(CartItem).where(
         (CartItem.user_id == user_id) & (CartItem.product_id == product_id)
     )
@@ -367,78 +511,83 @@ async def remove_from_cart(product_id: str, request: Request, session: AsyncSess
         raise HTTPException(status_code=404, detail="Cart item not found")
     await session.delete(cart_item)
     await session.commit()
+    mark_user_write(user_id)
     return {"message": "Item removed from cart"}
 
 # --- CHECKOUT ---
 @app.post("/checkout")
-async def checkout(payload: CheckoutPayload, request: Request, session: AsyncSession = Depends(get_session)):
-    user_id = get_supabase_client_and_user(request)
-    cart_items = await fetch_cart_items_async(user_id, session)
-    if not cart_items:
-        raise HTTPException(status_code=400, detail="Cart is empty")
-    product_ids = [item["product_id"] for item in cart_items]
-    fetch_tasks = [fetch_product_by_id_async(pid, session) for pid in product_ids]
-    product_details = await asyncio.gather(*fetch_tasks)
-    products_data = {str(p["id"]): p for p in product_details if p and "id" in p}
-    total_amount = 0.0
-    processed_cart_items = []
-    for item in cart_items:
-        pid = item["product_id"]
-        product = products_data.get(pid)
-        if not product:
-            raise HTTPException(status_code=404, detail=f"Product {pid} not found during checkout")
-        current_price = float(product["price"])
-        total_amount += current_price * item["quantity"]
-        processed_cart_items.append({
-            "product_id": pid,
-            "quantity": item["quantity"],
-            "price": current_price
-        })
+async def checkout(
+    payload: CheckoutPayload,
+    request: Request, user_id: str = Depends(get_current_user_id),
+    session: AsyncSession = Depends(get_session),
+    idempotency_key: Optional[str] = Header(None, alias=IDEMPOTENCY_HEADER),
+):
+    async with IdempotentRequest(session, idempotency_key, user_id, "checkout", request) as idem:
+        if idem.replay:
+            return idem.replay
+        cart_items = await fetch_cart_items_async(user_id, session)
+        if not cart_items:
+            raise HTTPException(status_code=400, detail="Cart is empty")
+        product_ids = [item["product_id"] for item in cart_items]
+        fetch_tasks = [fetch_product_by_id_async(pid, session) for pid in product_ids]
+        product_details = await asyncio.gather(*fetch_tasks)
+        products_data = {str(p["id"]): p for p in product_details if p and "id" in p}
+        total_amount = 0.0
+        processed_cart_items = []
+        for item in cart_items:
+            pid = item["product_id"]
+            product = products_data.get(pid)
+            if not product:
+                raise HTTPException(status_code=404, detail=f"Product {pid} not found during checkout")
+            current_price = float(product["price"])
+            total_amount += current_price * item["quantity"]
+            processed_cart_items.append({
+                "product_id": pid,
+                "quantity": item["quantity"],
+                "price": current_price
+            })
     
-    # Create Order
-    order = Order(
-        user_id=user_id,
-        shipping_address=payload.shipping_address,
-        total_amount=total_amount,
-        status="pending",
-        created_at=datetime.now(timezone.utc)
-    )
-    session.add(order)
-
-    await session.flush()
-
-    for item in processed_cart_items:
-        order_item = OrderItem(
-            order_id=order.id,
-            product_id=item["product_id"],
-            quantity=item["quantity"],
-            price=item["price"]
+        # Create Order
+        order = Order(
+            user_id=user_id,
+            shipping_address=payload.shipping_address,
+            total_amount=total_amount,
+            status="pending",
+            created_at=datetime.now(timezone.utc)
         )
-        session.add(order_item)
+        session.add(order)
 
-    logger.info(f"created_at = {order.created_at}, tzinfo = {order.created_at.tzinfo}, is_aware = {order.created_at.tzinfo is not None}")
-    
-    await session.commit()
+        await session.flush()
 
-    # Clear user's cart — use bulk delete to avoid Row/unmapped errors
-    from sqlalchemy import delete
+        for item in processed_cart_items:
+            order_item = OrderItem(
+                order_id=order.id,
+                product_id=item["product_id"],
+                quantity=item["quantity"],
+                price=item["price"]
+            )
+            session.add(order_item)
 
-    await session.exec(
-    delete(CartItem).where(CartItem.user_id == user_id)
-    )
+        logger.debug(f"created_at = {order.created_at}, tzinfo = {order.created_at.tzinfo}, is_aware = {order.created_at.tzinfo is not None}")
 
-    await session.commit()
+        # Clear user's cart — use bulk delete to avoid Row/unmapped errors
+        from sqlalchemy import delete
+
+        await session.exec(
+        delete(CartItem).where(CartItem.user_id == user_id)
+        )
 
-    await session.refresh(order)
-    return {"message": "Order placed successfully", "order_id": order.id}
+        # complete() commits the order, the cleared cart and the stored response together
+        body = await idem.complete({"message": "Order placed successfully", "order_id": order.id})
+        mark_user_write(user_id)
+        return body
 
 
 @app.get("/orders", response_model=List[Order])
-async def get_orders(request: Request, session: AsyncSession = Depends(get_session)):
+async def get_orders(request: Request, user_id: str = Depends(get_current_user_id), session: AsyncSession = Depends(get_read_session)):
     """
     Fetches all orders for the authenticated user.
     """
-    user_id = get_supabase_client_and_user(request)
     stmt = select(Order).where(Order.user_id == user_id).order_by(Order.created_at.desc())
     
     # Use .scalars().all() to return a list of Order model instances, not raw rows
@@ -452,6 +601,9 @@ async def get_orders(request: Request, session: AsyncSession = Depends(get_sessi
 # This endpoint is for debugging purposes only, to log incoming headers and body.
 @app.post("/webhook/sanity/debug")
 async def sanity_webhook_debug(request: Request):
+    # Echoes signatures and payloads, so it only exists while payload logging is on
+    if not settings.LOG_PAYLOADS:
+        raise HTTPException(status_code=404, detail="Not Found")
     headers = dict(request.headers)
     body = await request.body()
 
@@ -472,11 +624,6 @@ async def sanity_webhook_debug(request: Request):
         "message": "Logged headers and body for debug"
     }
 
-SANITY_WEBHOOK_SECRET = os.getenv("SANITY_WEBHOOK_SECRET")
-if not SANITY_WEBHOOK_SECRET:
-    logger.error("SANITY_WEBHOOK_SECRET environment variable not set. Webhook verification will be skipped.")
-    raise ValueError("SANITY_WEBHOOK_SECRET environment variable not set.")
-
 # --- SANITY WEBHOOK ENDPOINT ---
 @app.post("/webhook/sanity")
 async def sanity_webhook(
@@ -486,20 +633,28 @@ async def sanity_webhook(
     logger.info("Received webhook request.")
 
     body = await request.body()
-    logger.info(f"Raw request body length: {len(body)} bytes")
+    logger.debug(f"Raw request body length: {len(body)} bytes")
 
     # Verify webhook signature
+    if not settings.SANITY_WEBHOOK_SECRET:
+        logger.error("SANITY_WEBHOOK_SECRET is not set; rejecting webhook.")
+        raise HTTPException(status_code=500, detail="Webhook verification is not configured")
     try:
-        verify_sanity_webhook_signature(SANITY_WEBHOOK_SECRET, body, sanity_webhook_signature)
+        verify_sanity_webhook_signature(settings.SANITY_WEBHOOK_SECRET, body, sanity_webhook_signature)
         logger.info("Webhook signature successfully verified.")
     except SignatureValidationError as e:
         logger.warning(f"Signature validation error: {e}")
         raise HTTPException(status_code=403, detail="Invalid webhook signature")
 
+    # Content changed in Sanity; drop cached query results so the next reads see it
+    invalidate_sanity_cache()
+    promo_feed.invalidate()
+
     # Parse JSON payload
     try:
         payload_json = json.loads(body)
-        logger.info(f"Verified webhook payload: {json.dumps(payload_json, indent=2)}")
+        if settings.LOG_PAYLOADS:
+            logger.info(f"Verified webhook payload: {body.decode('utf-8', errors='replace')}")
     except json.JSONDecodeError:
         logger.error("Invalid JSON payload")
         raise HTTPException(status_code=400, detail="Invalid JSON payload")
@@ -513,12 +668,19 @@ async def sanity_webhook(
             for deleted_id in deleted_ids:
                 logger.info(f"Deleting product with ID: {deleted_id}")
 
-                result = supabase_admin.table("product").delete().eq("id", deleted_id).execute()
-                if result.error:
-                    logger.error(f"Failed to delete product {deleted_id}: {result.error}")
+                try:
+                    with observe_upstream("supabase", "product.delete"):
+                        await get_supabase_admin().table("product").delete().eq("id", deleted_id).execute()
+                except APIError as e:
+                    # The product is gone from Sanity either way; reconcile_catalog repairs the mirror
+                    logger.error(f"Failed to delete product {deleted_id}: {e.message}")
                 else:
                     logger.info(f"Deleted product {deleted_id} from Supabase successfully.")
 
+            catalog_store.remove(deleted_ids)
+            for deleted_id in deleted_ids:
+                if not deleted_id.startswith("drafts."):
+                    catalog_events.publish_product_deleted(deleted_id)
             return {"message": "Products deleted from Supabase successfully"}
 
         # --- Handle product creation or update ---
@@ -559,11 +721,22 @@ async def sanity_webhook(
                 "sku": product_data.get("sku"),
             }
 
-            logger.info(f"Upserting product to Supabase: {product_to_upsert}")
-            result = supabase_admin.table("product").upsert(product_to_upsert, on_conflict="id").execute()
+            if settings.LOG_PAYLOADS:
+                logger.info(f"Upserting product to Supabase: {product_to_upsert}")
+            else:
+                logger.info(f"Upserting product {product_to_upsert['id']} to Supabase")
+            with observe_upstream("supabase", "product.upsert"):
+                result = await get_supabase_admin().table("product").upsert(product_to_upsert, on_conflict="id").execute()
             
 
             logger.info(f"Product {product_to_upsert['id']} synced to Supabase successfully.")
+            previous = catalog_store.get(normalized_id)
+            catalog_store.apply_document(product_data)
+            if catalog_store.loaded:
+                catalog_events.publish_product_change(previous, catalog_store.get(normalized_id))
+            elif incoming_id and not incoming_id.startswith("drafts."):
+                # No loaded catalog to diff against, so every field would look changed
+                catalog_events.publish_product_touched(normalized_id)
             return {"message": "Product synced to Supabase successfully", "product_id": product_to_upsert['id']}
 
         else:
@@ -574,55 +747,24 @@ async def sanity_webhook(
         logger.error(f"Error processing webhook: {exc}", exc_info=True)
         raise HTTPException(status_code=500, detail="Internal server error.")
 
-# PAYPAL CONFIGURATION
-PAYPAL_CLIENT_ID = os.getenv("PAYPAL_CLIENT_ID")
-PAYPAL_CLIENT_SECRET = os.getenv("PAYPAL_CLIENT_SECRET")
-
-def get_paypal_api_base() -> str:
-    """
-    Determines the PayPal API base URL based on the PAYPAL_MODE environment variable.
-    Defaults to sandbox if the mode is not 'live'.
-    """
-    paypal_mode = os.getenv("PAYPAL_MODE", "sandbox")
-    if paypal_mode.lower() == "live":
-        logger.info("PayPal integration is running in LIVE mode.")
-        return "https://api-m.paypal.com"
-
-    logger.info("PayPal integration is running in SANDBOX mode.")
-    return "https://api-m.sandbox.paypal.com"
-
-# --- Helper Function to Get PayPal Access Token ---
-def get_paypal_access_token():
-    """
-    Retrieves an OAuth2 access token from PayPal's v2 API.
-    """
-    auth = (PAYPAL_CLIENT_ID, PAYPAL_CLIENT_SECRET)
-    data = {'grant_type': 'client_credentials'}
-    headers = {'Accept': 'application/json', 'Accept-Language': 'en_US'}
-    api_base = get_paypal_api_base()
-    
-    logger.info(f"Attempting to get PayPal access token from {api_base}")
-
-    try:
-        response = requests.post(f"{api_base}/v1/oauth2/token", auth=auth, data=data, headers=headers)
-        response.raise_for_status()
-        token_data = response.json()
-        return token_data['access_token']
-    except requests.exceptions.HTTPError as err:
-        logger.error(f"PayPal Auth Error: {err.response.text}")
-        raise HTTPException(status_code=500, detail="Failed to authenticate with PayPal.")
-
-
 @app.post("/api/orders/create")
 async def create_order_api(
-    request: Request,
-    session: AsyncSession = Depends(get_session)
+    request: Request, user_id: str = Depends(get_current_user_id),
+    session: AsyncSession = Depends(get_session),
+    idempotency_key: Optional[str] = Header(None, alias=IDEMPOTENCY_HEADER),
 ):
     """
     Creates a PayPal order and embeds the internal user_id as a custom_id.
+    A replayed Idempotency-Key returns the stored PayPal order ID without calling PayPal again.
     """
+    async with IdempotentRequest(session, idempotency_key, user_id, "paypal-create", request) as idem:
+        if idem.replay:
+            return idem.replay
+        return await idem.complete(await _create_paypal_order(user_id, session))
+
+
+async def _create_paypal_order(user_id: str, session: AsyncSession) -> Dict[str, Any]:
     try:
-        user_id = get_supabase_client_and_user(request)
         cart_items_stmt = select(CartItem).where(CartItem.user_id == user_id)
         cart_items_result = await session.execute(cart_items_stmt)
         cart_items = cart_items_result.all()
@@ -632,11 +774,6 @@ async def create_order_api(
 
         total_amount_str = f"{sum(item[0].price * item[0].quantity for item in cart_items):.2f}"
 
-        access_token = get_paypal_access_token()
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {access_token}",
-        }
         payload = {
             "intent": "CAPTURE",
             "purchase_units": [{
@@ -648,13 +785,11 @@ async def create_order_api(
             }]
         }
 
-        api_base = get_paypal_api_base()
-        response = requests.post(f"{api_base}/v2/checkout/orders", json=payload, headers=headers)
-        response.raise_for_status()
-        order_data = response.json()
-        
+        order_data = await get_paypal_client().create_order(payload)
         return {"orderID": order_data["id"]}
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error creating PayPal order: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="Could not create PayPal order.")
@@ -665,69 +800,56 @@ async def create_order_api(
 @app.post("/api/orders/{order_id}/capture")
 async def capture_order_api(
     order_id: str,
-    request: Request,
-    session: AsyncSession = Depends(get_session)
+    request: Request, user_id: str = Depends(get_current_user_id),
+    session: AsyncSession = Depends(get_session),
+    idempotency_key: Optional[str] = Header(None, alias=IDEMPOTENCY_HEADER),
 ):
+    """
+    Captures an approved PayPal order and turns the user's cart into an Order.
+    A replayed Idempotency-Key returns the stored result without touching PayPal or the cart.
+    """
+    async with IdempotentRequest(session, idempotency_key, user_id, f"paypal-capture:{order_id}", request) as idem:
+        if idem.replay:
+            return idem.replay
+        # complete() commits the new order together with the stored response
+        body = await idem.complete(await _capture_paypal_order(order_id, user_id, session))
+        mark_user_write(user_id)
+        return body
+
+
+async def _capture_paypal_order(order_id: str, user_id: str, session: AsyncSession) -> Dict[str, Any]:
     try:
-        # Capture payment in PayPal (your existing logic)
-        access_token = get_paypal_access_token()
-        headers = {"Content-Type": "application/json", "Authorization": f"Bearer {access_token}"}
-        api_base = get_paypal_api_base()
-        response = requests.post(f"{api_base}/v2/checkout/orders/{order_id}/capture", headers=headers)
-        response.raise_for_status()
-        capture_data = response.json()
+        # Capture payment in PayPal
+        capture_data = await get_paypal_client().capture_order(order_id)
 
         if capture_data.get("status") != "COMPLETED":
             raise HTTPException(status_code=400, detail="Payment not completed by PayPal.")
 
-        user_id = get_supabase_client_and_user(request)
-
-        # Fetch cart
-        cart_items_stmt = select(CartItem).where(CartItem.user_id == user_id)
-        cart_items_result = await session.execute(cart_items_stmt)
-        cart_items = cart_items_result.scalars().all()  # Use scalars() for better handling
+        purchase_unit = capture_data.get("purchase_units", [{}])[0]
+        total_amount = float(purchase_unit.get("payments", {}).get("captures", [{}])[0].get("amount", {}).get("value", 0.0))
 
-        # --- SURGICAL FIX 1: Always check for existing order first to handle webhook race ---
-        existing_stmt = select(Order).where(Order.payment_order_id == order_id, Order.user_id == user_id)
-        existing_res = await session.execute(existing_stmt)
-        existing_order = existing_res.scalar_one_or_none()
+        # The webhook inbox may already have recorded this payment; create_order_from_cart checks first
+        new_order, created = await create_order_from_cart(
+            session,
+            user_id=user_id,
+            payment_order_id=order_id,
+            shipping_address=format_shipping_address(purchase_unit.get("shipping", {})),
+            total_amount=total_amount,
+        )
 
-        if existing_order:
+        if new_order and not created:
             # Webhook already processed: Return consistent success format (matches frontend expectation)
             return {
                 "status": "COMPLETED",  # Explicitly add this to satisfy onApprove check
-                "orderId": existing_order.id,
+                "orderId": new_order.id,
                 "message": "Order already processed by webhook."
             }
 
-        if not cart_items:
+        if not new_order:
             # No cart and no existing order: This is a true failure, but log it and return 400 consistently
-            print(f"Capture failed for order {order_id}: Cart empty and no existing order.")  # Add minimal logging for your terminal
+            logger.warning(f"Capture failed for order {order_id}: Cart empty and no existing order.")
             raise HTTPException(status_code=400, detail="Cart empty and no order found.")
 
-        # Proceed with order creation (your existing logic, unchanged)
-        purchase_unit = capture_data.get("purchase_units", [{}])[0]
-        shipping_info = purchase_unit.get("shipping", {})
-        shipping_address = f"{shipping_info.get('name', {}).get('full_name', '')}, {shipping_info.get('address', {}).get('address_line_1', '')}, {shipping_info.get('address', {}).get('admin_area_2', '')}".strip(", ")
-        total_amount = float(purchase_unit.get("payments", {}).get("captures", [{}])[0].get("amount", {}).get("value", 0.0))
-
-        new_order = Order(
-            payment_order_id=order_id,
-            user_id=user_id,
-            shipping_address=shipping_address,
-            total_amount=total_amount,
-            status="completed"
-        )
-        session.add(new_order)
-        await session.flush()
-
-        for item in cart_items:  # Simplified loop (no need for [0] since scalars())
-            session.add(OrderItem(order_id=new_order.id, product_id=item.product_id, quantity=item.quantity, price=item.price))
-            await session.delete(item)
-
-        await session.commit()
-        await session.refresh(new_order)
-
         # --- SURGICAL FIX 2: Always return consistent success format on new order ---
         return {
             "status": "COMPLETED",  # Explicitly add this to satisfy onApprove check
@@ -735,15 +857,52 @@ async def capture_order_api(
             "message": "Order placed successfully!"
         }
 
-    except requests.exceptions.HTTPError as http_err:
-        print(f"PayPal API error in capture: {http_err.response.text}")  # Add for terminal visibility
-        raise HTTPException(status_code=http_err.response.status_code, detail=f"PayPal API error: {http_err.response.text}")
+    except HTTPException:
+        raise
+    except PayPalAPIError as paypal_err:
+        logger.error(f"PayPal API error in capture: {paypal_err.text}")
+        raise HTTPException(status_code=paypal_err.status_code, detail=f"PayPal API error: {paypal_err.text}")
     except Exception as e:
-        print(f"Unexpected error in capture endpoint: {str(e)}")  # Add for terminal visibility
+        logger.error(f"Unexpected error in capture endpoint: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail="Could not capture payment.")
 
 
-PAYPAL_WEBHOOK_ID = os.getenv("PAYPAL_WEBHOOK_ID")
+@app.get("/api/orders/{order_id}/status")
+async def paypal_order_status(
+    order_id: str,
+    user_id: str = Depends(get_current_user_id),
+    wait: float = Query(
+        settings.ORDER_STATUS_MAX_WAIT_SECONDS, ge=0, le=settings.ORDER_STATUS_MAX_WAIT_SECONDS,
+        description="Seconds to wait for the order to complete before answering PENDING",
+    ),
+):
+    """
+    Long-poll for the outcome of an approved PayPal order. Answers COMPLETED (same shape
+    as the capture response) as soon as either the capture endpoint or the webhook commits
+    the Order, or PENDING after `wait` seconds, so the client learns the outcome in one
+    round trip instead of retrying capture or polling /orders.
+    """
+    if order_notifier.at_capacity:
+        raise HTTPException(status_code=503, detail="Too many pending status requests", headers={"Retry-After": "5"})
+    # Registered before the lookup, so an order committed in between still wakes us
+    waiter = order_notifier.register(order_id)
+    try:
+        async with AsyncSessionLocal() as session:
+            order = await find_order_by_payment_id(session, order_id, user_id)
+        if order:
+            return {"status": "COMPLETED", "orderId": str(order.id), "paypalOrderId": order_id}
+        if wait > 0:
+            with span("order_status_wait", kind="wait"):
+                try:
+                    notification = await asyncio.wait_for(waiter, timeout=wait)
+                except asyncio.TimeoutError:
+                    notification = None
+            if notification and notification.get("userId") == user_id:
+                return {"status": "COMPLETED", "orderId": notification["orderId"], "paypalOrderId": order_id}
+        return {"status": "PENDING", "paypalOrderId": order_id}
+    finally:
+        order_notifier.unregister(order_id, waiter)
+
 
 @app.post("/api/webhooks/paypal")
 async def handle_paypal_webhook(
@@ -752,75 +911,35 @@ async def handle_paypal_webhook(
 ):
     """
     Handles incoming webhooks from PayPal.
-    This is the secure and reliable way to fulfill an order.
+    Verified events are written to the payment inbox and acknowledged straight away;
+    the inbox worker pool fulfils them with retries. A redelivered event ID is a no-op.
     """
     body = await request.body()
-    headers = request.headers
-    
-    # This part requires the paypalrestsdk, even if we use requests for other calls
+
+    # Signature is checked locally against the cached PayPal signing certificate
     try:
-        event = paypalrestsdk.WebhookEvent.verify(
-            body.decode('utf-8'),
-            headers,
-            PAYPAL_WEBHOOK_ID
-        )
+        event_json = await get_paypal_webhook_verifier().verify(request.headers, body)
+        event = PayPalWebhookRequest.model_validate(event_json)
     except Exception as e:
         logger.error(f"Webhook verification failed: {e}")
         raise HTTPException(status_code=400, detail="Webhook verification failed.")
 
-    logger.info(f"Received PayPal Webhook: event_type={event.event_type}")
+    logger.info(f"Received PayPal Webhook: event_type={event.event_type}, id={event.id}")
 
-    # Check if the payment is completed
-    if event.event_type == "CHECKOUT.ORDER.COMPLETED":
-        resource = event.resource
-        try:
-            # Extract user_id from the custom_id we set earlier
-            user_id = resource["purchase_units"][0]["custom_id"]
-            
-            # Use the verified data from the webhook to create the order
-            total_amount = float(resource["purchase_units"][0]["amount"]["value"])
-            shipping_info = resource.get("purchase_units", [{}])[0].get("shipping", {})
-            shipping_address = f"{shipping_info.get('name', {}).get('full_name', '')}, {shipping_info.get('address', {}).get('address_line_1', '')}, {shipping_info.get('address', {}).get('admin_area_2', '')}"
-            
-            # --- Database Transaction ---
-            cart_items_stmt = select(CartItem).where(CartItem.user_id == user_id)
-            cart_items_result = await session.exec(cart_items_stmt)
-            cart_items = cart_items_result.all()
-
-            if not cart_items:
-                logger.warning(f"Webhook for user {user_id} received, but cart is already empty. Order may have been processed already.")
-                return {"status": "success", "message": "Order already processed."}
-
-            new_order = Order(
-                payment_order_id=resource["id"],
-                user_id=user_id, 
-                shipping_address=shipping_address, 
-                total_amount=total_amount, 
-                status="completed"
-                )
-            session.add(new_order)
-            await session.flush()
-
-            for item_row in cart_items:
-                item = item_row[0]
-                session.add(OrderItem(order_id=new_order.id, product_id=item.product_id, quantity=item.quantity, price=item.price))
-                await session.delete(item)
-
-            await session.commit()
-            logger.info(f"Order {new_order.id} successfully created for user {user_id} via webhook.")
-            # TODO: Send order confirmation email here
-            # --- End Transaction ---
-
-        except Exception as e:
-            logger.error(f"Error processing webhook: {e}", exc_info=True)
-            # Return 200 to PayPal to stop retries, but log the error for investigation
-            return {"status": "error", "message": "Failed to process order internally."}
-            
-    return {"status": "success"}
+    # A failed insert returns 500 so PayPal redelivers the event
+    try:
+        inserted = await record_webhook_event(session, event_json)
+    except Exception as e:
+        logger.error(f"Failed to record PayPal webhook {event.id}: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Failed to record webhook event.")
+
+    if inserted:
+        payment_inbox.wake()
+        return {"status": "accepted"}
+    return {"status": "duplicate"}
 
 @app.get("/orders/{order_id}", response_model=OrderDetailsResponse)
-async def get_order_details(order_id: UUID, request: Request, session: AsyncSession = Depends(get_session)):
-    user_id = get_supabase_client_and_user(request)
+async def get_order_details(order_id: UUID, request: Request, user_id: str = Depends(get_current_user_id), session: AsyncSession = Depends(get_read_session)):
 
     # Fetch order and verify ownership
     order_stmt = select(Order).where(Order.id == order_id, Order.user_id == user_id)
@@ -852,6 +971,50 @@ async def get_order_details(order_id: UUID, request: Request, session: AsyncSess
         ]
     )
 
+# --- LIVE CATALOG EVENTS ---
+# Registered before the health routes; one stream per tab replaces polling /products/{slug} and /cart
+@app.get("/events/catalog")
+async def catalog_event_stream(
+    ids: Optional[str] = Query(None, description="Comma-separated product IDs to watch; all products when omitted"),
+):
+    """
+    Server-Sent Events stream of product changes applied by /webhook/sanity:
+    "product.updated" (price, stock or isFeatured changed; without "changes" when this
+    worker's catalog wasn't loaded to compare against, so refetch) and "product.deleted".
+    A client that falls too far behind gets a final "dropped" event and should
+    reconnect and refetch.
+    """
+    product_ids = set(_split_keys(ids)) or None
+    if product_ids and len(product_ids) > settings.BATCH_MAX_PRODUCTS:
+        raise HTTPException(status_code=400, detail=f"At most {settings.BATCH_MAX_PRODUCTS} ids per stream")
+    if catalog_events.at_capacity:
+        raise HTTPException(status_code=503, detail="Too many open event streams", headers={"Retry-After": "30"})
+    return EventSourceResponse(catalog_events.stream(product_ids), ping=settings.CATALOG_EVENTS_PING_SECONDS)
+
 @app.get("/health")
 async def health_check():
     return {"status": "healthy"}
+
+def _pool_snapshot() -> Dict[str, Dict[str, Any]]:
+    pools = {"primary": get_pool_metrics(async_engine)}
+    if read_engine is not async_engine:
+        pools["replica"] = get_pool_metrics(read_engine)
+    return pools
+
+register_pool_collector(_pool_snapshot)
+register_http_client_collector(http_clients.stats)
+
+@app.get("/health/db")
+async def database_pool_health():
+    """Connection pool occupancy and checkout wait times for the primary (and replica) engine."""
+    return {"status": "healthy", "pool": _pool_snapshot()}
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus scrape endpoint."""
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
+
+IMPORT_SECONDS = time.perf_counter() - _import_started
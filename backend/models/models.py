@@ -5,7 +5,7 @@ from generate_id import generate_base64_uuid
 from pydantic import BaseModel
 from typing import Dict
 from uuid import UUID, uuid4
-from sqlalchemy import Column, TIMESTAMP
+from sqlalchemy import Column, TIMESTAMP, JSON
 
 # Product Class for Supabase
 class Product(SQLModel, table=True):
@@ -61,7 +61,7 @@ class CartItem(SQLModel, table=True):
 
 class Order(SQLModel, table=True):
     id: UUID = Field(default_factory=uuid4, primary_key=True)
-    payment_order_id: Optional[str] = Field(default=None, index=True)  # NEW: link PayPal & DB
+    payment_order_id: Optional[str] = Field(default=None, unique=True)  # NEW: link PayPal & DB; one order per payment
     user_id: str
     shipping_address: str
     total_amount: float
@@ -78,6 +78,46 @@ class OrderItem(SQLModel, table=True):
     quantity: int
     price: float
 
+# Stored responses for client-supplied Idempotency-Key headers
+class IdempotencyRecord(SQLModel, table=True):
+    __tablename__ = "idempotency_key"
+    key: str = Field(primary_key=True, max_length=255)
+    user_id: str = Field(primary_key=True)
+    scope: str                                  # route the key was first used on, e.g. "checkout"
+    request_fingerprint: Optional[str] = Field(default=None, max_length=64)  # sha256 of method, path and body
+    status: str = Field(default="in_progress")  # in_progress | completed
+    response_status: Optional[int] = None
+    response_body: Optional[Dict[str, Any]] = Field(default=None, sa_column=Column(JSON))
+    created_at: datetime = Field(
+        default_factory=lambda: datetime.now(timezone.utc),
+        sa_column=Column(TIMESTAMP(timezone=True), nullable=False)
+    )
+    expires_at: datetime = Field(
+        sa_column=Column(TIMESTAMP(timezone=True), nullable=False, index=True)
+    )
+
+# Durable inbox of verified PayPal webhook deliveries, drained by the background worker pool
+class PaymentWebhookEvent(SQLModel, table=True):
+    __tablename__ = "payment_webhook_inbox"
+    id: str = Field(primary_key=True)           # PayPal event ID; duplicate deliveries collide here
+    event_type: str
+    payload: Dict[str, Any] = Field(sa_column=Column(JSON, nullable=False))
+    status: str = Field(default="pending")      # pending | done | failed
+    attempts: int = Field(default=0)
+    last_error: Optional[str] = None
+    next_attempt_at: datetime = Field(
+        default_factory=lambda: datetime.now(timezone.utc),
+        sa_column=Column(TIMESTAMP(timezone=True), nullable=False)
+    )
+    received_at: datetime = Field(
+        default_factory=lambda: datetime.now(timezone.utc),
+        sa_column=Column(TIMESTAMP(timezone=True), nullable=False)
+    )
+    processed_at: Optional[datetime] = Field(
+        default=None,
+        sa_column=Column(TIMESTAMP(timezone=True), nullable=True)
+    )
+
 #Pydantic API Response Models
 class OrderItemResponse(BaseModel):
     product_id: str
@@ -221,6 +261,43 @@ class ProductDisplayAPIModel(BaseModel):
         values['category'] = None
         return values
 
+class CategoryFacet(BaseModel):
+    slug: str
+    title: Optional[str] = None
+    count: int
+
+class PriceBucketFacet(BaseModel):
+    min: float
+    max: Optional[float] = None # None for the open-ended top bucket
+    count: int
+
+class StockFacet(BaseModel):
+    inStock: int
+    outOfStock: int
+
+class ProductFacetsResponse(BaseModel):
+    total: int # products matching every filter
+    categories: List[CategoryFacet]
+    priceBuckets: List[PriceBucketFacet]
+    stock: StockFacet
+
+class BatchMissingKeys(BaseModel):
+    ids: List[str] = []
+    slugs: List[str] = []
+
+class ProductBatchResponse(BaseModel):
+    products: List[ProductDisplayAPIModel] # in request order: ids first, then slugs
+    missing: BatchMissingKeys
+
+class PromoFeedItem(BaseModel):
+    id: Optional[str] = None
+    source: str # "sanity" or "supabase"
+    title: Optional[str] = None
+    description: Optional[str] = None
+    discount: Optional[Any] = None # text in Supabase, whatever the editor entered in Sanity
+    validUntil: Optional[str] = None # ISO date (or datetime, from Sanity); None = no end date
+    imageUrl: Optional[str] = None
+
 class PayPalWebhookRequest(BaseModel):
     id: str
     event_type: str
@@ -0,0 +1,113 @@
+"""
+Non-blocking structured logging.
+
+configure_logging() replaces the root handlers with a QueueHandler: the calling
+coroutine only renders the message and enqueues the record, and a QueueListener
+thread formats (JSON lines by default) and writes it to stdout. Every record carries
+the request correlation ID from observability.tracing.
+
+Per-request INFO/DEBUG logs are sampled: LOG_SAMPLE_RATE of requests keep them, chosen
+by request ID so a sampled request logs completely. Warnings and errors, and anything
+logged outside a request (startup, background workers), are always kept.
+"""
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import zlib
+from datetime import datetime, timezone
+from typing import Optional
+from config.settings import settings
+from observability.tracing import current_request_id
+
+# Loggers that log every call at INFO; only kept at DEBUG level
+NOISY_LOGGERS = ("httpx", "httpcore", "hpack")
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class RequestContextFilter(logging.Filter):
+    """Attaches the current request ID and drops unsampled per-request INFO/DEBUG records."""
+
+    def __init__(self, sample_rate: float):
+        super().__init__()
+        # Requests whose ID hashes below this bucket keep their low-level logs
+        self._threshold = int(max(0.0, min(sample_rate, 1.0)) * 10_000)
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        request_id = current_request_id()
+        record.request_id = request_id
+        if record.levelno >= logging.WARNING or request_id == "-" or self._threshold >= 10_000:
+            return True
+        return zlib.crc32(request_id.encode("utf-8")) % 10_000 < self._threshold
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "request_id": getattr(record, "request_id", "-"),
+            "msg": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Only render the message (and a traceback, which can't cross threads lazily);
+        # formatting and I/O happen on the listener thread
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def configure_logging() -> None:
+    """Installs the queue-based pipeline on the root logger. Safe to call more than once."""
+    global _listener
+    if _listener is not None:
+        return
+
+    if settings.LOG_FORMAT == "json":
+        formatter: logging.Formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter("%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s")
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(formatter)
+
+    log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    queue_handler = _QueueHandler(log_queue)
+    queue_handler.addFilter(RequestContextFilter(settings.LOG_SAMPLE_RATE))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(settings.LOG_LEVEL.upper())
+    if root.level > logging.DEBUG:
+        for name in NOISY_LOGGERS:
+            logging.getLogger(name).setLevel(logging.WARNING)
+
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging() -> None:
+    """Flushes queued records and stops the writer thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
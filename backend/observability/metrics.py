@@ -0,0 +1,295 @@
+"""
+Prometheus metrics for the API, served in the text exposition format on /metrics.
+
+- http_*: per-route request count, latency and in-flight requests (MetricsMiddleware)
+- upstream_request_duration_seconds: outbound calls by upstream and operation
+  (Sanity query kind, Supabase table call, PayPal endpoint, Clerk JWKS, DB statement)
+- cache_requests_total: hits and misses of the in-process caches
+- catalog_event_*: /events/catalog subscribers, published events and dropped slow consumers
+- admission_*: queue depth, in-flight requests and rejections per priority class
+  (services.admission)
+- db_pool_*: connection pool occupancy, collected when /metrics is scraped
+- http_client_*: outbound HTTP pool occupancy and connection reuse per upstream
+  (services.http_clients), collected when /metrics is scraped
+- scheduler_*: background job runs, durations and last success, and whether this
+  instance holds the scheduler leader lock (services.scheduler)
+"""
+import re
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Callable, Dict, Iterator, Tuple, Any
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+from prometheus_client.core import GaugeMetricFamily, CounterMetricFamily, REGISTRY
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+from starlette.routing import Match
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from observability.tracing import record_span
+
+HTTP_REQUESTS = Counter(
+    "http_requests_total", "HTTP requests by route and status.", ["method", "route", "status"]
+)
+HTTP_LATENCY = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route.", ["method", "route"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+)
+HTTP_IN_FLIGHT = Gauge(
+    "http_requests_in_flight", "HTTP requests currently being served, by route.", ["method", "route"]
+)
+UPSTREAM_LATENCY = Histogram(
+    "upstream_request_duration_seconds", "Outbound call latency by upstream and operation.",
+    ["upstream", "operation", "outcome"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+)
+CACHE_REQUESTS = Counter(
+    "cache_requests_total", "In-process cache lookups by cache and result (hit, miss, coalesced).",
+    ["cache", "result"]
+)
+
+ADMISSION_QUEUE_DEPTH = Gauge(
+    "admission_queue_depth", "Requests waiting for an admission slot, by priority class.", ["priority"]
+)
+ADMISSION_IN_FLIGHT = Gauge(
+    "admission_in_flight", "Requests holding an admission slot, by priority class.", ["priority"]
+)
+ADMISSION_REJECTIONS = Counter(
+    "admission_rejections_total", "Requests shed with 503, by priority class and reason (queue_full, timeout).",
+    ["priority", "reason"]
+)
+ADMISSION_WAIT = Histogram(
+    "admission_wait_seconds", "Time admitted requests spent queued, by priority class.", ["priority"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+
+CATALOG_EVENT_SUBSCRIBERS = Gauge(
+    "catalog_event_subscribers", "Open /events/catalog streams."
+)
+CATALOG_EVENTS_PUBLISHED = Counter(
+    "catalog_events_published_total", "Catalog change events published, by type.", ["type"]
+)
+CATALOG_EVENTS_DROPPED = Counter(
+    "catalog_event_subscribers_dropped_total", "Subscribers dropped because their buffer was full."
+)
+
+SCHEDULER_JOB_RUNS = Counter(
+    "scheduler_job_runs_total", "Background job runs by job and outcome (success, error, timeout).", ["job", "outcome"]
+)
+SCHEDULER_JOB_DURATION = Histogram(
+    "scheduler_job_duration_seconds", "Background job run time, by job.", ["job"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0),
+)
+SCHEDULER_JOB_LAST_SUCCESS = Gauge(
+    "scheduler_job_last_success_timestamp_seconds", "Unix time of the last successful run, by job.", ["job"]
+)
+SCHEDULER_LEADER = Gauge(
+    "scheduler_leader", "1 while this instance runs the leader-only background jobs."
+)
+
+UNMATCHED_ROUTE = "<unmatched>"
+
+
+@contextmanager
+def observe_upstream(upstream: str, operation: str) -> Iterator[None]:
+    """
+    Times the enclosed outbound call; an exception is recorded with outcome="error".
+    The call is also recorded as an "upstream" span of the current request.
+    """
+    started = time.perf_counter()
+    outcome = "ok"
+    try:
+        yield
+    except BaseException:
+        outcome = "error"
+        raise
+    finally:
+        duration = time.perf_counter() - started
+        UPSTREAM_LATENCY.labels(upstream, operation, outcome).observe(duration)
+        record_span(f"{upstream}.{operation}", "upstream", duration)
+
+
+def record_cache(cache: str, result: str) -> None:
+    CACHE_REQUESTS.labels(cache, result).inc()
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording per-route metrics. Routes are labelled by their path
+    template (e.g. /products/{slug}), never the raw path, so label cardinality stays
+    bounded by the number of routes.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        route = route_template(scope)
+        status = 500
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        in_flight = HTTP_IN_FLIGHT.labels(method, route)
+        in_flight.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_LATENCY.labels(method, route).observe(time.perf_counter() - started)
+            HTTP_REQUESTS.labels(method, route, str(status)).inc()
+            in_flight.dec()
+
+
+_route_cache: Dict[Tuple[str, str], str] = {}
+ROUTE_CACHE_MAX_ENTRIES = 4096
+
+
+def route_template(scope: Scope) -> str:
+    """Path template of the route an HTTP scope will be dispatched to (cached per method and path)."""
+    method, path = scope["method"], scope["path"]
+    cached = _route_cache.get((method, path))
+    if cached is not None:
+        return cached
+    template = UNMATCHED_ROUTE
+    partial = None
+    # The outermost app (FastAPI) is stored on the scope by Starlette
+    for route in scope["app"].router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            template = getattr(route, "path", UNMATCHED_ROUTE)
+            break
+        if match == Match.PARTIAL and partial is None:
+            partial = getattr(route, "path", UNMATCHED_ROUTE)
+    else:
+        if partial is not None:
+            template = partial  # path matched, method didn't (405)
+    if len(_route_cache) >= ROUTE_CACHE_MAX_ENTRIES:
+        _route_cache.clear()
+    _route_cache[(method, path)] = template
+    return template
+
+
+# --- Database statements ---
+_STATEMENT_TARGET = re.compile(
+    r"^\s*(?:WITH\b.*?\)\s*)?(SELECT|INSERT\s+INTO|UPDATE|DELETE\s+FROM)\b(?:.*?\bFROM\b)?\s+\"?(\w+)\"?",
+    re.IGNORECASE | re.DOTALL,
+)
+
+
+@lru_cache(maxsize=1024)
+def statement_label(statement: str) -> str:
+    """Short label for a SQL statement, e.g. "SELECT cartitem" or "INSERT order"."""
+    match = _STATEMENT_TARGET.match(statement)
+    if not match:
+        return statement.split(None, 1)[0].upper() if statement.strip() else "UNKNOWN"
+    verb = match.group(1).split()[0].upper()
+    return f"{verb} {match.group(2).lower()}"
+
+
+def instrument_engine(engine: AsyncEngine, name: str) -> None:
+    """
+    Records every statement executed on `engine` under upstream="db:<name>", and as a
+    "db" span (with the statement text for the slow-query log).
+    """
+    sync_engine = engine.sync_engine
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        duration = time.perf_counter() - conn.info["query_started"].pop()
+        label = statement_label(statement)
+        UPSTREAM_LATENCY.labels(f"db:{name}", label, "ok").observe(duration)
+        record_span(label, "db", duration, statement)
+
+    @event.listens_for(sync_engine, "handle_error")
+    def _error(exception_context):
+        conn = exception_context.connection
+        stack = conn.info.get("query_started") if conn is not None else None
+        if stack:
+            duration = time.perf_counter() - stack.pop()
+            label = statement_label(exception_context.statement or "")
+            UPSTREAM_LATENCY.labels(f"db:{name}", label, "error").observe(duration)
+            record_span(label, "db", duration, exception_context.statement)
+
+
+class PoolMetricsCollector:
+    """Exports connection pool metrics (see database.db.get_pool_metrics) at scrape time."""
+
+    def __init__(self, snapshot: Callable[[], Dict[str, Dict[str, Any]]]):
+        self._snapshot = snapshot
+
+    def collect(self):
+        gauges = {
+            "size": GaugeMetricFamily("db_pool_size", "Configured pool size.", labels=["engine"]),
+            "in_use": GaugeMetricFamily("db_pool_connections_in_use", "Connections checked out.", labels=["engine"]),
+            "checked_in": GaugeMetricFamily("db_pool_connections_idle", "Idle pooled connections.", labels=["engine"]),
+            "overflow": GaugeMetricFamily("db_pool_overflow", "Connections open beyond pool_size.", labels=["engine"]),
+            "checkout_wait_seconds_max": GaugeMetricFamily(
+                "db_pool_checkout_wait_seconds_max", "Longest checkout wait since start.", labels=["engine"]),
+        }
+        counters = {
+            "checkouts": CounterMetricFamily("db_pool_checkouts", "Pool checkouts.", labels=["engine"]),
+            "checkout_timeouts": CounterMetricFamily("db_pool_checkout_timeouts", "Checkouts that timed out.", labels=["engine"]),
+            "checkout_wait_seconds_total": CounterMetricFamily(
+                "db_pool_checkout_wait_seconds", "Total time spent waiting for a connection.", labels=["engine"]),
+        }
+        for engine_name, metrics in self._snapshot().items():
+            for key, family in {**gauges, **counters}.items():
+                if key in metrics:
+                    family.add_metric([engine_name], metrics[key])
+        yield from gauges.values()
+        yield from counters.values()
+
+
+def register_pool_collector(snapshot: Callable[[], Dict[str, Dict[str, Any]]]) -> None:
+    REGISTRY.register(PoolMetricsCollector(snapshot))
+
+
+class HttpClientMetricsCollector:
+    """Exports outbound HTTP pool metrics (see services.http_clients) at scrape time."""
+
+    def __init__(self, snapshot: Callable[[], Dict[str, Dict[str, int]]]):
+        self._snapshot = snapshot
+
+    def collect(self):
+        gauges = {
+            "connections": GaugeMetricFamily(
+                "http_client_connections", "Open pooled connections.", labels=["upstream"]),
+            "in_use": GaugeMetricFamily(
+                "http_client_connections_in_use", "Pooled connections serving a request.", labels=["upstream"]),
+            "http2": GaugeMetricFamily(
+                "http_client_connections_http2", "Pooled connections speaking HTTP/2.", labels=["upstream"]),
+        }
+        counters = {
+            "requests": CounterMetricFamily(
+                "http_client_requests", "Requests sent.", labels=["upstream"]),
+            "connections_opened": CounterMetricFamily(
+                "http_client_connections_opened", "New connections; requests minus these reused one.", labels=["upstream"]),
+            "tls_handshakes": CounterMetricFamily(
+                "http_client_tls_handshakes", "TLS handshakes on new connections.", labels=["upstream"]),
+        }
+        for upstream, stats in self._snapshot().items():
+            for key, family in {**gauges, **counters}.items():
+                family.add_metric([upstream], stats[key])
+        yield from gauges.values()
+        yield from counters.values()
+
+
+def register_http_client_collector(snapshot: Callable[[], Dict[str, Dict[str, int]]]) -> None:
+    REGISTRY.register(HttpClientMetricsCollector(snapshot))
+
+
+def render_metrics() -> Tuple[bytes, str]:
+    """Body and content type for the /metrics response."""
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
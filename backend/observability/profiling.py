@@ -0,0 +1,221 @@
+"""
+Opt-in sampling profiler for individual requests.
+
+A request is profiled when it carries `X-Profile-Token: <PROFILE_TOKEN>` or is picked
+by PROFILE_SAMPLE_RATE. A sampler thread then snapshots the request's asyncio task
+every PROFILE_INTERVAL_MS:
+
+- while the task runs on the event loop, the loop thread's real Python stack (so sync
+  work such as Pydantic transformation shows up), cut at the task's coroutine;
+- while it is suspended, the coroutine await chain, followed through awaited tasks and
+  asyncio.gather() children, ending in an "[await] <Future>" leaf for the pending I/O.
+
+The profile is written to PROFILE_OUTPUT_DIR as collapsed stacks (flamegraph.pl,
+speedscope, inferno) or a speedscope JSON file; the response's X-Profile-File header
+names it. When neither trigger is configured main.py doesn't install the middleware,
+so disabled overhead is zero.
+"""
+import asyncio
+import hmac
+import json
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from types import FrameType
+from typing import List, Optional, Tuple
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from config.settings import settings
+from observability.tracing import current_request_id
+
+logger = logging.getLogger("main")
+
+PROFILE_TOKEN_HEADER = b"x-profile-token"
+MAX_STACK_DEPTH = 128
+Stack = Tuple[str, ...]
+
+
+def profiling_enabled() -> bool:
+    return bool(settings.PROFILE_TOKEN) or settings.PROFILE_SAMPLE_RATE > 0
+
+
+def _frame_label(frame: FrameType) -> str:
+    code = frame.f_code
+    return f"{getattr(code, 'co_qualname', code.co_name)} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _coroutine_frames(coro) -> Tuple[List[FrameType], object]:
+    """Frames of a suspended coroutine chain, outermost first, and what the innermost awaits."""
+    frames: List[FrameType] = []
+    while coro is not None and len(frames) < MAX_STACK_DEPTH:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None) or getattr(coro, "ag_frame", None)
+        if frame is None:
+            break
+        frames.append(frame)
+        awaited = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None) or getattr(coro, "ag_await", None)
+        if awaited is None or not any(hasattr(awaited, a) for a in ("cr_frame", "gi_frame", "ag_frame")):
+            return frames, awaited
+        coro = awaited
+    return frames, None
+
+
+class TaskStackSampler:
+    """Samples one asyncio task's stack from a background thread."""
+
+    def __init__(self, task: asyncio.Task, loop: asyncio.AbstractEventLoop, interval: float):
+        self._task = task
+        self._loop = loop
+        self._loop_thread_id = threading.get_ident()
+        self._interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+        self.samples: Counter = Counter()
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+        self.elapsed = time.perf_counter() - self.started
+
+    def _run(self) -> None:
+        while not self._stop.wait(self._interval):
+            try:
+                for stack in self._sample_task(self._task, ()):
+                    self.samples[stack] += 1
+            except Exception:
+                # The loop thread mutates what we are reading; a torn sample is simply skipped
+                continue
+
+    def _sample_task(self, task: asyncio.Task, prefix: Stack) -> List[Stack]:
+        coro = task.get_coro()
+        if asyncio.current_task(self._loop) is task:
+            running = self._running_stack(coro)
+            if running is not None:
+                return [prefix + running]
+        frames, _ = _coroutine_frames(coro)
+        stack = prefix + tuple(_frame_label(f) for f in frames)
+        waiter = getattr(task, "_fut_waiter", None)
+        children = getattr(waiter, "_children", None)  # asyncio.gather()
+        if isinstance(waiter, asyncio.Task):
+            return self._sample_task(waiter, stack)
+        if children:
+            stacks: List[Stack] = []
+            for child in children:
+                if isinstance(child, asyncio.Task) and not child.done():
+                    stacks.extend(self._sample_task(child, stack))
+            return stacks or [stack + ("[await] gather",)]
+        leaf = f"[await] {type(waiter).__name__}" if waiter is not None else "[ready]"
+        return [stack + (leaf,)]
+
+    def _running_stack(self, coro) -> Optional[Stack]:
+        outer = getattr(coro, "cr_frame", None)
+        frame = sys._current_frames().get(self._loop_thread_id)
+        labels: List[str] = []
+        while frame is not None and len(labels) < MAX_STACK_DEPTH:
+            labels.append(_frame_label(frame))
+            if frame is outer:
+                return tuple(reversed(labels))
+            frame = frame.f_back
+        return None
+
+
+def write_collapsed(path: str, sampler: TaskStackSampler) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        for stack, count in sampler.samples.most_common():
+            f.write(";".join(stack).replace("\n", " ") + f" {count}\n")
+
+
+def write_speedscope(path: str, sampler: TaskStackSampler, name: str) -> None:
+    frame_index: dict = {}
+    frames, samples, weights = [], [], []
+    interval_ms = settings.PROFILE_INTERVAL_MS
+    for stack, count in sampler.samples.items():
+        indices = []
+        for label in stack:
+            if label not in frame_index:
+                frame_index[label] = len(frames)
+                frames.append({"name": label})
+            indices.append(frame_index[label])
+        samples.append(indices)
+        weights.append(count * interval_ms)
+    document = {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "shared": {"frames": frames},
+        "profiles": [{
+            "type": "sampled",
+            "name": name,
+            "unit": "milliseconds",
+            "startValue": 0,
+            "endValue": sum(weights),
+            "samples": samples,
+            "weights": weights,
+        }],
+        "name": name,
+        "exporter": "ai_mart request profiler",
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(document, f)
+
+
+class ProfilingMiddleware:
+    """ASGI middleware that profiles token-authenticated or randomly sampled requests."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self._active = 0
+        os.makedirs(settings.PROFILE_OUTPUT_DIR, exist_ok=True)
+
+    def _wants_profile(self, scope: Scope) -> bool:
+        if self._active >= settings.PROFILE_MAX_CONCURRENT:
+            return False
+        if settings.PROFILE_TOKEN:
+            for name, value in scope["headers"]:
+                if name == PROFILE_TOKEN_HEADER:
+                    return hmac.compare_digest(value, settings.PROFILE_TOKEN.encode("utf-8"))
+        return random.random() < settings.PROFILE_SAMPLE_RATE
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not self._wants_profile(scope):
+            await self.app(scope, receive, send)
+            return
+
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
+        slug = re.sub(r"[^A-Za-z0-9]+", "_", scope["path"]).strip("_")[:60] or "root"
+        extension = "speedscope.json" if settings.PROFILE_FORMAT == "speedscope" else "collapsed.txt"
+        filename = f"{stamp}-{scope['method']}-{slug}-{current_request_id()}.{extension}"
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [(b"x-profile-file", filename.encode("latin-1"))]
+            await send(message)
+
+        sampler = TaskStackSampler(asyncio.current_task(), asyncio.get_running_loop(), settings.PROFILE_INTERVAL_MS / 1000)
+        self._active += 1
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            sampler.stop()
+            self._active -= 1
+            path = os.path.join(settings.PROFILE_OUTPUT_DIR, filename)
+            name = f"{scope['method']} {scope['path']}"
+            try:
+                if settings.PROFILE_FORMAT == "speedscope":
+                    await asyncio.to_thread(write_speedscope, path, sampler, name)
+                else:
+                    await asyncio.to_thread(write_collapsed, path, sampler)
+                logger.info(
+                    f"Profiled {name} in {sampler.elapsed * 1000:.0f}ms "
+                    f"({sum(sampler.samples.values())} samples) -> {path}"
+                )
+            except OSError as e:
+                logger.warning(f"Could not write profile {path}: {e}")
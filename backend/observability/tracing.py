@@ -0,0 +1,179 @@
+"""
+Lightweight per-request tracing.
+
+TracingMiddleware gives every request a correlation ID (the caller's X-Request-ID
+when it looks sane, otherwise a fresh one), echoes it on the response and keeps it in
+a contextvar so logs and spans can be tied to the request. Spans are just (name, kind,
+duration) records collected on the request; outbound calls and SQL statements add
+theirs through observability.metrics. Anything slower than SLOW_QUERY_MS /
+SLOW_UPSTREAM_MS is logged with the statement or upstream operation, and requests
+slower than SLOW_REQUEST_MS are logged with their span breakdown; time in "wait" spans
+(deliberate idling, e.g. a long-poll) doesn't count towards that.
+"""
+import logging
+import re
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Tuple
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from config.settings import settings
+
+logger = logging.getLogger("main")
+
+REQUEST_ID_HEADER = "X-Request-ID"
+_VALID_REQUEST_ID = re.compile(r"^[A-Za-z0-9._:-]{1,128}$")
+MAX_SPANS_PER_REQUEST = 256
+MAX_LOGGED_STATEMENT_CHARS = 1000
+
+request_id_var: ContextVar[str] = ContextVar("request_id", default="-")
+
+
+class Span:
+    __slots__ = ("name", "kind", "duration", "detail")
+
+    def __init__(self, name: str, kind: str, duration: float, detail: Optional[str]):
+        self.name = name
+        self.kind = kind
+        self.duration = duration
+        self.detail = detail
+
+
+class RequestTrace:
+    """Spans recorded while serving one request (bounded; extra spans are only counted)."""
+
+    def __init__(self, request_id: str):
+        self.request_id = request_id
+        self.started = time.perf_counter()
+        self.spans: List[Span] = []
+        self.dropped = 0
+
+    def add(self, span: Span) -> None:
+        if len(self.spans) < MAX_SPANS_PER_REQUEST:
+            self.spans.append(span)
+        else:
+            self.dropped += 1
+
+    def totals_by_kind(self) -> Dict[str, Tuple[int, float]]:
+        totals: Dict[str, Tuple[int, float]] = {}
+        for span in self.spans:
+            count, seconds = totals.get(span.kind, (0, 0.0))
+            totals[span.kind] = (count + 1, seconds + span.duration)
+        return totals
+
+
+_trace_var: ContextVar[Optional[RequestTrace]] = ContextVar("request_trace", default=None)
+
+
+def current_request_id() -> str:
+    return request_id_var.get()
+
+
+def record_span(name: str, kind: str, duration: float, detail: Optional[str] = None) -> None:
+    """Adds a finished span to the current request and logs it when over the slow threshold."""
+    trace = _trace_var.get()
+    if trace is not None:
+        trace.add(Span(name, kind, duration, detail))
+
+    threshold_ms = settings.SLOW_QUERY_MS if kind == "db" else settings.SLOW_UPSTREAM_MS if kind == "upstream" else None
+    if threshold_ms is not None and duration * 1000 >= threshold_ms:
+        if kind == "db":
+            statement = (detail or name)[:MAX_LOGGED_STATEMENT_CHARS]
+            logger.warning(f"Slow query {duration * 1000:.0f}ms {name}: {statement}")
+        else:
+            logger.warning(f"Slow upstream call {duration * 1000:.0f}ms {name}")
+
+
+@contextmanager
+def span(name: str, kind: str = "app", detail: Optional[str] = None) -> Iterator[None]:
+    """Times the enclosed block as a span of the current request."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(name, kind, time.perf_counter() - started, detail)
+
+
+@contextmanager
+def correlation_id(value: str) -> Iterator[None]:
+    """Sets the correlation ID for work outside a request (e.g. background workers)."""
+    token = request_id_var.set(value)
+    try:
+        yield
+    finally:
+        request_id_var.reset(token)
+
+
+class TracingMiddleware:
+    """ASGI middleware: request correlation ID, span collection and the slow-request log."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = None
+        for name, value in scope["headers"]:
+            if name == b"x-request-id":
+                candidate = value.decode("latin-1")
+                if _VALID_REQUEST_ID.match(candidate):
+                    request_id = candidate
+                break
+        request_id = request_id or uuid.uuid4().hex
+
+        trace = RequestTrace(request_id)
+        id_token = request_id_var.set(request_id)
+        trace_token = _trace_var.set(trace)
+
+        streaming = False
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal streaming
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                # Event streams stay open by design; they aren't slow requests
+                streaming = any(
+                    name.lower() == b"content-type" and value.startswith(b"text/event-stream") for name, value in headers
+                )
+                headers.append((b"x-request-id", request_id.encode("latin-1")))
+                if settings.SERVER_TIMING_HEADER:
+                    headers.append((b"server-timing", _server_timing(trace).encode("latin-1")))
+                message["headers"] = headers
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - trace.started
+            if elapsed * 1000 >= settings.SLOW_REQUEST_MS and not streaming and (
+                (elapsed - trace.totals_by_kind().get("wait", (0, 0.0))[1]) * 1000 >= settings.SLOW_REQUEST_MS
+            ):
+                logger.warning(
+                    f"Slow request {elapsed * 1000:.0f}ms "
+                    f"{scope['method']} {scope['path']}: {_breakdown(trace, elapsed)}"
+                )
+            _trace_var.reset(trace_token)
+            request_id_var.reset(id_token)
+
+
+def _server_timing(trace: RequestTrace) -> str:
+    entries = [
+        f'{kind};dur={seconds * 1000:.1f};desc="{count} span(s)"'
+        for kind, (count, seconds) in trace.totals_by_kind().items()
+    ]
+    entries.append(f"total;dur={(time.perf_counter() - trace.started) * 1000:.1f}")
+    return ", ".join(entries)
+
+
+def _breakdown(trace: RequestTrace, elapsed: float) -> str:
+    """Per-kind totals plus the five slowest spans. Spans of concurrent calls can overlap."""
+    parts = [f"{kind}={seconds * 1000:.0f}ms/{count}" for kind, (count, seconds) in trace.totals_by_kind().items()]
+    slowest = sorted(trace.spans, key=lambda s: s.duration, reverse=True)[:5]
+    parts.extend(f"[{s.name} {s.duration * 1000:.0f}ms]" for s in slowest)
+    if trace.dropped:
+        parts.append(f"(+{trace.dropped} spans not recorded)")
+    return " ".join(parts) or "no spans"
@@ -0,0 +1,155 @@
+import asyncio
+import logging
+import time
+from typing import Dict, Optional
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+from config.settings import settings
+from observability.metrics import (
+    ADMISSION_IN_FLIGHT, ADMISSION_QUEUE_DEPTH, ADMISSION_REJECTIONS, ADMISSION_WAIT,
+    UNMATCHED_ROUTE, route_template,
+)
+from observability.tracing import record_span
+
+logger = logging.getLogger("main")
+
+# Routes are classified by (method, path template). GET/HEAD routes not listed are "read";
+# other unlisted methods are "write".
+PAYMENT_ROUTES = {
+    ("POST", "/checkout"),
+    ("POST", "/api/orders/create"),
+    ("POST", "/api/orders/{order_id}/capture"),
+}
+# Never queued or shed: health checks and scrapes must answer under load, webhook
+# senders retry on 503 anyway, so shedding them frees nothing, and event streams would
+# hold a slot for their whole lifetime (streams and long-polls have their own limits)
+EXEMPT_ROUTES = {
+    "/events/catalog",
+    "/api/orders/{order_id}/status",
+    "/health",
+    "/health/db",
+    "/metrics",
+    "/webhook/sanity",
+    "/webhook/sanity/debug",
+    "/api/webhooks/paypal",
+    UNMATCHED_ROUTE,
+}
+
+
+class PriorityClass:
+    """
+    A concurrency limit with a bounded wait queue. Requests beyond `concurrency` wait
+    up to `max_wait` seconds for a slot; when `queue_size` requests are already
+    waiting, further ones are rejected immediately.
+    """
+
+    def __init__(self, name: str, concurrency: int, queue_size: int, max_wait: float):
+        self.name = name
+        self._slots = asyncio.Semaphore(concurrency)
+        self._queue_size = queue_size
+        self._max_wait = max_wait
+        self._waiting = 0
+        self._queue_depth = ADMISSION_QUEUE_DEPTH.labels(name)
+        self._in_flight = ADMISSION_IN_FLIGHT.labels(name)
+
+    async def acquire(self) -> Optional[str]:
+        """Takes a slot; returns the rejection reason ("queue_full" or "timeout") instead when shed."""
+        if not self._slots.locked():
+            await self._slots.acquire()
+            self._admitted(0.0)
+            return None
+        if self._waiting >= self._queue_size:
+            return self._rejected("queue_full")
+
+        started = time.perf_counter()
+        self._waiting += 1
+        self._queue_depth.inc()
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self._max_wait)
+        except asyncio.TimeoutError:
+            return self._rejected("timeout")
+        finally:
+            self._waiting -= 1
+            self._queue_depth.dec()
+        self._admitted(time.perf_counter() - started)
+        return None
+
+    def release(self) -> None:
+        self._in_flight.dec()
+        self._slots.release()
+
+    def _admitted(self, waited: float) -> None:
+        self._in_flight.inc()
+        ADMISSION_WAIT.labels(self.name).observe(waited)
+        if waited:
+            record_span(f"admission.{self.name}", "queue", waited)
+
+    def _rejected(self, reason: str) -> str:
+        ADMISSION_REJECTIONS.labels(self.name, reason).inc()
+        return reason
+
+
+def build_priority_classes() -> Dict[str, PriorityClass]:
+    return {
+        "payment": PriorityClass(
+            "payment", settings.ADMISSION_PAYMENT_CONCURRENCY,
+            settings.ADMISSION_PAYMENT_QUEUE, settings.ADMISSION_PAYMENT_WAIT_SECONDS,
+        ),
+        "write": PriorityClass(
+            "write", settings.ADMISSION_WRITE_CONCURRENCY,
+            settings.ADMISSION_WRITE_QUEUE, settings.ADMISSION_WRITE_WAIT_SECONDS,
+        ),
+        "read": PriorityClass(
+            "read", settings.ADMISSION_READ_CONCURRENCY,
+            settings.ADMISSION_READ_QUEUE, settings.ADMISSION_READ_WAIT_SECONDS,
+        ),
+    }
+
+
+def classify(method: str, route: str) -> Optional[str]:
+    """Priority class of a request, or None when it bypasses admission control."""
+    if method == "OPTIONS" or route in EXEMPT_ROUTES:
+        return None
+    if (method, route) in PAYMENT_ROUTES:
+        return "payment"
+    if method in ("GET", "HEAD"):
+        return "read"
+    return "write"
+
+
+class AdmissionMiddleware:
+    """
+    ASGI middleware applying per-class admission control before the route runs (and so
+    before it takes a DB session or calls PayPal). Each class has its own slots, so a
+    saturated payment class queues and sheds on its own while catalog and cart reads
+    keep being served. Shed requests get 503 with Retry-After.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self._classes = build_priority_classes()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        class_name = classify(scope["method"], route_template(scope))
+        if class_name is None:
+            await self.app(scope, receive, send)
+            return
+
+        priority = self._classes[class_name]
+        rejection = await priority.acquire()
+        if rejection is not None:
+            logger.info(f"Shed {scope['method']} {scope['path']} ({class_name}: {rejection})")
+            response = JSONResponse(
+                {"detail": "Server is busy, please retry shortly."},
+                status_code=503,
+                headers={"Retry-After": str(settings.ADMISSION_RETRY_AFTER_SECONDS)},
+            )
+            await response(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            priority.release()
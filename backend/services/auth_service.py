@@ -0,0 +1,257 @@
+import asyncio
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+from fastapi import HTTPException, Request
+from jose import jwk, jwt as jose_jwt, JWTError
+from jose.backends.base import Key
+from config.settings import settings
+from observability.metrics import observe_upstream, record_cache
+from services.http_clients import http_clients
+
+logger = logging.getLogger("main")
+
+# Clerk session tokens are signed with Clerk's keys (JWKS); tokens from Clerk's "supabase"
+# JWT template, which the storefront sends for cart and checkout, with the Supabase JWT secret
+ALLOWED_ALGORITHMS = ["RS256"]
+SUPABASE_TEMPLATE_ALGORITHMS = ["HS256"]
+# Don't refetch the JWKS for unknown kids more often than this (bad tokens can't hammer Clerk)
+UNKNOWN_KID_REFETCH_SECONDS = 30.0
+
+
+class ClerkJWKSCache:
+    """
+    Clerk's signing keys, fetched once and kept as constructed key objects by `kid`.
+
+    A background task refreshes the set every `refresh_seconds` so key rotation is
+    picked up without a request waiting on it. A token signed with a kid we don't
+    know triggers one extra (single-flight, rate-limited) fetch.
+    """
+
+    def __init__(self, jwks_url: str, refresh_seconds: float):
+        self._jwks_url = jwks_url
+        self._refresh_seconds = refresh_seconds
+        self._keys: Dict[str, Key] = {}
+        self._fetched_at = 0.0
+        self._lock = asyncio.Lock()
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    async def get_key(self, kid: str) -> Optional[Key]:
+        key = self._keys.get(kid)
+        if key is not None:
+            return key
+        async with self._lock:
+            # Another request may have fetched while we waited
+            if kid not in self._keys and time.monotonic() - self._fetched_at >= UNKNOWN_KID_REFETCH_SECONDS:
+                await self._fetch()
+        return self._keys.get(kid)
+
+    async def _fetch(self) -> None:
+        with observe_upstream("clerk", "jwks"):
+            response = await http_clients.client("clerk").get(self._jwks_url)
+        response.raise_for_status()
+        keys: Dict[str, Key] = {}
+        for key_data in response.json().get("keys", []):
+            if key_data.get("kid") and key_data.get("kty") == "RSA":
+                keys[key_data["kid"]] = jwk.construct(key_data, algorithm=key_data.get("alg", "RS256"))
+        self._keys = keys
+        self._fetched_at = time.monotonic()
+        logger.info(f"Loaded {len(keys)} Clerk signing key(s).")
+
+    def start(self) -> None:
+        if self._refresh_task is None:
+            self._refresh_task = asyncio.create_task(self._refresh_loop(), name="clerk-jwks-refresh")
+
+    async def _refresh_loop(self) -> None:
+        while True:
+            try:
+                async with self._lock:
+                    await self._fetch()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Keep serving with the keys we already have
+                logger.warning(f"Refreshing Clerk JWKS failed: {e}")
+            await asyncio.sleep(self._refresh_seconds)
+
+    async def aclose(self) -> None:
+        if self._refresh_task:
+            self._refresh_task.cancel()
+            await asyncio.gather(self._refresh_task, return_exceptions=True)
+            self._refresh_task = None
+
+
+class VerifiedClaimsCache:
+    """Bounded LRU of verified claims keyed by SHA-256 of the token, each kept until its `exp`."""
+
+    def __init__(self, max_entries: int):
+        self._max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[Dict[str, Any], float]]" = OrderedDict()
+
+    @staticmethod
+    def token_hash(token: str) -> str:
+        return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+    def get(self, token_hash: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(token_hash)
+        if entry is None:
+            return None
+        claims, expires_at = entry
+        if expires_at <= time.time():
+            del self._entries[token_hash]
+            return None
+        self._entries.move_to_end(token_hash)
+        return claims
+
+    def put(self, token_hash: str, claims: Dict[str, Any]) -> None:
+        expires_at = claims.get("exp")
+        if not isinstance(expires_at, (int, float)):
+            return
+        self._entries[token_hash] = (claims, float(expires_at))
+        self._entries.move_to_end(token_hash)
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+
+
+class ClerkAuthenticator:
+    """
+    Verifies Clerk tokens: RS256 session tokens against Clerk's JWKS, HS256 "supabase"
+    template tokens with the Supabase JWT secret. A token whose verifier isn't configured
+    is rejected, unless `allow_unverified` (local development) lets its claims be read
+    unverified, as the app did before.
+    """
+
+    def __init__(
+        self,
+        jwks_url: Optional[str],
+        issuer: Optional[str],
+        supabase_jwt_secret: Optional[str],
+        allow_unverified: bool,
+        claims_cache_size: int,
+        refresh_seconds: float,
+    ):
+        self._issuer = issuer or None
+        self._jwks = ClerkJWKSCache(jwks_url, refresh_seconds) if jwks_url else None
+        self._supabase_jwt_secret = supabase_jwt_secret
+        self._allow_unverified = allow_unverified
+        self._claims = VerifiedClaimsCache(claims_cache_size)
+
+    @property
+    def verifies_signatures(self) -> bool:
+        return self._jwks is not None and self._supabase_jwt_secret is not None
+
+    def start(self) -> None:
+        if self._jwks:
+            self._jwks.start()
+        missing = [name for name, configured in (
+            ("CLERK_JWKS_URL/CLERK_ISSUER", self._jwks is not None),
+            ("SUPABASE_JWT_SECRET", self._supabase_jwt_secret is not None),
+        ) if not configured]
+        if not missing:
+            return
+        if self._allow_unverified:
+            logger.warning(f"{' and '.join(missing)} not set; those auth tokens are NOT signature-verified.")
+        else:
+            logger.error(f"{' and '.join(missing)} not set; auth tokens that need them are rejected.")
+
+    async def aclose(self) -> None:
+        if self._jwks:
+            await self._jwks.aclose()
+
+    def _unverified_claims(self, token: str, missing: str) -> Dict[str, Any]:
+        if not self._allow_unverified:
+            logger.error(f"Rejected an auth token: {missing} is not configured.")
+            raise HTTPException(status_code=401, detail="Invalid auth token")
+        try:
+            return jose_jwt.get_unverified_claims(token)
+        except JWTError:
+            raise HTTPException(status_code=401, detail="Invalid auth token")
+
+    async def verify(self, token: str) -> Dict[str, Any]:
+        """Returns the token's claims or raises HTTPException(401)."""
+        token_hash = VerifiedClaimsCache.token_hash(token)
+        claims = self._claims.get(token_hash)
+        if claims is not None:
+            record_cache("auth_claims", "hit")
+            return claims
+        record_cache("auth_claims", "miss")
+
+        try:
+            header = jose_jwt.get_unverified_header(token)
+        except JWTError:
+            raise HTTPException(status_code=401, detail="Invalid auth token")
+
+        algorithm = header.get("alg")
+        if algorithm in SUPABASE_TEMPLATE_ALGORITHMS:
+            if self._supabase_jwt_secret is None:
+                return self._unverified_claims(token, "SUPABASE_JWT_SECRET")
+            key, algorithms = self._supabase_jwt_secret, SUPABASE_TEMPLATE_ALGORITHMS
+        elif algorithm in ALLOWED_ALGORITHMS:
+            if self._jwks is None:
+                return self._unverified_claims(token, "CLERK_JWKS_URL/CLERK_ISSUER")
+            kid = header.get("kid")
+            try:
+                key = await self._jwks.get_key(kid) if kid else None
+            except Exception as e:
+                logger.error(f"Could not load Clerk JWKS: {e}")
+                raise HTTPException(status_code=503, detail="Authentication temporarily unavailable")
+            if key is None:
+                raise HTTPException(status_code=401, detail="Unknown token signing key")
+            algorithms = ALLOWED_ALGORITHMS
+        else:
+            raise HTTPException(status_code=401, detail="Invalid auth token")
+
+        try:
+            claims = jose_jwt.decode(
+                token,
+                key,
+                algorithms=algorithms,
+                issuer=self._issuer,
+                options={"verify_aud": False, "leeway": 5},
+            )
+        except JWTError as e:
+            logger.info(f"Rejected auth token: {e}")
+            raise HTTPException(status_code=401, detail="Invalid auth token")
+        self._claims.put(token_hash, claims)
+        return claims
+
+
+def _jwks_url() -> Optional[str]:
+    if settings.CLERK_JWKS_URL:
+        return settings.CLERK_JWKS_URL
+    if settings.CLERK_ISSUER:
+        return f"{settings.CLERK_ISSUER.rstrip('/')}/.well-known/jwks.json"
+    return None
+
+
+clerk_auth = ClerkAuthenticator(
+    jwks_url=_jwks_url(),
+    issuer=settings.CLERK_ISSUER,
+    supabase_jwt_secret=settings.SUPABASE_JWT_SECRET,
+    # Unverified claims are only accepted in local development
+    allow_unverified=settings.DB_ENGINE_PROFILE.lower() == "dev",
+    claims_cache_size=settings.AUTH_CLAIMS_CACHE_SIZE,
+    refresh_seconds=settings.CLERK_JWKS_REFRESH_SECONDS,
+)
+
+
+async def get_current_claims(request: Request) -> Dict[str, Any]:
+    """FastAPI dependency: verified claims of the Bearer token, memoized on request.state."""
+    claims = getattr(request.state, "auth_claims", None)
+    if claims is not None:
+        return claims
+    auth_header = request.headers.get("Authorization")
+    if not auth_header or not auth_header.startswith("Bearer "):
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    claims = await clerk_auth.verify(auth_header.split(" ", 1)[1].strip())
+    if not claims.get("sub"):
+        raise HTTPException(status_code=401, detail="Token missing sub claim")
+    request.state.auth_claims = claims
+    return claims
+
+
+async def get_current_user_id(request: Request) -> str:
+    """FastAPI dependency: the authenticated user's Clerk ID (`sub`)."""
+    return (await get_current_claims(request))["sub"]
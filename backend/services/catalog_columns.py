@@ -0,0 +1,116 @@
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+
+
+def _number(value: Any) -> float:
+    return float(value) if isinstance(value, (int, float)) and not isinstance(value, bool) else np.nan
+
+
+class CatalogColumns:
+    """
+    Columnar snapshot of the catalog (one NumPy array per field) for facet counts.
+    Filters become boolean masks and counts are bincounts over them, so a facet request
+    costs a few vectorized passes instead of a Python loop over every product.
+    """
+
+    def __init__(self, products: Sequence[Dict[str, Any]]):
+        self.category_slugs: List[str] = []
+        self.category_titles: List[Optional[str]] = []
+        codes: Dict[str, int] = {}
+        category_codes = np.full(len(products), -1, dtype=np.int32)
+        for row, product in enumerate(products):
+            category = product.get("category")
+            slug = category.get("slug") if isinstance(category, dict) else None
+            if not slug:
+                continue
+            code = codes.get(slug)
+            if code is None:
+                code = codes[slug] = len(self.category_slugs)
+                self.category_slugs.append(slug)
+                self.category_titles.append(category.get("title"))
+            category_codes[row] = code
+        self._category_index = codes
+        self.category_codes = category_codes
+        self.prices = np.fromiter((_number(p.get("price")) for p in products), dtype=np.float64, count=len(products))
+        stock = np.fromiter((_number(p.get("stock")) for p in products), dtype=np.float64, count=len(products))
+        self.in_stock = np.nan_to_num(stock, nan=0.0) > 0
+
+    @classmethod
+    def from_arrays(
+        cls,
+        categories: Sequence[Tuple[str, Optional[str]]],
+        category_codes: np.ndarray,
+        prices: np.ndarray,
+        in_stock: np.ndarray,
+    ) -> "CatalogColumns":
+        """Columns over existing arrays (e.g. views of a mapped snapshot), without copying them."""
+        columns = cls.__new__(cls)
+        columns.category_slugs = [slug for slug, _ in categories]
+        columns.category_titles = [title for _, title in categories]
+        columns._category_index = {slug: code for code, slug in enumerate(columns.category_slugs)}
+        columns.category_codes = category_codes
+        columns.prices = prices
+        columns.in_stock = in_stock
+        return columns
+
+    def __len__(self) -> int:
+        return len(self.prices)
+
+    def _category_mask(self, category_slug: Optional[str]) -> np.ndarray:
+        if not category_slug:
+            return np.ones(len(self), dtype=bool)
+        code = self._category_index.get(category_slug)
+        if code is None:
+            return np.zeros(len(self), dtype=bool)
+        return self.category_codes == code
+
+    def _price_mask(self, min_price: Optional[float], max_price: Optional[float]) -> np.ndarray:
+        mask = np.ones(len(self), dtype=bool)
+        # NaN (no price) compares False, so unpriced products drop out once a bound is set
+        if min_price is not None:
+            mask &= self.prices >= min_price
+        if max_price is not None:
+            mask &= self.prices <= max_price
+        return mask
+
+    def facets(
+        self,
+        category_slug: Optional[str],
+        min_price: Optional[float],
+        max_price: Optional[float],
+        price_edges: Sequence[float],
+    ) -> Dict[str, Any]:
+        """
+        Facet counts for a /products filter set. Each facet ignores its own filter (category
+        counts ignore `category_slug`, price buckets ignore the price bounds) so the sidebar
+        can show what picking another value would give; stock counts apply every filter.
+        `price_edges` are ascending bucket lower bounds; the last bucket is open-ended.
+        """
+        in_category = self._category_mask(category_slug)
+        in_price = self._price_mask(min_price, max_price)
+        selected = in_category & in_price
+
+        category_counts = np.bincount(
+            self.category_codes[in_price & (self.category_codes >= 0)], minlength=len(self.category_slugs)
+        )
+
+        edges = np.asarray(price_edges, dtype=np.float64)
+        priced = self.prices[in_category & ~np.isnan(self.prices)]
+        buckets = np.searchsorted(edges, priced, side="right") - 1
+        bucket_counts = np.bincount(buckets[buckets >= 0], minlength=len(edges))
+
+        in_stock = int(np.count_nonzero(self.in_stock & selected))
+        total = int(np.count_nonzero(selected))
+        return {
+            "total": total,
+            "categories": [
+                {"slug": slug, "title": title, "count": int(count)}
+                for slug, title, count in zip(self.category_slugs, self.category_titles, category_counts)
+                if count
+            ],
+            "priceBuckets": [
+                {"min": float(edges[i]), "max": float(edges[i + 1]) if i + 1 < len(edges) else None, "count": int(bucket_counts[i])}
+                for i in range(len(edges))
+            ],
+            "stock": {"inStock": in_stock, "outOfStock": total - in_stock},
+        }
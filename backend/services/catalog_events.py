@@ -0,0 +1,148 @@
+import asyncio
+import itertools
+import json
+import logging
+import time
+import uuid
+from typing import Any, AsyncIterator, Dict, Optional, Set
+from config.settings import settings
+from observability.metrics import CATALOG_EVENT_SUBSCRIBERS, CATALOG_EVENTS_DROPPED, CATALOG_EVENTS_PUBLISHED
+from services.pg_notify import PostgresNotifyChannel
+
+logger = logging.getLogger("main")
+
+# Fields whose changes are streamed; everything else in a product edit is ignored
+WATCHED_FIELDS = ("price", "stock", "isFeatured")
+NOTIFY_CHANNEL = "catalog_events"
+
+
+class CatalogSubscriber:
+    def __init__(self, product_ids: Optional[Set[str]], buffer_size: int):
+        self.product_ids = product_ids
+        self.queue: "asyncio.Queue[Optional[Dict[str, Any]]]" = asyncio.Queue(maxsize=buffer_size)
+
+    def wants(self, product_id: str) -> bool:
+        return self.product_ids is None or product_id in self.product_ids
+
+
+class CatalogEventBroker:
+    """
+    Fans out product changes applied by /webhook/sanity to /events/catalog subscribers.
+
+    Every subscriber has a bounded buffer. A subscriber whose buffer is full when an
+    event arrives is dropped: its buffer is replaced by a final "dropped" event and the
+    stream ends, so the client reconnects and refetches rather than slowing the others.
+
+    With the "postgres" backend each event is also NOTIFYed, and the other workers deliver
+    it to their own subscribers, so a stream sees every webhook whichever worker got it.
+    Event IDs are per process.
+    """
+
+    def __init__(self, buffer_size: int, max_subscribers: int, backend: str = "local", dsn: Optional[str] = None):
+        self._buffer_size = buffer_size
+        self._max_subscribers = max_subscribers
+        self._subscribers: Set[CatalogSubscriber] = set()
+        self._sequence = itertools.count(1)
+        # Tags this process's notifications so it doesn't deliver them a second time
+        self._origin = uuid.uuid4().hex
+        self._channel: Optional[PostgresNotifyChannel] = None
+        if backend == "postgres":
+            self._channel = PostgresNotifyChannel(dsn, NOTIFY_CHANNEL, self._on_payload, "CATALOG_EVENTS_NOTIFY_DSN")
+
+    def start(self) -> None:
+        if self._channel:
+            self._channel.start()
+
+    async def stop(self) -> None:
+        if self._channel:
+            await self._channel.stop()
+
+    @property
+    def at_capacity(self) -> bool:
+        return len(self._subscribers) >= self._max_subscribers
+
+    def subscribe(self, product_ids: Optional[Set[str]] = None) -> CatalogSubscriber:
+        subscriber = CatalogSubscriber(product_ids, self._buffer_size)
+        self._subscribers.add(subscriber)
+        CATALOG_EVENT_SUBSCRIBERS.set(len(self._subscribers))
+        return subscriber
+
+    def unsubscribe(self, subscriber: CatalogSubscriber) -> None:
+        self._subscribers.discard(subscriber)
+        CATALOG_EVENT_SUBSCRIBERS.set(len(self._subscribers))
+
+    def publish(self, event_type: str, product_id: str, data: Dict[str, Any]) -> None:
+        ts = time.time()
+        CATALOG_EVENTS_PUBLISHED.labels(event_type).inc()
+        if self._channel:
+            message = {"origin": self._origin, "type": event_type, "productId": product_id, "ts": ts, "data": data}
+            self._channel.send_soon(json.dumps(message))
+        self._deliver(event_type, product_id, ts, data)
+
+    def _on_payload(self, payload: str) -> None:
+        try:
+            message = json.loads(payload)
+            if message["origin"] != self._origin:
+                self._deliver(message["type"], message["productId"], message["ts"], message["data"])
+        except (ValueError, KeyError, TypeError):
+            logger.warning(f"Ignoring malformed catalog event: {payload[:200]}")
+
+    def _deliver(self, event_type: str, product_id: str, ts: float, data: Dict[str, Any]) -> None:
+        event = {"type": event_type, "id": next(self._sequence), "productId": product_id, "ts": ts, **data}
+        for subscriber in list(self._subscribers):
+            if not subscriber.wants(product_id):
+                continue
+            try:
+                subscriber.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                self._drop(subscriber)
+
+    def _drop(self, subscriber: CatalogSubscriber) -> None:
+        self.unsubscribe(subscriber)
+        CATALOG_EVENTS_DROPPED.inc()
+        while not subscriber.queue.empty():
+            subscriber.queue.get_nowait()
+        subscriber.queue.put_nowait(None)
+        logger.info("Dropped a slow /events/catalog subscriber.")
+
+    def publish_product_change(self, previous: Optional[Dict[str, Any]], current: Optional[Dict[str, Any]]) -> None:
+        """Publishes "product.updated" when a watched field of a product differs between the two versions."""
+        if current is None:
+            return
+        previous = previous or {}
+        changes = {field: current.get(field) for field in WATCHED_FIELDS if previous.get(field) != current.get(field)}
+        if changes:
+            self.publish("product.updated", current["_id"], {"slug": current.get("slug"), "changes": changes})
+
+    def publish_product_touched(self, product_id: str) -> None:
+        """
+        Publishes "product.updated" with the product ID only, for a change that can't be
+        diffed (the catalog holding the previous version isn't loaded); clients refetch it.
+        """
+        self.publish("product.updated", product_id, {})
+
+    def publish_product_deleted(self, product_id: str) -> None:
+        self.publish("product.deleted", product_id, {})
+
+    async def stream(self, product_ids: Optional[Set[str]] = None) -> AsyncIterator[Dict[str, Any]]:
+        """SSE messages for a new subscriber, until it disconnects or is dropped."""
+        # Subscribing here (not before the response starts) ties the subscription to the
+        # generator, whose cleanup runs however the stream ends
+        subscriber = self.subscribe(product_ids)
+        try:
+            while True:
+                event = await subscriber.queue.get()
+                if event is None:
+                    yield {"event": "dropped", "data": json.dumps({"reason": "slow consumer, reconnect and refetch"})}
+                    return
+                yield {"event": event["type"], "id": str(event["id"]), "data": json.dumps(event)}
+        finally:
+            self.unsubscribe(subscriber)
+
+
+catalog_events = CatalogEventBroker(
+    buffer_size=settings.CATALOG_EVENTS_BUFFER,
+    max_subscribers=settings.CATALOG_EVENTS_MAX_SUBSCRIBERS,
+    backend=settings.CATALOG_EVENTS_BACKEND,
+    dsn=settings.CATALOG_EVENTS_NOTIFY_DSN or settings.DIRECT_URL,
+)
@@ -0,0 +1,250 @@
+import asyncio
+import fcntl
+import json
+import mmap
+import os
+import struct
+import time
+from collections.abc import MutableMapping
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Iterator, List, NamedTuple, Optional, Sequence, Set
+import numpy as np
+from services.catalog_columns import CatalogColumns
+
+# File layout (little-endian). Every section starts on an 8-byte boundary, so the
+# numeric ones can be viewed in place as NumPy arrays.
+#
+#   header    magic, format, version, created_at (epoch seconds), product count, section count
+#   table     one (name, offset, length) entry per section
+#   sections  ids             JSON array of product _ids, in row order
+#             offsets         uint64[n + 1], start of each record within "records"
+#             records         the products, one compact JSON object each
+#             category_index  JSON array of [slug, title], indexed by category code
+#             category_codes  int32[n], -1 when the product has no category
+#             prices          float64[n], NaN when unpriced
+#             in_stock        uint8[n]
+#             content         optional JSON object stored alongside the catalog (the
+#                             warm-start snapshot keeps categories, content blocks and
+#                             homepage sections there)
+MAGIC = b"AMCATSNP"
+FORMAT = 1
+_HEADER = struct.Struct("<8sIQdII4x")
+_SECTION = struct.Struct("<16sQQ")
+_LOCK_POLL_SECONDS = 0.05
+
+
+class SnapshotHeader(NamedTuple):
+    version: int
+    created_at: float
+    count: int
+
+
+def _align(size: int) -> int:
+    return (size + 7) & ~7
+
+
+def _dumps(value: Any) -> bytes:
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False).encode()
+
+
+def write_snapshot(
+    path: str, products: Sequence[Dict[str, Any]], version: int, content: Optional[Dict[str, Any]] = None
+) -> None:
+    """
+    Writes `products` as a snapshot stamped `version`. The file is written next to `path`
+    and renamed over it, so readers see either the old snapshot or the new one; workers
+    that still map the old file keep a valid mapping until they switch.
+    """
+    columns = CatalogColumns(products)
+    records = [_dumps(product) for product in products]
+    offsets = np.zeros(len(records) + 1, dtype=np.uint64)
+    np.cumsum([len(record) for record in records], out=offsets[1:])
+    sections = [
+        ("ids", _dumps([product["_id"] for product in products])),
+        ("offsets", offsets.tobytes()),
+        ("records", b"".join(records)),
+        ("category_index", _dumps(list(zip(columns.category_slugs, columns.category_titles)))),
+        ("category_codes", columns.category_codes.tobytes()),
+        ("prices", columns.prices.tobytes()),
+        ("in_stock", columns.in_stock.astype(np.uint8).tobytes()),
+    ]
+    if content is not None:
+        sections.append(("content", _dumps(content)))
+
+    position = _align(_HEADER.size + _SECTION.size * len(sections))
+    table = []
+    for name, data in sections:
+        table.append(_SECTION.pack(name.encode(), position, len(data)))
+        position = _align(position + len(data))
+
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, FORMAT, version, time.time(), len(products), len(sections)))
+        f.write(b"".join(table))
+        for _, data in sections:
+            f.write(b"\0" * (_align(f.tell()) - f.tell()))
+            f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary, path)
+
+
+def read_snapshot_header(path: str) -> Optional[SnapshotHeader]:
+    """The header of the snapshot at `path`, or None when there is no (valid) snapshot."""
+    try:
+        with open(path, "rb") as f:
+            data = f.read(_HEADER.size)
+    except FileNotFoundError:
+        return None
+    if len(data) < _HEADER.size:
+        return None
+    magic, file_format, version, created_at, count, _ = _HEADER.unpack(data)
+    if magic != MAGIC or file_format != FORMAT:
+        return None
+    return SnapshotHeader(version, created_at, count)
+
+
+@asynccontextmanager
+async def snapshot_writer_lock(path: str) -> AsyncIterator[None]:
+    """
+    Exclusive lock (flock on "<path>.lock") held by the worker fetching or writing the
+    snapshot, so the others wait for its result instead of fetching too.
+    """
+    with open(f"{path}.lock", "a") as lock_file:
+        # Polled rather than blocking in a thread, so a cancelled waiter leaves nothing behind
+        while True:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                await asyncio.sleep(_LOCK_POLL_SECONDS)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class CatalogSnapshot:
+    """
+    A snapshot file mapped read-only. Columns are NumPy views of the mapping (no copy),
+    and product records are decoded only when asked for, so the catalog itself lives once
+    in the page cache however many workers map it.
+    """
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, file_format, version, created_at, count, section_count = _HEADER.unpack_from(self._mmap)
+        if magic != MAGIC or file_format != FORMAT:
+            raise ValueError(f"{path} is not a catalog snapshot (format {FORMAT})")
+        self.header = SnapshotHeader(version, created_at, count)
+        self._sections: Dict[str, tuple] = {}
+        for i in range(section_count):
+            name, offset, length = _SECTION.unpack_from(self._mmap, _HEADER.size + i * _SECTION.size)
+            self._sections[name.rstrip(b"\0").decode()] = (offset, length)
+        self.ids: List[str] = self._json("ids")
+        self._offsets = self._array("offsets", np.uint64)
+        self._records_start = self._sections["records"][0]
+
+    def __len__(self) -> int:
+        return self.header.count
+
+    def _json(self, name: str) -> Any:
+        offset, length = self._sections[name]
+        return json.loads(self._mmap[offset:offset + length])
+
+    def _array(self, name: str, dtype) -> np.ndarray:
+        offset, length = self._sections[name]
+        dtype = np.dtype(dtype)
+        return np.frombuffer(self._mmap, dtype=dtype, count=length // dtype.itemsize, offset=offset)
+
+    def record(self, row: int) -> Dict[str, Any]:
+        start = self._records_start + int(self._offsets[row])
+        end = self._records_start + int(self._offsets[row + 1])
+        return json.loads(self._mmap[start:end])
+
+    def content(self) -> Optional[Dict[str, Any]]:
+        return self._json("content") if "content" in self._sections else None
+
+    def columns(self) -> CatalogColumns:
+        return CatalogColumns.from_arrays(
+            [tuple(entry) for entry in self._json("category_index")],
+            self._array("category_codes", np.int32),
+            self._array("prices", np.float64),
+            self._array("in_stock", np.uint8).view(bool),
+        )
+
+
+class SnapshotProducts(MutableMapping):
+    """
+    The catalog as a mapping of `_id` to product, backed by a CatalogSnapshot. Changes
+    (from webhooks) go to an overlay on top of the snapshot until the next one is written.
+    """
+
+    def __init__(self, snapshot: CatalogSnapshot):
+        self.snapshot = snapshot
+        self._rows = {doc_id: row for row, doc_id in enumerate(snapshot.ids)}
+        self._overlay: Dict[str, Dict[str, Any]] = {}
+        self._deleted: Set[str] = set()
+
+    @property
+    def modified(self) -> bool:
+        """True once the mapping differs from its snapshot."""
+        return bool(self._overlay or self._deleted)
+
+    def copy(self) -> "SnapshotProducts":
+        products = SnapshotProducts.__new__(SnapshotProducts)
+        products.snapshot, products._rows = self.snapshot, self._rows
+        products._overlay, products._deleted = dict(self._overlay), set(self._deleted)
+        return products
+
+    def changes(self) -> Dict[str, Optional[Dict[str, Any]]]:
+        """The overlay: changed products by `_id`, None for deleted ones."""
+        return {**{doc_id: None for doc_id in self._deleted}, **self._overlay}
+
+    def rebased(self, snapshot: CatalogSnapshot, written: "SnapshotProducts") -> "SnapshotProducts":
+        """
+        This mapping on top of `snapshot`, which was written from `written` (an earlier
+        copy of this mapping): only the changes made since that copy stay in the overlay.
+        """
+        products = SnapshotProducts(snapshot)
+        for doc_id in self._overlay.keys() | self._deleted | written._overlay.keys() | written._deleted:
+            product = self._overlay.get(doc_id)
+            if product is not None:
+                if written._overlay.get(doc_id) is not product:
+                    products[doc_id] = product
+            elif doc_id not in self:
+                products.pop(doc_id, None)
+        return products
+
+    def __getitem__(self, doc_id: str) -> Dict[str, Any]:
+        product = self._overlay.get(doc_id)
+        if product is not None:
+            return product
+        if doc_id in self._deleted:
+            raise KeyError(doc_id)
+        return self.snapshot.record(self._rows[doc_id])
+
+    def __setitem__(self, doc_id: str, product: Dict[str, Any]) -> None:
+        self._overlay[doc_id] = product
+        self._deleted.discard(doc_id)
+
+    def __delitem__(self, doc_id: str) -> None:
+        if doc_id in self._overlay:
+            del self._overlay[doc_id]
+        elif doc_id not in self._rows or doc_id in self._deleted:
+            raise KeyError(doc_id)
+        if doc_id in self._rows:
+            self._deleted.add(doc_id)
+
+    def __contains__(self, doc_id: object) -> bool:
+        return doc_id in self._overlay or (doc_id in self._rows and doc_id not in self._deleted)
+
+    def __iter__(self) -> Iterator[str]:
+        for doc_id in self._rows:
+            if doc_id not in self._deleted and doc_id not in self._overlay:
+                yield doc_id
+        yield from self._overlay
+
+    def __len__(self) -> int:
+        return len(self._rows) - len(self._deleted) + sum(1 for doc_id in self._overlay if doc_id not in self._rows)
@@ -0,0 +1,489 @@
+import asyncio
+import heapq
+import logging
+import os
+import time
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Mapping, MutableMapping, NamedTuple, Optional
+from config.settings import settings
+from services.sanity_service import fetch_all_products
+from services.search_index import ProductSearchIndex, portable_text_to_plain
+
+if TYPE_CHECKING:
+    from services.catalog_columns import CatalogColumns
+
+logger = logging.getLogger("main")
+
+SORT_ORDERS = ("relevance", "newest", "price-asc", "price-desc", "name-asc", "name-desc")
+# After a refresh that got nothing new (Sanity down), wait this long before the next attempt
+REFRESH_RETRY_SECONDS = 30.0
+
+
+def _searchable_fields(product: Dict[str, Any]) -> Dict[str, str]:
+    category = product.get("category") or {}
+    sku = product.get("sku") or ""
+    return {
+        "name": product.get("name") or "",
+        # "AB-123" is found by "ab 123" as well as "ab123"
+        "sku": f"{sku} {''.join(c for c in sku if c.isalnum())}",
+        "category": category.get("title") or "",
+        "description": portable_text_to_plain(product.get("description")),
+    }
+
+
+class ProductSummary(NamedTuple):
+    """The fields /products/search filters and sorts on, kept apart from the full product."""
+    slug: Optional[str]
+    category: Optional[str]
+    price: Optional[float]
+    name: str
+    created_at: str
+
+
+class CatalogIndexes:
+    """
+    What queries need besides the products themselves: the search index, slug lookup,
+    known categories (by `_id`, for resolving webhook references) and a summary per
+    product, so searches filter and sort without touching (or decoding) full products.
+    """
+
+    def __init__(self):
+        self.search = ProductSearchIndex()
+        self.ids_by_slug: Dict[str, str] = {}
+        self.categories: Dict[str, Dict[str, Any]] = {}
+        self.summaries: Dict[str, ProductSummary] = {}
+
+    @classmethod
+    def build(cls, products: Mapping[str, Dict[str, Any]]) -> "CatalogIndexes":
+        indexes = cls()
+        for doc_id, product in products.items():
+            indexes.add(doc_id, product)
+        return indexes
+
+    def add(self, doc_id: str, product: Dict[str, Any]) -> None:
+        self.remove(doc_id)
+        category = product.get("category")
+        if not isinstance(category, dict):
+            category = {}
+        summary = ProductSummary(
+            slug=product.get("slug"),
+            category=category.get("slug"),
+            price=product.get("price"),
+            name=(product.get("name") or "").lower(),
+            created_at=product.get("_createdAt") or "",
+        )
+        self.summaries[doc_id] = summary
+        if summary.slug:
+            self.ids_by_slug[summary.slug] = doc_id
+        if category.get("_id"):
+            self.categories[category["_id"]] = category
+        self.search.add(doc_id, _searchable_fields(product))
+
+    def remove(self, doc_id: str) -> None:
+        summary = self.summaries.pop(doc_id, None)
+        if summary is None:
+            return
+        if summary.slug and self.ids_by_slug.get(summary.slug) == doc_id:
+            del self.ids_by_slug[summary.slug]
+        self.search.remove(doc_id)
+
+
+def _open_snapshot(path: str):
+    # Imported here: NumPy and fcntl are only needed with CATALOG_SNAPSHOT_PATH set
+    from services.catalog_snapshot import CatalogSnapshot, SnapshotProducts
+    products = SnapshotProducts(CatalogSnapshot(path))
+    return products, CatalogIndexes.build(products)
+
+
+class CatalogStore:
+    """
+    The product catalog held in memory, keyed by Sanity `_id`, with its search index.
+
+    Products have the shape fetch_all_products() returns (category expanded to
+    {_id, title, slug}). The catalog is loaded from Sanity on first use and rebuilt in
+    the background every CATALOG_REFRESH_SECONDS; in between, /webhook/sanity applies
+    product changes and deletions incrementally. Only published documents are held;
+    drafts are ignored like they are by the public GROQ queries.
+
+    With a `snapshot_path`, the workers on a host share one catalog: the products live in
+    a memory-mapped snapshot file (services/catalog_snapshot.py) instead of each worker's
+    heap. Whichever worker finds the snapshot missing or stale fetches from Sanity and
+    writes the next version while the others wait on its lock; webhook changes are
+    written through to a new version shortly after. Every worker checks the version
+    stamp at most every `snapshot_poll_seconds` and switches to a newer snapshot by
+    re-indexing it, without calling Sanity.
+
+    With a `persist_path`, every catalog fetched from Sanity is also saved there (with
+    the content services/warmup.py restores), and load_persisted() serves it after a
+    restart until the first refresh replaces it.
+    """
+
+    def __init__(
+        self,
+        refresh_seconds: float,
+        snapshot_path: Optional[str] = None,
+        snapshot_poll_seconds: float = 1.0,
+        snapshot_write_delay: float = 1.0,
+        persist_path: Optional[str] = None,
+    ):
+        self._refresh_seconds = refresh_seconds
+        self._products: MutableMapping[str, Dict[str, Any]] = {}
+        self._indexes = CatalogIndexes()
+        self._loaded_at: Optional[float] = None
+        # Monotonic time before which a stale catalog isn't refreshed again, after a failed refresh
+        self._retry_at = 0.0
+        self._lock = asyncio.Lock()
+        self._refresh_task: Optional[asyncio.Task] = None
+        # Changes that arrive while a rebuild is fetching; replayed onto the new catalog
+        self._pending: Optional[Dict[str, Optional[Dict[str, Any]]]] = None
+        # Bumped on every change; the columnar snapshot is rebuilt when it falls behind
+        self._version = 0
+        self._columns: Optional["CatalogColumns"] = None
+        self._columns_version = -1
+        self._columns_lock = asyncio.Lock()
+        # Shared snapshot: the version this worker serves and when it last looked for a newer one
+        self._snapshot_path = snapshot_path
+        self._snapshot_poll_seconds = snapshot_poll_seconds
+        self._snapshot_write_delay = snapshot_write_delay
+        self._snapshot_version = 0
+        self._snapshot_checked_at = 0.0
+        self._snapshot_write_task: Optional[asyncio.Task] = None
+        self._persist_path = persist_path
+        self._persist_task: Optional[asyncio.Task] = None
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded_at is not None
+
+    async def ensure_loaded(self) -> bool:
+        """Loads the catalog if it never was; schedules a background refresh when stale."""
+        if self._loaded_at is None:
+            async with self._lock:
+                if self._loaded_at is None:
+                    await self._rebuild()
+        elif (time.monotonic() - self._loaded_at >= self._refresh_seconds and time.monotonic() >= self._retry_at) \
+                or self._newer_snapshot_written():
+            if self._refresh_task is None or self._refresh_task.done():
+                self._refresh_task = asyncio.create_task(self._refresh(), name="catalog-refresh")
+        return self._loaded_at is not None
+
+    def _newer_snapshot_written(self) -> bool:
+        if not self._snapshot_path:
+            return False
+        now = time.monotonic()
+        if now - self._snapshot_checked_at < self._snapshot_poll_seconds:
+            return False
+        self._snapshot_checked_at = now
+        from services.catalog_snapshot import read_snapshot_header
+        header = read_snapshot_header(self._snapshot_path)
+        return header is not None and header.version > self._snapshot_version
+
+    async def _refresh(self) -> None:
+        async with self._lock:
+            try:
+                await self._rebuild()
+            except Exception as e:
+                self._retry_at = time.monotonic() + REFRESH_RETRY_SECONDS
+                logger.warning(f"Refreshing the catalog failed; serving the previous one: {e}")
+
+    async def _rebuild(self) -> None:
+        started = time.perf_counter()
+        # Unwritten changes of a shared catalog are carried over like ones arriving mid-rebuild
+        self._pending = self._products.changes() if hasattr(self._products, "changes") else {}
+        try:
+            if self._snapshot_path:
+                catalog = await self._load_shared()
+            else:
+                catalog = await self._fetch()
+            if catalog is None:
+                # Nothing newer to serve; back off instead of refetching on the next request
+                self._retry_at = time.monotonic() + REFRESH_RETRY_SECONDS
+                return
+            products, indexes = catalog
+            for doc_id, product in self._pending.items():
+                if product is None:
+                    products.pop(doc_id, None)
+                    indexes.remove(doc_id)
+                else:
+                    products[doc_id] = product
+                    indexes.add(doc_id, product)
+            self._products, self._indexes = products, indexes
+            self._version += 1
+            self._loaded_at = time.monotonic()
+            if self._snapshot_path:
+                snapshot = products.snapshot
+                self._snapshot_version = snapshot.header.version
+                # A snapshot written by another worker is as old as its creation, not its loading
+                self._loaded_at -= min(max(time.time() - snapshot.header.created_at, 0.0), self._refresh_seconds)
+                if self._pending:
+                    self._schedule_snapshot_write()
+            logger.info(f"Loaded {len(products)} products into the catalog in {time.perf_counter() - started:.2f}s.")
+        finally:
+            self._pending = None
+
+    async def _fetch(self):
+        raw_products = await fetch_all_products()
+        if not raw_products:
+            # fetch_all_products() returns [] on upstream errors; keep what we have
+            logger.warning("Catalog load returned no products; keeping the current catalog.")
+            return None
+        products = {p["_id"]: p for p in raw_products if p.get("_id") and not p["_id"].startswith("drafts.")}
+        self._schedule_persist(list(products.values()))
+        return products, await asyncio.to_thread(CatalogIndexes.build, products)
+
+    async def _load_shared(self):
+        """
+        The catalog from the newest snapshot. Sanity is only fetched (and a snapshot
+        written) when the snapshot is missing or older than CATALOG_REFRESH_SECONDS.
+        """
+        from services.catalog_snapshot import read_snapshot_header, snapshot_writer_lock, write_snapshot
+
+        def fresh(header) -> bool:
+            return header is not None and time.time() - header.created_at < self._refresh_seconds
+
+        header = read_snapshot_header(self._snapshot_path)
+        if not fresh(header):
+            async with snapshot_writer_lock(self._snapshot_path):
+                # Another worker may have written it while this one waited for the lock
+                header = read_snapshot_header(self._snapshot_path)
+                if not fresh(header):
+                    fetched = await self._fetch()
+                    if fetched is None:
+                        if header is None:
+                            return None
+                        logger.warning("Serving the stale catalog snapshot until Sanity answers.")
+                    else:
+                        version = max(header.version if header else 0, self._snapshot_version) + 1
+                        products = list(fetched[0].values())
+                        await asyncio.to_thread(write_snapshot, self._snapshot_path, products, version)
+                        logger.info(f"Wrote catalog snapshot version {version} to {self._snapshot_path}.")
+                        header = read_snapshot_header(self._snapshot_path)
+        if self._loaded_at is not None and header is not None and header.version == self._snapshot_version:
+            return None
+        return await asyncio.to_thread(_open_snapshot, self._snapshot_path)
+
+    async def load_persisted(self) -> Optional[Dict[str, Any]]:
+        """
+        Serves the catalog last saved to `persist_path`, marked stale so the first
+        ensure_loaded() refreshes it from Sanity in the background. Returns the content
+        saved with it, or None when there is no usable file.
+        """
+        if not self._persist_path or not os.path.exists(self._persist_path):
+            return None
+        try:
+            products, indexes = await asyncio.to_thread(_open_snapshot, self._persist_path)
+        except Exception as e:
+            logger.warning(f"Ignoring the persisted catalog at {self._persist_path}: {e}")
+            return None
+        async with self._lock:
+            if self._loaded_at is not None:
+                return products.snapshot.content()
+            self._products, self._indexes = products, indexes
+            self._version += 1
+            self._loaded_at = time.monotonic() - self._refresh_seconds
+        header = products.snapshot.header
+        logger.info(
+            f"Serving {len(products)} products from the persisted catalog "
+            f"(version {header.version}, saved {time.time() - header.created_at:.0f}s ago) until Sanity answers."
+        )
+        return products.snapshot.content() or {}
+
+    def _schedule_persist(self, products: List[Dict[str, Any]]) -> None:
+        if self._persist_path and (self._persist_task is None or self._persist_task.done()):
+            self._persist_task = asyncio.create_task(self._persist(products), name="catalog-persist")
+
+    async def _persist(self, products: List[Dict[str, Any]]) -> None:
+        from services.catalog_snapshot import read_snapshot_header, write_snapshot
+        from services.warmup import fetch_warm_start_content
+        try:
+            content = await fetch_warm_start_content(fresh=True)
+            if content is None:
+                # Keep the previous file rather than persist a catalog without its content
+                logger.warning("Not persisting the catalog: Sanity content is unavailable.")
+                return
+            header = await asyncio.to_thread(read_snapshot_header, self._persist_path)
+            version = (header.version if header else 0) + 1
+            await asyncio.to_thread(write_snapshot, self._persist_path, products, version, content)
+            logger.info(f"Persisted the catalog (version {version}) to {self._persist_path}.")
+        except Exception as e:
+            logger.warning(f"Persisting the catalog failed: {e}")
+
+    def _schedule_snapshot_write(self) -> None:
+        if self._snapshot_path and (self._snapshot_write_task is None or self._snapshot_write_task.done()):
+            self._snapshot_write_task = asyncio.create_task(self._write_through(), name="catalog-snapshot-write")
+
+    async def _write_through(self) -> None:
+        """Writes webhook changes to a new snapshot version, batching the changes of a burst."""
+        from services.catalog_snapshot import CatalogSnapshot, read_snapshot_header, snapshot_writer_lock, write_snapshot
+
+        while True:
+            await asyncio.sleep(self._snapshot_write_delay)
+            try:
+                async with self._lock, snapshot_writer_lock(self._snapshot_path):
+                    if not getattr(self._products, "modified", False):
+                        return
+                    written = self._products.copy()
+                    header = read_snapshot_header(self._snapshot_path)
+                    version = max(header.version if header else 0, self._snapshot_version) + 1
+                    await asyncio.to_thread(
+                        lambda: write_snapshot(self._snapshot_path, list(written.values()), version)
+                    )
+                    snapshot = await asyncio.to_thread(CatalogSnapshot, self._snapshot_path)
+                    self._products = self._products.rebased(snapshot, written)
+                    self._snapshot_version = version
+            except Exception as e:
+                logger.warning(f"Writing the catalog snapshot failed: {e}")
+                return
+
+    # --- Incremental updates (from /webhook/sanity) ---
+
+    def apply_document(self, document: Dict[str, Any]) -> None:
+        """Adds or replaces a product from a raw Sanity document (as posted by the webhook)."""
+        doc_id = document.get("_id")
+        if not doc_id or doc_id.startswith("drafts."):
+            return
+        product = self._product_from_document(document)
+        self._products[doc_id] = product
+        self._indexes.add(doc_id, product)
+        self._changed(doc_id, product)
+
+    def remove(self, doc_ids: Iterable[str]) -> None:
+        for doc_id in doc_ids:
+            self._products.pop(doc_id, None)
+            self._indexes.remove(doc_id)
+            self._changed(doc_id, None)
+
+    def _changed(self, doc_id: str, product: Optional[Dict[str, Any]]) -> None:
+        self._version += 1
+        if self._pending is not None:
+            self._pending[doc_id] = product
+        self._schedule_snapshot_write()
+
+    def _product_from_document(self, document: Dict[str, Any]) -> Dict[str, Any]:
+        # Start from what we had, so fields the webhook projection leaves out (image URL) survive
+        product = dict(self._products.get(document["_id"]) or {})
+        slug = document.get("slug")
+        product.update({
+            "_id": document["_id"],
+            "_createdAt": document.get("_createdAt", product.get("_createdAt")),
+            "name": document.get("name"),
+            "slug": slug.get("current") if isinstance(slug, dict) else slug,
+            "price": document.get("price"),
+            "description": document.get("description"),
+            "category": self._resolve_category(document.get("category")) or product.get("category"),
+            "stock": document.get("stock"),
+            "isFeatured": document.get("isFeatured", False),
+            "sku": document.get("sku"),
+        })
+        for field in ("imageUrl", "alt"):
+            if document.get(field) is not None:
+                product[field] = document[field]
+        return product
+
+    def _resolve_category(self, value: Any) -> Optional[Dict[str, Any]]:
+        """Category as {_id, title, slug}, from a reference, an expanded object or a bare title."""
+        if not value:
+            return None
+        known = self._indexes.categories
+        if isinstance(value, dict) and value.get("_ref"):
+            return known.get(value["_ref"])
+        title = value.get("title") if isinstance(value, dict) else value
+        for category in known.values():
+            if category.get("title") == title:
+                return category
+        slug = value.get("slug") if isinstance(value, dict) else None
+        return {
+            "_id": value.get("_id") if isinstance(value, dict) else None,
+            "title": title,
+            "slug": slug.get("current") if isinstance(slug, dict) else slug,
+        }
+
+    # --- Queries ---
+
+    async def columns(self) -> "CatalogColumns":
+        """Columnar snapshot of the current catalog, rebuilt (off the event loop) after changes."""
+        async with self._columns_lock:
+            if self._columns is None or self._columns_version != self._version:
+                # NumPy is imported here so it stays out of the app's import time
+                from services.catalog_columns import CatalogColumns
+                version, products = self._version, self._products
+                if self._snapshot_path and not getattr(products, "modified", True):
+                    # Views of the mapped snapshot: nothing to build or copy
+                    self._columns = products.snapshot.columns()
+                else:
+                    products = products.copy()
+                    self._columns = await asyncio.to_thread(lambda: CatalogColumns(list(products.values())))
+                self._columns_version = version
+            return self._columns
+
+    def get(self, doc_id: str) -> Optional[Dict[str, Any]]:
+        return self._products.get(doc_id)
+
+    def get_by_slug(self, slug: str) -> Optional[Dict[str, Any]]:
+        doc_id = self._indexes.ids_by_slug.get(slug)
+        return self._products.get(doc_id) if doc_id else None
+
+    def search(
+        self,
+        query: str,
+        category_slug: Optional[str] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        sort_order: str = "relevance",
+        limit: int = 20,
+    ) -> List[Dict[str, Any]]:
+        """Products matching `query` with the /products filters applied, best first (or by sort_order)."""
+        scores = self._indexes.search.search(query)
+        return self._select(scores, category_slug, min_price, max_price, sort_order, limit)
+
+    def browse(
+        self,
+        category_slug: Optional[str] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        sort_order: str = "newest",
+    ) -> List[Dict[str, Any]]:
+        """Every product passing the /products filters, in sort_order: fetch_all_products() served from memory."""
+        scores = dict.fromkeys(self._indexes.summaries, 0.0)
+        return self._select(scores, category_slug, min_price, max_price, sort_order, len(scores))
+
+    def _select(
+        self,
+        scores: Dict[str, float],
+        category_slug: Optional[str],
+        min_price: Optional[float],
+        max_price: Optional[float],
+        sort_order: str,
+        limit: int,
+    ) -> List[Dict[str, Any]]:
+        summaries = self._indexes.summaries
+        matches = []
+        for doc_id, score in scores.items():
+            summary = summaries.get(doc_id)
+            if summary is None:
+                continue
+            if category_slug and summary.category != category_slug:
+                continue
+            price = summary.price
+            if min_price is not None and (price is None or price < min_price):
+                continue
+            if max_price is not None and (price is None or price > max_price):
+                continue
+            matches.append((score, doc_id, summary))
+
+        if sort_order == "newest":
+            matches.sort(key=lambda m: m[2].created_at, reverse=True)
+        elif sort_order in ("price-asc", "price-desc"):
+            matches.sort(key=lambda m: m[2].price or 0.0, reverse=sort_order == "price-desc")
+        elif sort_order in ("name-asc", "name-desc"):
+            matches.sort(key=lambda m: m[2].name, reverse=sort_order == "name-desc")
+        else:
+            matches = heapq.nsmallest(limit, matches, key=lambda m: (-m[0], m[2].name))
+        return [self._products[doc_id] for _, doc_id, _ in matches[:limit]]
+
+catalog_store = CatalogStore(
+    refresh_seconds=settings.CATALOG_REFRESH_SECONDS,
+    snapshot_path=settings.CATALOG_SNAPSHOT_PATH,
+    snapshot_poll_seconds=settings.CATALOG_SNAPSHOT_POLL_SECONDS,
+    snapshot_write_delay=settings.CATALOG_SNAPSHOT_WRITE_DELAY_SECONDS,
+    persist_path=settings.CATALOG_WARM_START_PATH,
+)
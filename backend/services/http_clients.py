@@ -0,0 +1,134 @@
+import logging
+from typing import Any, Dict, NamedTuple, Optional, Tuple
+import httpx
+from config.settings import settings
+
+logger = logging.getLogger("main")
+
+
+class UpstreamPool(NamedTuple):
+    """Connection pool and timeout settings for one upstream."""
+    max_connections: int
+    max_keepalive_connections: int
+    keepalive_expiry: float
+    connect_timeout: float
+    read_timeout: float
+    write_timeout: float
+    # Longest wait for a free connection when all max_connections are busy
+    pool_timeout: float
+
+
+# HTTP/2 is negotiated over TLS (ALPN) where the upstream offers it; plain-http stand-ins
+# and HTTP/1.1-only hosts get HTTP/1.1. Read timeouts cover the slowest normal response:
+# a full catalog GROQ query for Sanity, a capture for PayPal.
+UPSTREAMS: Dict[str, UpstreamPool] = {
+    "sanity": UpstreamPool(20, 10, 60.0, connect_timeout=3.0, read_timeout=15.0, write_timeout=5.0, pool_timeout=2.0),
+    "sanity_cdn": UpstreamPool(20, 10, 60.0, connect_timeout=3.0, read_timeout=10.0, write_timeout=5.0, pool_timeout=2.0),
+    "paypal": UpstreamPool(20, 10, 60.0, connect_timeout=5.0, read_timeout=15.0, write_timeout=5.0, pool_timeout=5.0),
+    "supabase": UpstreamPool(20, 10, 60.0, connect_timeout=3.0, read_timeout=10.0, write_timeout=5.0, pool_timeout=2.0),
+    "clerk": UpstreamPool(4, 2, 60.0, connect_timeout=3.0, read_timeout=10.0, write_timeout=5.0, pool_timeout=2.0),
+}
+
+
+class InstrumentedTransport(httpx.AsyncHTTPTransport):
+    """
+    Connection pool of one upstream. Counts requests and newly opened connections
+    (through httpcore's trace extension), so requests - connections_opened is the number
+    of requests that reused a pooled connection.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.requests = 0
+        self.connections_opened = 0
+        self.tls_handshakes = 0
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self.requests += 1
+        outer_trace = request.extensions.get("trace")
+
+        async def trace(event_name: str, info: Dict[str, Any]) -> None:
+            if event_name == "connection.connect_tcp.complete":
+                self.connections_opened += 1
+            elif event_name == "connection.start_tls.complete":
+                self.tls_handshakes += 1
+            if outer_trace is not None:
+                await outer_trace(event_name, info)
+
+        request.extensions = {**request.extensions, "trace": trace}
+        return await super().handle_async_request(request)
+
+    def stats(self) -> Dict[str, int]:
+        connections = self._pool.connections
+        return {
+            "connections": len(connections),
+            "in_use": sum(1 for connection in connections if not connection.is_idle()),
+            "http2": sum(1 for connection in connections if connection.info().startswith("HTTP/2")),
+            "requests": self.requests,
+            "connections_opened": self.connections_opened,
+            "tls_handshakes": self.tls_handshakes,
+        }
+
+
+class HttpClientRegistry:
+    """
+    The outbound HTTP clients of the process, one connection pool per upstream (see
+    UPSTREAMS). Clients are created on first use; several clients of one upstream (e.g.
+    Supabase's anon and service-role clients, which differ in headers) share its pool.
+    lifespan closes every pool on shutdown.
+    """
+
+    def __init__(self, upstreams: Dict[str, UpstreamPool], http2: bool):
+        self._upstreams = upstreams
+        self._http2 = http2
+        self._transports: Dict[str, InstrumentedTransport] = {}
+        self._clients: Dict[Tuple[str, str], httpx.AsyncClient] = {}
+
+    def _transport(self, upstream: str) -> InstrumentedTransport:
+        transport = self._transports.get(upstream)
+        if transport is None:
+            pool = self._upstreams[upstream]
+            transport = self._transports[upstream] = InstrumentedTransport(
+                http2=self._http2,
+                limits=httpx.Limits(
+                    max_connections=pool.max_connections,
+                    max_keepalive_connections=pool.max_keepalive_connections,
+                    keepalive_expiry=pool.keepalive_expiry,
+                ),
+            )
+        return transport
+
+    def client(self, upstream: str, name: str = "default", **options) -> httpx.AsyncClient:
+        """
+        The client `name` of `upstream`, created with `options` (base_url, headers, ...)
+        on first use; later calls return the same client and ignore `options`.
+        """
+        key = (upstream, name)
+        client = self._clients.get(key)
+        if client is None:
+            pool = self._upstreams[upstream]
+            client = self._clients[key] = httpx.AsyncClient(
+                transport=self._transport(upstream),
+                timeout=httpx.Timeout(
+                    connect=pool.connect_timeout, read=pool.read_timeout,
+                    write=pool.write_timeout, pool=pool.pool_timeout,
+                ),
+                **options,
+            )
+        return client
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """Pool occupancy and reuse counters per upstream, for /metrics."""
+        return {upstream: transport.stats() for upstream, transport in self._transports.items()}
+
+    async def aclose(self) -> None:
+        # Clients hold no connections of their own; closing the pools closes them all
+        transports, self._transports, self._clients = self._transports, {}, {}
+        for upstream, transport in transports.items():
+            try:
+                await transport.aclose()
+            except Exception as e:
+                logger.warning(f"Closing the {upstream} HTTP pool failed: {e}")
+
+
+http_clients = HttpClientRegistry(UPSTREAMS, http2=settings.HTTP_CLIENT_HTTP2)
@@ -0,0 +1,180 @@
+import hashlib
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Dict, Any
+from fastapi import HTTPException, Request
+from fastapi.responses import JSONResponse
+from sqlalchemy import select, delete, update
+from sqlmodel.ext.asyncio.session import AsyncSession
+from config.settings import settings
+from database.db import dialect_insert
+from models.models import IdempotencyRecord
+
+logger = logging.getLogger("main")
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+MAX_KEY_LENGTH = 255
+
+
+class IdempotentRequest:
+    """
+    Async context manager guarding a handler with a client-supplied Idempotency-Key.
+
+    On enter, a replayed key exposes the stored response as `replay` (or raises 409
+    while the first request is still running, or 422 when it was used with another
+    method, path or body); a fresh key is reserved with an `in_progress` row. The handler finishes with `await complete(body)`, which commits
+    its writes together with the stored response; if it raises or returns without
+    completing, the reservation is released so the client can retry. A reservation
+    older than IDEMPOTENCY_LEASE_SECONDS belongs to a worker that died mid-request
+    (nothing it wrote was committed) and is taken over. Requests without a key pass
+    straight through.
+    """
+
+    def __init__(self, session: AsyncSession, key: Optional[str], user_id: str, scope: str, request: Request):
+        self.session = session
+        self.key = key.strip() if key else None
+        self.user_id = user_id
+        self.scope = scope
+        self.request = request
+        self.fingerprint: Optional[str] = None
+        self.replay: Optional[JSONResponse] = None
+        self._reserved = False
+        self._completed = False
+
+    async def __aenter__(self) -> "IdempotentRequest":
+        if not self.key:
+            return self
+        if len(self.key) > MAX_KEY_LENGTH:
+            raise HTTPException(status_code=400, detail=f"{IDEMPOTENCY_HEADER} must be at most {MAX_KEY_LENGTH} characters")
+        self.fingerprint = await request_fingerprint(self.request)
+
+        now = datetime.now(timezone.utc)
+        record = await self._load()
+        if record and _as_utc(record.expires_at) <= now:
+            await self.session.execute(
+                delete(IdempotencyRecord).where(
+                    (IdempotencyRecord.key == self.key) & (IdempotencyRecord.user_id == self.user_id)
+                )
+            )
+            record = None
+
+        if record is None:
+            statement = dialect_insert(IdempotencyRecord).values(
+                key=self.key,
+                user_id=self.user_id,
+                scope=self.scope,
+                request_fingerprint=self.fingerprint,
+                status="in_progress",
+                created_at=now,
+                expires_at=now + timedelta(seconds=settings.IDEMPOTENCY_TTL_SECONDS),
+            ).on_conflict_do_nothing(index_elements=["key", "user_id"])
+            result = await self.session.execute(statement)
+            await self.session.commit()
+            if result.rowcount == 1:
+                self._reserved = True
+                return self
+            # Lost the race to a concurrent request carrying the same key
+            record = await self._load()
+        elif record.status == "in_progress" and self._matches(record) \
+                and _as_utc(record.created_at) <= now - timedelta(seconds=settings.IDEMPOTENCY_LEASE_SECONDS):
+            # The created_at condition makes the takeover a compare-and-set between reclaimers
+            result = await self.session.execute(
+                update(IdempotencyRecord)
+                .where(
+                    (IdempotencyRecord.key == self.key) & (IdempotencyRecord.user_id == self.user_id)
+                    & (IdempotencyRecord.status == "in_progress")
+                    & (IdempotencyRecord.created_at <= now - timedelta(seconds=settings.IDEMPOTENCY_LEASE_SECONDS))
+                )
+                .values(created_at=now, expires_at=now + timedelta(seconds=settings.IDEMPOTENCY_TTL_SECONDS))
+                .execution_options(synchronize_session=False)
+            )
+            await self.session.commit()
+            if result.rowcount == 1:
+                logger.warning(f"Reclaimed a stale idempotency reservation for scope={self.scope}.")
+                self._reserved = True
+                return self
+            record = await self._load()
+
+        self.replay = self._replay_response(record)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        if self._reserved and not self._completed:
+            await self.session.rollback()
+            await self.session.execute(
+                delete(IdempotencyRecord).where(
+                    (IdempotencyRecord.key == self.key) & (IdempotencyRecord.user_id == self.user_id)
+                )
+            )
+            await self.session.commit()
+            logger.info(f"Released idempotency key for scope={self.scope} after unfinished request.")
+
+    async def complete(self, body: Dict[str, Any], status_code: int = 200) -> Dict[str, Any]:
+        """
+        Stores the handler's JSON response against the key and commits the session, so
+        the handler's uncommitted writes and the stored response land in one transaction.
+        Returns `body` unchanged.
+        """
+        if self._reserved:
+            await self.session.execute(
+                update(IdempotencyRecord)
+                .where((IdempotencyRecord.key == self.key) & (IdempotencyRecord.user_id == self.user_id))
+                .values(status="completed", response_status=status_code, response_body=_jsonable(body))
+            )
+        await self.session.commit()
+        self._completed = True
+        return body
+
+    async def _load(self) -> Optional[IdempotencyRecord]:
+        result = await self.session.execute(
+            select(IdempotencyRecord).where(
+                (IdempotencyRecord.key == self.key) & (IdempotencyRecord.user_id == self.user_id)
+            )
+        )
+        return result.scalar_one_or_none()
+
+    def _matches(self, record: IdempotencyRecord) -> bool:
+        # Records stored before fingerprints were kept have none; their scope has to do
+        return record.scope == self.scope and record.request_fingerprint in (None, self.fingerprint)
+
+    def _replay_response(self, record: Optional[IdempotencyRecord]) -> JSONResponse:
+        if record is not None and not self._matches(record):
+            raise HTTPException(status_code=422, detail="Idempotency-Key was already used for a different request")
+        if record is None or record.status != "completed":
+            raise HTTPException(
+                status_code=409,
+                detail="A request with this Idempotency-Key is already in progress",
+                headers={"Retry-After": "1"},
+            )
+        logger.info(f"Replaying stored response for idempotency key on scope={self.scope}")
+        return JSONResponse(
+            status_code=record.response_status or 200,
+            content=record.response_body,
+            headers={"Idempotent-Replayed": "true"},
+        )
+
+
+async def request_fingerprint(request: Request) -> str:
+    """sha256 of the request's method, path and body: what a reused key must match."""
+    digest = hashlib.sha256(f"{request.method} {request.url.path}\n".encode("utf-8"))
+    digest.update(await request.body())
+    return digest.hexdigest()
+
+
+def _as_utc(value: datetime) -> datetime:
+    # SQLite hands timestamps back without tzinfo; they were stored as UTC
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+def _jsonable(body: Dict[str, Any]) -> Dict[str, Any]:
+    # UUID order ids and similar values must be stored as plain JSON
+    return {k: str(v) if not isinstance(v, (str, int, float, bool, type(None), dict, list)) else v for k, v in body.items()}
+
+
+async def purge_expired_idempotency_keys(session: AsyncSession) -> int:
+    """Deletes idempotency records whose replay window has passed."""
+    result = await session.execute(
+        delete(IdempotencyRecord).where(IdempotencyRecord.expires_at <= datetime.now(timezone.utc))
+    )
+    await session.commit()
+    return result.rowcount or 0
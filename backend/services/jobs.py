@@ -0,0 +1,153 @@
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Sequence
+from sqlalchemy.engine import make_url
+from config.settings import settings
+from database.db import AsyncSessionLocal, get_supabase_admin
+from observability.metrics import observe_upstream
+from services.idempotency_service import purge_expired_idempotency_keys
+from services.promo_feed import promo_feed
+from services.sanity_service import (
+    fetch_all_products, fetch_categories, fetch_content_blocks, fetch_featured_products, seed_sanity_cache,
+)
+from services.scheduler import AdvisoryLockLeader, CronSchedule, Job, Scheduler
+
+logger = logging.getLogger("main")
+
+# pg_try_advisory_lock key shared by every instance ("ai-mart" in ASCII)
+SCHEDULER_LOCK_KEY = 0x61692D6D617274
+# Rows per PostgREST request when reading and writing the product mirror
+RECONCILE_BATCH_SIZE = 500
+# Columns the Sanity webhook mirrors into Supabase's product table
+PRODUCT_COLUMNS = ("id", "name", "slug", "description", "price", "category", "imageUrl", "alt", "stock", "isFeatured", "sku")
+
+
+async def warm_caches() -> None:
+    """
+    Refetches the landing-page queries and replaces their cached results before they
+    expire, so no storefront request waits on Sanity for them. Entries are seeded for the
+    TTL plus the jitter, covering the gap until the next run.
+    """
+    if settings.SANITY_CACHE_TTL_SECONDS <= 0:
+        return
+    fetchers = (fetch_featured_products, fetch_categories, fetch_content_blocks)
+    results = await asyncio.gather(*(fetcher.__wrapped__() for fetcher in fetchers))
+    failed = []
+    for fetcher, result in zip(fetchers, results):
+        if result:
+            seed_sanity_cache(fetcher, (), result, settings.SANITY_CACHE_TTL_SECONDS + settings.SCHEDULER_JITTER_SECONDS)
+        else:
+            failed.append(fetcher.__name__)
+    if failed:
+        # What is cached stays until its TTL runs out
+        raise RuntimeError(f"Sanity returned nothing for {', '.join(failed)}")
+
+
+async def expire_promos() -> None:
+    """Deactivates dynamic promos whose valid_until date has passed."""
+    today = datetime.now(timezone.utc).date().isoformat()
+    with observe_upstream("supabase", "dynamic_promo.update"):
+        result = await get_supabase_admin().table("dynamic_promo").update({"is_active": False}) \
+            .eq("is_active", True).lt("valid_until", today).execute()
+    if result.data:
+        promo_feed.invalidate()
+        logger.info(f"Deactivated {len(result.data)} expired promos.")
+
+
+async def purge_idempotency_keys() -> None:
+    """Deletes Idempotency-Key records whose replay window has passed."""
+    async with AsyncSessionLocal() as session:
+        deleted = await purge_expired_idempotency_keys(session)
+    if deleted:
+        logger.info(f"Purged {deleted} expired idempotency keys.")
+
+
+def _product_row(product: Dict[str, Any]) -> Dict[str, Any]:
+    """Supabase product row for a product as returned by fetch_all_products(), as the webhook writes it."""
+    category = product.get("category")
+    return {
+        "id": product["_id"],
+        "name": product.get("name"),
+        "slug": product.get("slug"),
+        "description": product.get("description"),
+        "price": product.get("price"),
+        "category": category.get("title") if isinstance(category, dict) else category,
+        "imageUrl": product.get("imageUrl"),
+        "alt": product.get("alt"),
+        "stock": product.get("stock"),
+        "isFeatured": product.get("isFeatured"),
+        "sku": product.get("sku"),
+    }
+
+
+def _batches(items: Sequence[Any]) -> List[Sequence[Any]]:
+    return [items[i:i + RECONCILE_BATCH_SIZE] for i in range(0, len(items), RECONCILE_BATCH_SIZE)]
+
+
+async def _mirrored_products() -> Dict[str, Dict[str, Any]]:
+    rows: Dict[str, Dict[str, Any]] = {}
+    table = get_supabase_admin().table("product")
+    start = 0
+    while True:
+        with observe_upstream("supabase", "product.select"):
+            result = await table.select(",".join(PRODUCT_COLUMNS)).order("id") \
+                .range(start, start + RECONCILE_BATCH_SIZE - 1).execute()
+        rows.update((row["id"], row) for row in result.data)
+        if len(result.data) < RECONCILE_BATCH_SIZE:
+            return rows
+        start += RECONCILE_BATCH_SIZE
+
+
+async def reconcile_catalog() -> None:
+    """
+    Brings Supabase's product table back in line with the published Sanity catalog,
+    repairing what missed webhooks left behind: changed or missing products are
+    upserted and products no longer in Sanity are deleted.
+    """
+    products = await fetch_all_products.__wrapped__()
+    if not products:
+        # [] or None means Sanity failed; an empty result must not empty the mirror
+        raise RuntimeError("Sanity returned no products; the mirror was left as is")
+    expected = {
+        product["_id"]: _product_row(product)
+        for product in products
+        if product.get("_id") and not product["_id"].startswith("drafts.")
+    }
+    mirrored = await _mirrored_products()
+    changed = [row for product_id, row in expected.items() if mirrored.get(product_id) != row]
+    stale = sorted(mirrored.keys() - expected.keys())
+
+    admin = get_supabase_admin()
+    for batch in _batches(changed):
+        with observe_upstream("supabase", "product.upsert"):
+            await admin.table("product").upsert(list(batch), on_conflict="id").execute()
+    for batch in _batches(stale):
+        with observe_upstream("supabase", "product.delete"):
+            await admin.table("product").delete().in_("id", list(batch)).execute()
+    logger.info(
+        f"Reconciled the product mirror with {len(expected)} Sanity products: "
+        f"{len(changed)} upserted, {len(stale)} deleted."
+    )
+
+
+def build_scheduler() -> Scheduler:
+    jobs = []
+    for name, schedule, func, leader_only in (
+        ("warm_caches", settings.SCHEDULE_WARM_CACHES, warm_caches, False),
+        ("expire_promos", settings.SCHEDULE_EXPIRE_PROMOS, expire_promos, True),
+        ("reconcile_catalog", settings.SCHEDULE_RECONCILE_CATALOG, reconcile_catalog, True),
+        ("purge_idempotency_keys", settings.SCHEDULE_PURGE_IDEMPOTENCY_KEYS, purge_idempotency_keys, True),
+    ):
+        if schedule.strip():
+            jobs.append(Job(name, CronSchedule(schedule), func, leader_only, settings.SCHEDULER_JOB_TIMEOUT_SECONDS))
+
+    dsn = settings.SCHEDULER_LEADER_DSN or settings.DIRECT_URL
+    leader: Optional[AdvisoryLockLeader] = None
+    # A local SQLite database means a single instance, which leads unopposed
+    if make_url(dsn).get_backend_name() == "postgresql":
+        leader = AdvisoryLockLeader(dsn, SCHEDULER_LOCK_KEY, settings.SCHEDULER_LEADER_RETRY_SECONDS)
+    return Scheduler(jobs, leader, settings.SCHEDULER_JITTER_SECONDS)
+
+
+scheduler = build_scheduler()
@@ -0,0 +1,114 @@
+import asyncio
+import json
+import logging
+from typing import Any, Dict, Optional, Set
+from sqlalchemy import event
+from sqlmodel.ext.asyncio.session import AsyncSession
+from config.settings import settings
+from models.models import Order
+from services.pg_notify import PostgresNotifyChannel
+
+logger = logging.getLogger("main")
+
+NOTIFY_CHANNEL = "order_completed"
+_PENDING_KEY = "order_notifications"
+_HOOKED_KEY = "order_notifications_hooked"
+
+
+class OrderNotifier:
+    """
+    Wakes up /api/orders/{order_id}/status long-polls when an Order for a PayPal order
+    commits, whether the capture endpoint or the webhook inbox wrote it.
+
+    Notifications are queued on the writing session and sent only after it commits
+    (dropped if it rolls back). With ORDER_NOTIFY_BACKEND="postgres" they also go out
+    over Postgres NOTIFY, and a LISTEN connection delivers other workers' notifications
+    here, so a long-poll resolves whichever process committed the order.
+    """
+
+    def __init__(self, backend: str, dsn: Optional[str], max_waiters: int):
+        self._max_waiters = max_waiters
+        self._waiters: Dict[str, Set[asyncio.Future]] = {}
+        self._waiter_count = 0
+        self._channel: Optional[PostgresNotifyChannel] = None
+        if backend == "postgres":
+            self._channel = PostgresNotifyChannel(dsn, NOTIFY_CHANNEL, self._on_payload, "ORDER_NOTIFY_DSN")
+
+    @property
+    def uses_postgres(self) -> bool:
+        return self._channel is not None
+
+    def start(self) -> None:
+        if self._channel:
+            self._channel.start()
+
+    async def stop(self) -> None:
+        if self._channel:
+            await self._channel.stop()
+
+    # --- Publishing ---
+
+    def notify_on_commit(self, session: AsyncSession, order: Order) -> None:
+        """Queues a notification for `order`, sent once `session` commits."""
+        if not order.payment_order_id:
+            return
+        session.info.setdefault(_PENDING_KEY, []).append({
+            "paymentOrderId": order.payment_order_id,
+            "orderId": str(order.id),
+            "userId": order.user_id,
+        })
+        if not session.info.get(_HOOKED_KEY):
+            session.info[_HOOKED_KEY] = True
+            event.listen(session.sync_session, "after_commit", self._after_commit)
+            event.listen(session.sync_session, "after_rollback", self._after_rollback)
+
+    def _after_commit(self, sync_session) -> None:
+        for notification in sync_session.info.pop(_PENDING_KEY, []):
+            self._resolve(notification)
+            if self._channel:
+                self._channel.send_soon(json.dumps(notification))
+
+    def _after_rollback(self, sync_session) -> None:
+        sync_session.info.pop(_PENDING_KEY, None)
+
+    # --- Waiting ---
+
+    @property
+    def at_capacity(self) -> bool:
+        return self._waiter_count >= self._max_waiters
+
+    def register(self, payment_order_id: str) -> asyncio.Future:
+        """
+        A future resolved with the notification for `payment_order_id`. Register before
+        checking the database, so an order committed in between isn't missed.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(payment_order_id, set()).add(future)
+        self._waiter_count += 1
+        return future
+
+    def unregister(self, payment_order_id: str, future: asyncio.Future) -> None:
+        waiters = self._waiters.get(payment_order_id)
+        if waiters and future in waiters:
+            waiters.discard(future)
+            self._waiter_count -= 1
+            if not waiters:
+                del self._waiters[payment_order_id]
+
+    def _resolve(self, notification: Dict[str, Any]) -> None:
+        for future in self._waiters.get(notification.get("paymentOrderId"), ()):
+            if not future.done():
+                future.set_result(notification)
+
+    def _on_payload(self, payload: str) -> None:
+        try:
+            self._resolve(json.loads(payload))
+        except ValueError:
+            logger.warning(f"Ignoring malformed order notification: {payload[:200]}")
+
+
+order_notifier = OrderNotifier(
+    backend=settings.ORDER_NOTIFY_BACKEND,
+    dsn=settings.ORDER_NOTIFY_DSN or settings.DIRECT_URL,
+    max_waiters=settings.ORDER_STATUS_MAX_WAITERS,
+)
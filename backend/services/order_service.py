@@ -0,0 +1,82 @@
+import logging
+from typing import Optional, Dict, Any, Tuple
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlmodel.ext.asyncio.session import AsyncSession
+from models.models import CartItem, Order, OrderItem
+from services.order_notifier import order_notifier
+
+logger = logging.getLogger("main")
+
+
+def format_shipping_address(shipping_info: Dict[str, Any]) -> str:
+    """Flattens a PayPal purchase_unit `shipping` object into the Order.shipping_address string."""
+    name = (shipping_info.get("name") or {}).get("full_name", "")
+    address = shipping_info.get("address") or {}
+    return f"{name}, {address.get('address_line_1', '')}, {address.get('admin_area_2', '')}".strip(", ")
+
+
+async def find_order_by_payment_id(
+    session: AsyncSession, payment_order_id: str, user_id: Optional[str] = None
+) -> Optional[Order]:
+    statement = select(Order).where(Order.payment_order_id == payment_order_id)
+    if user_id is not None:
+        statement = statement.where(Order.user_id == user_id)
+    result = await session.execute(statement)
+    return result.scalars().first()
+
+
+async def create_order_from_cart(
+    session: AsyncSession,
+    user_id: str,
+    payment_order_id: str,
+    shipping_address: str,
+    total_amount: float,
+) -> Tuple[Optional[Order], bool]:
+    """
+    Turns the user's cart into a completed Order for a captured PayPal payment.
+
+    Shared by the capture endpoint and the webhook inbox worker, whichever gets there
+    first; a unique index on payment_order_id settles a race between them, the loser
+    getting the winner's order. Its commit notifies order-status waiters. Flushes but
+    does not commit, so callers can commit it together with their own bookkeeping.
+    Returns `(order, True)` when a new order was created, `(existing_order, False)` when
+    the payment was already recorded and `(None, False)` when there is neither an order
+    nor a cart to build one from.
+    """
+    existing_order = await find_order_by_payment_id(session, payment_order_id, user_id)
+    if existing_order:
+        return existing_order, False
+
+    result = await session.execute(select(CartItem).where(CartItem.user_id == user_id))
+    cart_items = result.scalars().all()
+    if not cart_items:
+        return None, False
+
+    new_order = Order(
+        payment_order_id=payment_order_id,
+        user_id=user_id,
+        shipping_address=shipping_address,
+        total_amount=total_amount,
+        status="completed"
+    )
+    try:
+        # In a savepoint, so losing the race only undoes this insert and not the caller's work
+        async with session.begin_nested():
+            session.add(new_order)
+            await session.flush()
+    except IntegrityError:
+        # The other path committed an order for this payment first (ux_order_payment_order_id)
+        existing_order = await find_order_by_payment_id(session, payment_order_id, user_id)
+        if existing_order is None:
+            raise
+        logger.info(f"PayPal order {payment_order_id} was recorded concurrently as order {existing_order.id}.")
+        return existing_order, False
+
+    for item in cart_items:
+        session.add(OrderItem(order_id=new_order.id, product_id=item.product_id, quantity=item.quantity, price=item.price))
+        await session.delete(item)
+    await session.flush()
+    # Wakes /api/orders/{id}/status long-polls once the caller commits
+    order_notifier.notify_on_commit(session, new_order)
+    return new_order, True
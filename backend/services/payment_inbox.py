@@ -0,0 +1,190 @@
+import asyncio
+import logging
+import random
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, Any, List, Optional
+from sqlalchemy import select, update
+from sqlmodel.ext.asyncio.session import AsyncSession
+from config.settings import settings
+from database.db import AsyncSessionLocal, dialect_insert, mark_user_write
+from models.models import PaymentWebhookEvent
+from observability.tracing import correlation_id
+from services.order_service import create_order_from_cart, format_shipping_address
+
+logger = logging.getLogger("main")
+
+EventHandler = Callable[[AsyncSession, Dict[str, Any]], Awaitable[None]]
+
+
+async def record_webhook_event(session: AsyncSession, event: Dict[str, Any]) -> bool:
+    """
+    Stores a verified PayPal event in the inbox. Returns False for a redelivery of an
+    event ID that is already there; the primary key makes the insert idempotent.
+    """
+    statement = dialect_insert(PaymentWebhookEvent).values(
+        id=event["id"],
+        event_type=event.get("event_type", ""),
+        payload=event,
+        status="pending",
+        attempts=0,
+        next_attempt_at=datetime.now(timezone.utc),
+        received_at=datetime.now(timezone.utc),
+    ).on_conflict_do_nothing(index_elements=["id"])
+    result = await session.execute(statement)
+    await session.commit()
+    return result.rowcount == 1
+
+
+async def handle_checkout_order_completed(session: AsyncSession, event: Dict[str, Any]) -> None:
+    resource = event["resource"]
+    purchase_unit = resource["purchase_units"][0]
+    # custom_id carries our user_id, set when the PayPal order was created
+    user_id = purchase_unit["custom_id"]
+    order, created = await create_order_from_cart(
+        session,
+        user_id=user_id,
+        payment_order_id=resource["id"],
+        shipping_address=format_shipping_address(purchase_unit.get("shipping", {})),
+        total_amount=float(purchase_unit["amount"]["value"]),
+    )
+    if created:
+        mark_user_write(user_id)
+        logger.info(f"Order {order.id} successfully created for user {user_id} via webhook.")
+    elif order:
+        logger.info(f"PayPal order {resource['id']} was already recorded as order {order.id}.")
+    else:
+        logger.warning(f"Webhook for user {user_id} received, but cart is empty and no order exists.")
+
+
+EVENT_HANDLERS: Dict[str, EventHandler] = {
+    "CHECKOUT.ORDER.COMPLETED": handle_checkout_order_completed,
+}
+
+
+class PaymentInboxWorkerPool:
+    """
+    Drains the payment webhook inbox in the background.
+
+    Each worker claims the oldest due `pending` event with FOR UPDATE SKIP LOCKED and
+    runs its handler in the same transaction, so the order it writes and the `done`
+    mark commit together. A failing event is retried with exponential backoff and
+    jitter and marked `failed` after `max_attempts`. Workers sleep until `wake()` is
+    called by the webhook endpoint or the poll interval passes.
+    """
+
+    def __init__(
+        self,
+        workers: int,
+        max_attempts: int,
+        retry_base_seconds: float,
+        poll_interval_seconds: float,
+        handlers: Optional[Dict[str, EventHandler]] = None,
+    ):
+        self._workers = workers
+        self._max_attempts = max_attempts
+        self._retry_base_seconds = retry_base_seconds
+        self._poll_interval_seconds = poll_interval_seconds
+        self._handlers = handlers if handlers is not None else EVENT_HANDLERS
+        self._wakeup = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+        self._stopping = False
+
+    def start(self) -> None:
+        self._stopping = False
+        self._tasks = [
+            asyncio.create_task(self._run(n), name=f"payment-inbox-worker-{n}")
+            for n in range(self._workers)
+        ]
+        logger.info(f"Started {self._workers} payment inbox worker(s).")
+
+    async def stop(self) -> None:
+        self._stopping = True
+        self._wakeup.set()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def wake(self) -> None:
+        self._wakeup.set()
+
+    async def _run(self, worker_id: int) -> None:
+        while not self._stopping:
+            try:
+                processed = await self.process_next()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Payment inbox worker {worker_id} failed to claim an event: {e}", exc_info=True)
+                processed = False
+            if processed:
+                continue
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self._poll_interval_seconds)
+            except asyncio.TimeoutError:
+                pass
+
+    async def process_next(self) -> bool:
+        """Claims and processes one due event. Returns False when nothing was due."""
+        async with AsyncSessionLocal() as session:
+            statement = (
+                select(PaymentWebhookEvent)
+                .where(
+                    (PaymentWebhookEvent.status == "pending")
+                    & (PaymentWebhookEvent.next_attempt_at <= datetime.now(timezone.utc))
+                )
+                .order_by(PaymentWebhookEvent.next_attempt_at)
+                .limit(1)
+                .with_for_update(skip_locked=True)
+            )
+            result = await session.execute(statement)
+            event_row = result.scalar_one_or_none()
+            if event_row is None:
+                await session.rollback()
+                return False
+
+            event_id, event_type, attempts = event_row.id, event_row.event_type, event_row.attempts
+            handler = self._handlers.get(event_type)
+            with correlation_id(f"paypal-event:{event_id}"):
+                try:
+                    if handler:
+                        await handler(session, event_row.payload)
+                    else:
+                        logger.info(f"No handler for PayPal event type {event_type}; marking {event_id} done.")
+                    event_row.status = "done"
+                    event_row.attempts = attempts + 1
+                    event_row.processed_at = datetime.now(timezone.utc)
+                    await session.commit()
+                    return True
+                except Exception as e:
+                    await session.rollback()
+                    await self._record_failure(session, event_id, attempts + 1, e)
+                    return True
+
+    async def _record_failure(self, session: AsyncSession, event_id: str, attempts: int, error: Exception) -> None:
+        exhausted = attempts >= self._max_attempts
+        delay = self._retry_base_seconds * (2 ** (attempts - 1)) * random.uniform(0.8, 1.2)
+        await session.execute(
+            update(PaymentWebhookEvent)
+            .where(PaymentWebhookEvent.id == event_id)
+            .values(
+                status="failed" if exhausted else "pending",
+                attempts=attempts,
+                last_error=str(error)[:2000],
+                next_attempt_at=datetime.now(timezone.utc) + timedelta(seconds=delay),
+            )
+        )
+        await session.commit()
+        if exhausted:
+            logger.error(f"PayPal event {event_id} failed after {attempts} attempts: {error}", exc_info=error)
+        else:
+            logger.warning(f"PayPal event {event_id} attempt {attempts} failed, retrying in {delay:.1f}s: {error}")
+
+
+payment_inbox = PaymentInboxWorkerPool(
+    workers=settings.PAYMENT_WEBHOOK_WORKERS,
+    max_attempts=settings.PAYMENT_WEBHOOK_MAX_ATTEMPTS,
+    retry_base_seconds=settings.PAYMENT_WEBHOOK_RETRY_BASE_SECONDS,
+    poll_interval_seconds=settings.PAYMENT_WEBHOOK_POLL_SECONDS,
+)
@@ -0,0 +1,148 @@
+import asyncio
+import logging
+import time
+from typing import Optional, Dict, Any
+import httpx
+from config.settings import settings
+from observability.metrics import observe_upstream
+from services.http_clients import http_clients
+
+logger = logging.getLogger("main")
+
+PAYPAL_LIVE_API_BASE = "https://api-m.paypal.com"
+PAYPAL_SANDBOX_API_BASE = "https://api-m.sandbox.paypal.com"
+
+
+class PayPalAPIError(Exception):
+    """Raised when PayPal answers with a non-2xx status."""
+
+    def __init__(self, status_code: int, text: str):
+        super().__init__(f"PayPal API error {status_code}: {text}")
+        self.status_code = status_code
+        self.text = text
+
+
+def get_paypal_api_base() -> str:
+    """
+    Determines the PayPal API base URL. PAYPAL_API_BASE wins when set (e.g. a local
+    stand-in server); otherwise PAYPAL_MODE selects live or sandbox, defaulting to sandbox.
+    """
+    if settings.PAYPAL_API_BASE:
+        return settings.PAYPAL_API_BASE.rstrip("/")
+    if settings.PAYPAL_MODE.lower() == "live":
+        return PAYPAL_LIVE_API_BASE
+    return PAYPAL_SANDBOX_API_BASE
+
+
+class PayPalClient:
+    """
+    Shared async PayPal REST client.
+
+    Uses the pooled "paypal" client of services/http_clients.py (or a client of its own
+    over `transport`, e.g. a test stand-in) and caches the OAuth2 access token until
+    `token_refresh_margin` seconds before its `expires_in`. Concurrent callers that find
+    the token stale wait on a single refresh instead of each hitting /v1/oauth2/token.
+    """
+
+    def __init__(
+        self,
+        client_id: str,
+        client_secret: str,
+        api_base: str,
+        token_refresh_margin: float = 60.0,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        self._client_id = client_id
+        self._client_secret = client_secret
+        self._token_refresh_margin = token_refresh_margin
+        options = {"base_url": api_base, "headers": {"Accept": "application/json", "Accept-Language": "en_US"}}
+        if transport is not None:
+            self._http = httpx.AsyncClient(transport=transport, **options)
+        else:
+            self._http = http_clients.client("paypal", **options)
+        self._access_token: Optional[str] = None
+        self._token_expires_at = 0.0
+        self._token_lock = asyncio.Lock()
+
+    @property
+    def api_base(self) -> str:
+        return str(self._http.base_url).rstrip("/")
+
+    def _token_is_fresh(self) -> bool:
+        return self._access_token is not None and time.monotonic() < self._token_expires_at
+
+    async def get_access_token(self, force_refresh: bool = False) -> str:
+        """Returns a cached OAuth2 access token, refreshing it at most once at a time."""
+        if not force_refresh and self._token_is_fresh():
+            return self._access_token
+        stale_token = self._access_token
+        async with self._token_lock:
+            # Another coroutine may have refreshed while we waited for the lock
+            if self._token_is_fresh() and (not force_refresh or self._access_token != stale_token):
+                return self._access_token
+            with observe_upstream("paypal", "oauth_token"):
+                response = await self._http.post(
+                    "/v1/oauth2/token",
+                    auth=(self._client_id, self._client_secret),
+                    data={"grant_type": "client_credentials"},
+                )
+            if response.status_code >= 400:
+                logger.error(f"PayPal Auth Error: {response.text}")
+                raise PayPalAPIError(response.status_code, response.text)
+            token_data = response.json()
+            expires_in = float(token_data.get("expires_in", 0))
+            self._access_token = token_data["access_token"]
+            self._token_expires_at = time.monotonic() + max(expires_in - self._token_refresh_margin, 0.0)
+            logger.info(f"Fetched PayPal access token from {self.api_base} (expires_in={expires_in:.0f}s)")
+            return self._access_token
+
+    async def _request(self, operation: str, method: str, path: str, **kwargs) -> Dict[str, Any]:
+        token = await self.get_access_token()
+        with observe_upstream("paypal", operation):
+            response = await self._http.request(method, path, headers={"Authorization": f"Bearer {token}"}, **kwargs)
+        if response.status_code == 401:
+            # Token revoked or expired early on PayPal's side: refresh once and retry
+            token = await self.get_access_token(force_refresh=True)
+            with observe_upstream("paypal", operation):
+                response = await self._http.request(method, path, headers={"Authorization": f"Bearer {token}"}, **kwargs)
+        if response.status_code >= 400:
+            raise PayPalAPIError(response.status_code, response.text)
+        return response.json() if response.content else {}
+
+    async def create_order(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        return await self._request("create_order", "POST", "/v2/checkout/orders", json=payload)
+
+    async def capture_order(self, order_id: str) -> Dict[str, Any]:
+        return await self._request("capture_order", "POST", f"/v2/checkout/orders/{order_id}/capture", json={})
+
+    async def verify_webhook_signature(self, payload: Dict[str, Any]) -> bool:
+        """Asks PayPal to verify a webhook delivery; used when the signature can't be checked locally."""
+        data = await self._request("verify_webhook_signature", "POST", "/v1/notifications/verify-webhook-signature", json=payload)
+        return data.get("verification_status") == "SUCCESS"
+
+
+_paypal_client: Optional[PayPalClient] = None
+
+
+def get_paypal_client() -> PayPalClient:
+    """Returns the process-wide PayPal client, creating it on first use."""
+    global _paypal_client
+    if _paypal_client is None:
+        if not settings.PAYPAL_CLIENT_ID or not settings.PAYPAL_CLIENT_SECRET:
+            raise PayPalAPIError(500, "PayPal credentials (CLIENT_ID, CLIENT_SECRET) are not configured.")
+        _paypal_client = PayPalClient(
+            settings.PAYPAL_CLIENT_ID,
+            settings.PAYPAL_CLIENT_SECRET,
+            get_paypal_api_base(),
+        )
+        logger.info(f"PayPal client created for {_paypal_client.api_base}")
+    return _paypal_client
+
+
+def close_paypal_clients() -> None:
+    """Drops the PayPal client and webhook verifier; their connections are closed with the HTTP pools."""
+    from services.paypal_webhook_verifier import close_paypal_webhook_verifier
+
+    global _paypal_client
+    _paypal_client = None
+    close_paypal_webhook_verifier()
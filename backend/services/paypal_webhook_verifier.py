@@ -0,0 +1,210 @@
+import asyncio
+import base64
+import json
+import logging
+import re
+import time
+import zlib
+from collections import OrderedDict
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Optional, Dict, Any, List, Mapping, Tuple
+import certifi
+import httpx
+from cryptography import x509
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import padding
+from cryptography.x509.verification import PolicyBuilder, Store, VerificationError
+from config.settings import settings
+from observability.metrics import observe_upstream
+from services.http_clients import http_clients
+from services.paypal_service import PayPalAPIError, get_paypal_client
+
+logger = logging.getLogger("main")
+
+# Where PayPal serves webhook signing certificates (live and sandbox API hosts). Anything
+# else in paypal-cert-url is rejected before any outbound request is made.
+TRUSTED_CERT_URL = re.compile(r"https://api(-m)?(\.sandbox)?\.paypal\.com/v1/notifications/certs/[A-Za-z0-9_-]+")
+# Certificates kept per process; PayPal rotates through a handful at a time
+MAX_CACHED_CERTS = 32
+# Names PayPal's webhook signing certificates are issued to (live, sandbox)
+TRUSTED_CERT_SUBJECTS = ("messageverificationcerts.paypal.com", "messageverificationcerts.sandbox.paypal.com")
+
+
+@lru_cache(maxsize=1)
+def _trust_store() -> Store:
+    """The public CA roots (certifi's bundle, as httpx uses) a signing certificate must chain to."""
+    with open(certifi.where(), "rb") as bundle:
+        return Store(x509.load_pem_x509_certificates(bundle.read()))
+
+
+def _verify_certificate_chain(leaf: x509.Certificate, intermediates: List[x509.Certificate]) -> None:
+    """
+    Raises WebhookVerificationError unless `leaf` chains through `intermediates` to a
+    trusted root and is issued to one of PayPal's webhook signing names.
+    """
+    policy = PolicyBuilder().store(_trust_store()).time(datetime.now(timezone.utc))
+    errors = []
+    for subject in TRUSTED_CERT_SUBJECTS:
+        try:
+            policy.build_server_verifier(x509.DNSName(subject)).verify(leaf, intermediates)
+            return
+        except VerificationError as e:
+            errors.append(str(e))
+    raise WebhookVerificationError(f"Untrusted PayPal webhook certificate: {'; '.join(errors)}")
+
+
+class WebhookVerificationError(Exception):
+    """Raised when a PayPal webhook delivery fails signature verification."""
+
+
+class PayPalWebhookVerifier:
+    """
+    Verifies PayPal webhook deliveries locally.
+
+    The signed message is `<transmission id>|<transmission time>|<webhook id>|<crc32 of body>`,
+    signed with SHA256withRSA by the certificate at `paypal-cert-url`. Certificates are
+    downloaded once per URL, parsed, checked to chain to a trusted root and to be issued
+    to PayPal's signing name, and cached until `cert_ttl_seconds` or their own
+    expiry, whichever is sooner, so a burst of deliveries costs one download.
+    `paypal-cert-url` must be one of PayPal's certificate URLs. When such a certificate
+    can't be downloaded or parsed, verification falls back to PayPal's
+    verify-webhook-signature API. Downloads go through the pooled "paypal" client (or a
+    client of its own over `transport`).
+    """
+
+    def __init__(
+        self,
+        webhook_id: str,
+        cert_ttl_seconds: float = 24 * 60 * 60,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        self._webhook_id = webhook_id
+        self._cert_ttl_seconds = cert_ttl_seconds
+        self._certs: "OrderedDict[str, Tuple[x509.Certificate, float]]" = OrderedDict()
+        # Concurrent misses for the same URL share one download
+        self._cert_downloads: Dict[str, asyncio.Future] = {}
+        if transport is not None:
+            self._http = httpx.AsyncClient(transport=transport)
+        else:
+            self._http = http_clients.client("paypal", "certs")
+
+    async def verify(self, headers: Mapping[str, str], body: bytes) -> Dict[str, Any]:
+        """Verifies the delivery and returns the parsed event, or raises WebhookVerificationError."""
+        transmission_id = headers.get("paypal-transmission-id")
+        transmission_time = headers.get("paypal-transmission-time")
+        transmission_sig = headers.get("paypal-transmission-sig")
+        cert_url = headers.get("paypal-cert-url")
+        auth_algo = headers.get("paypal-auth-algo")
+        if not all([transmission_id, transmission_time, transmission_sig, cert_url, auth_algo]):
+            raise WebhookVerificationError("Missing PayPal transmission headers")
+        if auth_algo.upper() != "SHA256WITHRSA":
+            raise WebhookVerificationError(f"Unsupported auth algorithm: {auth_algo}")
+        if not TRUSTED_CERT_URL.fullmatch(cert_url):
+            raise WebhookVerificationError(f"Untrusted certificate URL: {cert_url[:200]}")
+
+        try:
+            event = json.loads(body)
+        except json.JSONDecodeError:
+            raise WebhookVerificationError("Invalid JSON payload")
+
+        cert = await self._get_certificate(cert_url)
+        if cert is None:
+            await self._verify_remotely(transmission_id, transmission_time, transmission_sig, cert_url, auth_algo, event)
+            return event
+
+        crc = zlib.crc32(body) & 0xFFFFFFFF
+        message = f"{transmission_id}|{transmission_time}|{self._webhook_id}|{crc}".encode("utf-8")
+        try:
+            cert.public_key().verify(
+                base64.b64decode(transmission_sig),
+                message,
+                padding.PKCS1v15(),
+                hashes.SHA256(),
+            )
+        except (InvalidSignature, ValueError) as e:
+            raise WebhookVerificationError(f"Signature mismatch: {e}")
+        return event
+
+    async def _get_certificate(self, cert_url: str) -> Optional[x509.Certificate]:
+        cached = self._certs.get(cert_url)
+        if cached and cached[1] > time.time():
+            self._certs.move_to_end(cert_url)
+            return cached[0]
+
+        download = self._cert_downloads.get(cert_url)
+        if download is None:
+            download = asyncio.ensure_future(self._download_certificate(cert_url))
+            self._cert_downloads[cert_url] = download
+            download.add_done_callback(lambda _: self._cert_downloads.pop(cert_url, None))
+        return await asyncio.shield(download)
+
+    async def _download_certificate(self, cert_url: str) -> Optional[x509.Certificate]:
+        try:
+            with observe_upstream("paypal", "webhook_cert"):
+                response = await self._http.get(cert_url)
+            response.raise_for_status()
+            # The leaf certificate, followed by the intermediates it was issued through
+            cert, *intermediates = x509.load_pem_x509_certificates(response.content)
+        except (httpx.HTTPError, ValueError) as e:
+            logger.warning(f"Could not load PayPal webhook certificate {cert_url}: {e}")
+            return None
+
+        # Checks the validity period too; loading the trust store reads certifi's bundle
+        await asyncio.to_thread(_verify_certificate_chain, cert, intermediates)
+        expires_at = min(time.time() + self._cert_ttl_seconds, cert.not_valid_after_utc.timestamp())
+        self._certs[cert_url] = (cert, expires_at)
+        self._certs.move_to_end(cert_url)
+        while len(self._certs) > MAX_CACHED_CERTS:
+            self._certs.popitem(last=False)
+        logger.info(f"Cached PayPal webhook certificate {cert_url}")
+        return cert
+
+    async def _verify_remotely(
+        self,
+        transmission_id: str,
+        transmission_time: str,
+        transmission_sig: str,
+        cert_url: str,
+        auth_algo: str,
+        event: Dict[str, Any],
+    ) -> None:
+        logger.info("Falling back to PayPal verify-webhook-signature API")
+        try:
+            verified = await get_paypal_client().verify_webhook_signature({
+                "transmission_id": transmission_id,
+                "transmission_time": transmission_time,
+                "transmission_sig": transmission_sig,
+                "cert_url": cert_url,
+                "auth_algo": auth_algo,
+                "webhook_id": self._webhook_id,
+                "webhook_event": event,
+            })
+        except PayPalAPIError as e:
+            raise WebhookVerificationError(f"Remote verification failed: {e}")
+        if not verified:
+            raise WebhookVerificationError("PayPal rejected the webhook signature")
+
+
+_webhook_verifier: Optional[PayPalWebhookVerifier] = None
+
+
+def get_paypal_webhook_verifier() -> PayPalWebhookVerifier:
+    """Returns the process-wide webhook verifier, creating it on first use."""
+    global _webhook_verifier
+    if _webhook_verifier is None:
+        if not settings.PAYPAL_WEBHOOK_ID:
+            raise WebhookVerificationError("PAYPAL_WEBHOOK_ID is not configured")
+        _webhook_verifier = PayPalWebhookVerifier(
+            settings.PAYPAL_WEBHOOK_ID,
+            cert_ttl_seconds=settings.PAYPAL_CERT_CACHE_TTL_SECONDS,
+        )
+    return _webhook_verifier
+
+
+
+def close_paypal_webhook_verifier() -> None:
+    """Drops the webhook verifier; called by close_paypal_clients()."""
+    global _webhook_verifier
+    _webhook_verifier = None
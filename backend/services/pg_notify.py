@@ -0,0 +1,91 @@
+import asyncio
+import logging
+from typing import Callable, Optional, Set
+from sqlalchemy.engine import make_url
+from database.db import uses_pgbouncer
+
+logger = logging.getLogger("main")
+
+LISTEN_RECONNECT_SECONDS = 5.0
+# Postgres rejects NOTIFY payloads of 8000 bytes or more
+MAX_PAYLOAD_BYTES = 7999
+
+
+class PostgresNotifyChannel:
+    """
+    A Postgres LISTEN/NOTIFY channel shared by every worker and instance.
+
+    A dedicated connection LISTENs on `channel` (reconnecting when it drops) and hands
+    each payload to `on_payload`, including the ones this process sent; send_soon()
+    NOTIFYs over the same connection in the background. Needs a direct connection:
+    transaction poolers don't keep LISTEN sessions.
+    """
+
+    def __init__(self, dsn: str, channel: str, on_payload: Callable[[str], None], dsn_setting: str):
+        self._dsn = dsn
+        self._channel = channel
+        self._on_payload = on_payload
+        self._dsn_setting = dsn_setting
+        self._connection = None  # asyncpg connection holding the LISTEN
+        self._send_lock = asyncio.Lock()
+        self._listen_task: Optional[asyncio.Task] = None
+        self._send_tasks: Set[asyncio.Task] = set()
+
+    def start(self) -> None:
+        if self._listen_task is None:
+            if uses_pgbouncer(make_url(self._dsn)):
+                logger.warning(f"{self._dsn_setting} looks like a transaction pooler; LISTEN needs a direct connection.")
+            self._listen_task = asyncio.create_task(self._listen_loop(), name=f"{self._channel}-listener")
+
+    async def stop(self) -> None:
+        if self._listen_task:
+            self._listen_task.cancel()
+            await asyncio.gather(self._listen_task, return_exceptions=True)
+            self._listen_task = None
+        await asyncio.gather(*self._send_tasks, return_exceptions=True)
+
+    def send_soon(self, payload: str) -> None:
+        """NOTIFYs `payload` from a background task; a failure is logged, not raised."""
+        if len(payload.encode("utf-8")) > MAX_PAYLOAD_BYTES:
+            logger.warning(f"Not sending a {len(payload)}-character notification on '{self._channel}': too large.")
+            return
+        task = asyncio.get_running_loop().create_task(self._send(payload))
+        self._send_tasks.add(task)
+        task.add_done_callback(self._send_tasks.discard)
+
+    async def _send(self, payload: str) -> None:
+        if self._connection is None:
+            logger.warning(f"Notification on '{self._channel}' not sent to other workers: no LISTEN connection.")
+            return
+        try:
+            async with self._send_lock:
+                await self._connection.execute("SELECT pg_notify($1, $2)", self._channel, payload)
+        except Exception as e:
+            logger.warning(f"Sending a notification on '{self._channel}' failed: {e}")
+
+    async def _listen_loop(self) -> None:
+        import asyncpg
+
+        while True:
+            connection = None
+            try:
+                connection = await asyncpg.connect(self._dsn)
+                closed = asyncio.Event()
+                connection.add_termination_listener(lambda _: closed.set())
+                await connection.add_listener(self._channel, self._on_notification)
+                self._connection = connection
+                logger.info(f"Listening on Postgres channel '{self._channel}'.")
+                await closed.wait()
+                logger.warning(f"LISTEN connection for '{self._channel}' closed; reconnecting.")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"LISTEN on '{self._channel}' failed: {e}")
+            finally:
+                self._connection = None
+                if connection is not None and not connection.is_closed():
+                    await connection.close()
+            await asyncio.sleep(LISTEN_RECONNECT_SECONDS)
+
+    def _on_notification(self, connection, pid: int, channel: str, payload: str) -> None:
+        self._on_payload(payload)
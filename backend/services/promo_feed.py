@@ -0,0 +1,134 @@
+import asyncio
+import logging
+import time
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+from config.settings import settings
+from database.db import get_supabase_public
+from observability.metrics import observe_upstream, record_cache
+from services.sanity_service import fetch_static_promos
+
+logger = logging.getLogger("main")
+
+DYNAMIC_PROMO_COLUMNS = "id,title,description,discount,valid_until,imageUrl,is_active"
+
+
+async def fetch_active_dynamic_promos(today: date) -> List[Dict[str, Any]]:
+    """
+    Active Supabase promos that haven't expired by `today`, soonest-ending first.
+    Filtered in the database, on the partial index ix_dynamic_promo_active_valid_until.
+    """
+    with observe_upstream("supabase", "dynamic_promo.select"):
+        result = await get_supabase_public().table("dynamic_promo").select(DYNAMIC_PROMO_COLUMNS) \
+            .eq("is_active", True).or_(f"valid_until.is.null,valid_until.gte.{today.isoformat()}") \
+            .order("valid_until").execute()
+    return result.data
+
+
+def _expires_at(valid_until: Any) -> Optional[datetime]:
+    """When a promo valid until `valid_until` ends: the end of that day (UTC) for a date, or the datetime itself."""
+    if not isinstance(valid_until, str) or not valid_until:
+        return None
+    try:
+        if len(valid_until) == 10:
+            day = date.fromisoformat(valid_until)
+            return datetime(day.year, day.month, day.day, tzinfo=timezone.utc) + timedelta(days=1)
+        moment = datetime.fromisoformat(valid_until.replace("Z", "+00:00"))
+        return moment if moment.tzinfo else moment.replace(tzinfo=timezone.utc)
+    except ValueError:
+        return None
+
+
+def _feed_item(source: str, promo: Dict[str, Any]) -> Dict[str, Any]:
+    if source == "sanity":
+        promo_id, valid_until = promo.get("_id"), promo.get("validUntil")
+    else:
+        promo_id, valid_until = promo.get("id"), promo.get("valid_until")
+    return {
+        "id": promo_id,
+        "source": source,
+        "title": promo.get("title"),
+        "description": promo.get("description"),
+        "discount": promo.get("discount"),
+        "validUntil": valid_until,
+        "imageUrl": promo.get("imageUrl"),
+    }
+
+
+class PromoFeed:
+    """
+    The merged promo feed behind /promos: unexpired Sanity promos and active Supabase
+    promos, fetched concurrently. The result is cached until the first of its promos
+    expires, invalidate() is called (promo writes, the Sanity webhook, the expire_promos
+    job) or `max_age` seconds pass, which bounds how long writes made through another
+    worker or straight in Supabase take to show. Concurrent misses share one fetch.
+    """
+
+    def __init__(self, max_age: float):
+        self._max_age = max_age
+        self._entry: Optional[Tuple[float, Dict[str, Any]]] = None  # (monotonic deadline, feed)
+        self._loading: Optional[asyncio.Future] = None
+        self._generation = 0
+
+    def invalidate(self) -> None:
+        self._generation += 1
+        self._entry = None
+        self._loading = None
+
+    async def get(self) -> Dict[str, Any]:
+        """
+        The feed: {"promos": merged feed items, "dynamic": the Supabase rows among them,
+        or None when Supabase failed}.
+        """
+        entry = self._entry
+        if entry and entry[0] > time.monotonic():
+            record_cache("promo_feed", "hit")
+            return entry[1]
+        if self._loading is not None:
+            record_cache("promo_feed", "coalesced")
+        else:
+            record_cache("promo_feed", "miss")
+            self._loading = asyncio.ensure_future(self._load(self._generation))
+        return await asyncio.shield(self._loading)
+
+    async def _load(self, generation: int) -> Dict[str, Any]:
+        try:
+            now = datetime.now(timezone.utc)
+            static, dynamic = await asyncio.gather(
+                fetch_static_promos(now.date().isoformat()),
+                fetch_active_dynamic_promos(now.date()),
+                return_exceptions=True,
+            )
+            complete = True
+            if static is None or isinstance(static, BaseException):
+                # fetch_static_promos() logs its own errors and returns None
+                static, complete = [], False
+            if isinstance(dynamic, BaseException):
+                logger.error(f"Fetching dynamic promos failed: {dynamic}")
+                dynamic, complete = None, False
+
+            promos, expiries = [], []
+            for source, rows in (("sanity", static), ("supabase", dynamic or [])):
+                for row in rows:
+                    item = _feed_item(source, row)
+                    expires_at = _expires_at(item["validUntil"])
+                    if expires_at is not None:
+                        if expires_at <= now:
+                            continue
+                        expiries.append(expires_at)
+                    promos.append(item)
+            # Soonest-ending first; promos without an end date last
+            promos.sort(key=lambda item: _expires_at(item["validUntil"]) or datetime.max.replace(tzinfo=timezone.utc))
+            feed = {"promos": promos, "dynamic": dynamic}
+
+            # A partial feed is served but not cached, so the next request retries the failed source
+            if complete and generation == self._generation:
+                ttl = min([self._max_age] + [(expires_at - now).total_seconds() for expires_at in expiries])
+                self._entry = (time.monotonic() + ttl, feed)
+            return feed
+        finally:
+            if generation == self._generation:
+                self._loading = None
+
+
+promo_feed = PromoFeed(max_age=settings.PROMO_FEED_MAX_AGE_SECONDS)
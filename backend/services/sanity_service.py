@@ -278,26 +278,105 @@
 #         return None
 
 
-import os
+import asyncio
+import functools
+import json
+import time
 import httpx
+import logging
 import textwrap
-from typing import Optional
-
-print("[SANITY_SERVICE][BOOT] loaded v1 at import")
-
-# Environment variables for Sanity project
-SANITY_PROJECT_ID = os.getenv("SANITY_PROJECT_ID")
-SANITY_DATASET = os.getenv("SANITY_DATASET")
-SANITY_API_VERSION = os.getenv("SANITY_API_VERSION", "v2023-05-25")
-
-if not SANITY_PROJECT_ID or not SANITY_DATASET:
-    raise ValueError("SANITY_PROJECT_ID and SANITY_DATASET must be set in environment variables.")
-
-# Async HTTP client for Sanity API
-sanity_client = httpx.AsyncClient(
-    base_url=f"https://{SANITY_PROJECT_ID}.api.sanity.io/{SANITY_API_VERSION}/data/query/{SANITY_DATASET}",
-)
-
+from collections import OrderedDict
+from typing import Optional, Any, Dict, Tuple, List
+from config.settings import settings
+from observability.metrics import observe_upstream, record_cache
+from services.http_clients import http_clients
+
+logger = logging.getLogger("main")
+
+# Sanity project settings
+SANITY_PROJECT_ID = settings.SANITY_PROJECT_ID
+SANITY_DATASET = settings.SANITY_DATASET
+SANITY_API_VERSION = settings.SANITY_API_VERSION
+
+def get_sanity_client(cdn: bool = False) -> httpx.AsyncClient:
+    """The pooled client for the live API, or with `cdn` (and SANITY_USE_CDN) for the API CDN."""
+    upstream = "sanity_cdn" if cdn and settings.SANITY_USE_CDN else "sanity"
+    host = "apicdn" if upstream == "sanity_cdn" else "api"
+    api_base = (settings.SANITY_API_BASE or f"https://{SANITY_PROJECT_ID}.{host}.sanity.io").rstrip("/")
+    return http_clients.client(upstream, base_url=f"{api_base}/{SANITY_API_VERSION}/data/query/{SANITY_DATASET}")
+
+async def _sanity_get(kind: str, params: Dict[str, Any], cdn: bool = False) -> httpx.Response:
+    """GROQ query request, timed under upstream="sanity" with the query kind as operation."""
+    with observe_upstream("sanity", kind):
+        return await get_sanity_client(cdn).get("/", params=params)
+
+# --- Query result cache ---
+# Successful, non-empty results are kept for SANITY_CACHE_TTL_SECONDS (0, the default,
+# disables caching). Concurrent misses for the same arguments share one upstream request,
+# and invalidate_sanity_cache() (called by the Sanity webhook) drops everything this
+# worker cached; other workers keep theirs until the TTL runs out.
+SANITY_CACHE_MAX_ENTRIES = 512
+_query_cache: "OrderedDict[Tuple, Tuple[float, Any]]" = OrderedDict()
+_inflight_queries: Dict[Tuple, asyncio.Future] = {}
+_cache_generation = 0
+
+def invalidate_sanity_cache():
+    global _cache_generation
+    _cache_generation += 1
+    _query_cache.clear()
+    _inflight_queries.clear()
+
+def seed_sanity_cache(fn, args: Tuple, result: Any, ttl: Optional[float] = None) -> None:
+    """
+    Caches `result` as what `fn(*args)` returned, for `ttl` seconds (the configured TTL by
+    default; math.inf keeps it until replaced or invalidated). Does nothing when caching is off.
+    """
+    if settings.SANITY_CACHE_TTL_SECONDS <= 0:
+        return
+    key = (fn.__name__, args, ())
+    _query_cache[key] = (time.monotonic() + (settings.SANITY_CACHE_TTL_SECONDS if ttl is None else ttl), result)
+    _query_cache.move_to_end(key)
+    while len(_query_cache) > SANITY_CACHE_MAX_ENTRIES:
+        _query_cache.popitem(last=False)
+
+def cached_query(fn):
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        ttl = settings.SANITY_CACHE_TTL_SECONDS
+        if ttl <= 0:
+            return await fn(*args, **kwargs)
+        key = (fn.__name__, args, tuple(sorted(kwargs.items())))
+        cached = _query_cache.get(key)
+        if cached and cached[0] > time.monotonic():
+            _query_cache.move_to_end(key)
+            record_cache("sanity_query", "hit")
+            return cached[1]
+
+        future = _inflight_queries.get(key)
+        if future is not None:
+            record_cache("sanity_query", "coalesced")
+        else:
+            record_cache("sanity_query", "miss")
+            generation = _cache_generation
+            future = asyncio.ensure_future(fn(*args, **kwargs))
+            _inflight_queries[key] = future
+
+            def store(done: asyncio.Future):
+                if _inflight_queries.get(key) is done:
+                    del _inflight_queries[key]
+                # Empty results may be an upstream error; don't pin them for a whole TTL
+                if done.cancelled() or done.exception() or not done.result() or generation != _cache_generation:
+                    return
+                _query_cache[key] = (time.monotonic() + ttl, done.result())
+                _query_cache.move_to_end(key)
+                while len(_query_cache) > SANITY_CACHE_MAX_ENTRIES:
+                    _query_cache.popitem(last=False)
+
+            future.add_done_callback(store)
+        return await asyncio.shield(future)
+    return wrapper
+
+@cached_query
 async def fetch_homepage_section(slug: str):
     query = textwrap.dedent(f"""
     *[_type == "homepageSection" && slug.current == "{slug}"][0]{{
@@ -309,16 +388,40 @@ async def fetch_homepage_section(slug: str):
     """)
     url_params = {"query": query}
     try:
-        response = await sanity_client.get("/", params=url_params)
+        response = await _sanity_get("homepage_section", url_params, cdn=True)
         if response.status_code == 200:
             return response.json().get("result", None)
         else:
-            print(f"ERROR: Sanity API request failed (homepage): {response.text}")
+            logger.error(f"Sanity API request failed (homepage): {response.status_code} {response.text[:500]}")
             return None
     except Exception as e:
-        print(f"Error fetching homepage section: {e}")
+        logger.error(f"Error fetching homepage section: {e}")
         return None
 
+@cached_query
+async def fetch_homepage_sections():
+    query = textwrap.dedent("""
+    *[_type == "homepageSection"]{
+        "slug": slug.current,
+        title,
+        description,
+        "imageUrl": image.asset->url,
+        "alt": image.alt
+    }
+    """)
+    url_params = {"query": query}
+    try:
+        response = await _sanity_get("homepage_sections", url_params, cdn=True)
+        if response.status_code == 200:
+            return response.json().get("result", [])
+        else:
+            logger.error(f"Sanity API request failed (homepage sections): {response.status_code} {response.text[:500]}")
+            return []
+    except Exception as e:
+        logger.error(f"Error fetching homepage sections: {e}")
+        return []
+
+@cached_query
 async def fetch_content_blocks():
     query = textwrap.dedent("""
     *[_type == "contentBlock"] | order(order asc){
@@ -336,16 +439,17 @@ async def fetch_content_blocks():
     """)
     url_params = {"query": query}
     try:
-        response = await sanity_client.get("/", params=url_params)
+        response = await _sanity_get("content_blocks", url_params, cdn=True)
         if response.status_code == 200:
             return response.json().get("result", [])
         else:
-            print(f"ERROR: Sanity API request failed (content blocks): {response.text}")
+            logger.error(f"Sanity API request failed (content blocks): {response.status_code} {response.text[:500]}")
             return []
     except Exception as e:
-        print(f"Error fetching content blocks: {e}")
+        logger.error(f"Error fetching content blocks: {e}")
         return []
 
+@cached_query
 async def fetch_categories():
     query = textwrap.dedent("""
     *[_type == "category"] | order(order asc){
@@ -360,21 +464,17 @@ async def fetch_categories():
     """)
     url_params = {"query": query}
     try:
-        print("[SANITY_SERVICE][CALL] fetch_categories starting")
-        print("[SANITY][categories] BASE=", sanity_client.base_url)
-        print("[SANITY][categories] QUERY:\n", query)
-        response = await sanity_client.get("/", params=url_params)
-        print("[SANITY][categories] STATUS=", response.status_code)
-        print("[SANITY][categories] BODY[0:400]=", response.text[:400])
+        response = await _sanity_get("categories", url_params, cdn=True)
         if response.status_code == 200:
             return response.json().get("result", [])
         else:
-            print(f"ERROR: Sanity API request failed (categories): {response.text}")
+            logger.error(f"Sanity API request failed (categories): {response.status_code} {response.text[:500]}")
             return []
     except Exception as e:
-        print(f"Error fetching categories: {e}")
+        logger.error(f"Error fetching categories: {e}")
         return None
 
+@cached_query
 async def fetch_featured_products():
     query = textwrap.dedent("""
     *[_type == "product" && isFeatured == true] | order(_createdAt desc){
@@ -393,16 +493,17 @@ async def fetch_featured_products():
     """)
     url_params = {"query": query}
     try:
-        response = await sanity_client.get("/", params=url_params)
+        response = await _sanity_get("featured_products", url_params, cdn=True)
         if response.status_code == 200:
             return response.json().get("result", [])
         else:
-            print(f"ERROR: Sanity API request failed (featured products): {response.text}")
+            logger.error(f"Sanity API request failed (featured products): {response.status_code} {response.text[:500]}")
             return []
     except Exception as e:
-        print(f"Error fetching featured products: {e}")
+        logger.error(f"Error fetching featured products: {e}")
         return None
 
+@cached_query
 async def fetch_all_products(
     category_slug: Optional[str] = None,
     sort_order: str = "newest",
@@ -437,6 +538,7 @@ async def fetch_all_products(
     query = textwrap.dedent(f"""
     *[_type == "product"{filter_clause}]{order_clause}{{
         _id,
+        _createdAt,
         name,
         "slug": slug.current,
         price,
@@ -455,16 +557,17 @@ async def fetch_all_products(
     """)
     url_params = {"query": query}
     try:
-        response = await sanity_client.get("/", params=url_params)
+        response = await _sanity_get("all_products", url_params)
         if response.status_code == 200:
             return response.json().get("result", [])
         else:
-            print(f"ERROR: Sanity API request failed (all products): {response.text}")
+            logger.error(f"Sanity API request failed (all products): {response.status_code} {response.text[:500]}")
             return []
     except Exception as e:
-        print(f"Error fetching all products: {e}")
+        logger.error(f"Error fetching all products: {e}")
         return []
 
+@cached_query
 async def fetch_product_by_slug(product_slug: str):
     query = textwrap.dedent(f"""
     *[_type == "product" && slug.current == "{product_slug}"][0]{{
@@ -487,38 +590,45 @@ async def fetch_product_by_slug(product_slug: str):
     """)
     url_params = {"query": query}
     try:
-        response = await sanity_client.get("/", params=url_params)
+        response = await _sanity_get("product_by_slug", url_params)
         if response.status_code == 200:
             return response.json().get("result", None)
         else:
-            print(f"ERROR: Sanity API request failed (single product by slug): {response.text}")
+            logger.error(f"Sanity API request failed (single product by slug): {response.status_code} {response.text[:500]}")
             return None
     except Exception as e:
-        print(f"Error fetching product by slug: {e}")
+        logger.error(f"Error fetching product by slug: {e}")
         return None
 
-async def fetch_static_promos():
-    query = textwrap.dedent("""
-    *[_type == "promo"]{
+@cached_query
+async def fetch_static_promos(valid_on: Optional[str] = None):
+    """Promos from Sanity; with `valid_on` (an ISO date), only those that haven't expired by then."""
+    validity = " && (!defined(validUntil) || validUntil >= $validOn)" if valid_on else ""
+    query = textwrap.dedent(f"""
+    *[_type == "promo"{validity}] | order(validUntil asc){{
+        _id,
         title,
         description,
         discount,
         validUntil,
         "imageUrl": image.asset->url
-    }
+    }}
     """)
     url_params = {"query": query}
+    if valid_on:
+        url_params["$validOn"] = json.dumps(valid_on)
     try:
-        response = await sanity_client.get("/", params=url_params)
+        response = await _sanity_get("static_promos", url_params, cdn=True)
         if response.status_code == 200:
             return response.json().get("result", [])
         else:
-            print(f"ERROR: Sanity API request failed (promos): {response.text}")
+            logger.error(f"Sanity API request failed (promos): {response.status_code} {response.text[:500]}")
             return []
     except Exception as e:
-        print(f"Error fetching promos: {e}")
+        logger.error(f"Error fetching promos: {e}")
         return None
 
+@cached_query
 async def fetch_product_by_id(product_id: str):
     query = textwrap.dedent(f"""
     *[_type == "product" && _id == "{product_id}"][0]{{
@@ -541,12 +651,50 @@ async def fetch_product_by_id(product_id: str):
     """)
     url_params = {"query": query}
     try:
-        response = await sanity_client.get("/", params=url_params)
+        response = await _sanity_get("product_by_id", url_params)
         if response.status_code == 200:
             return response.json().get("result", None)
         else:
-            print(f"ERROR: Sanity API request failed (single product by ID): {response.text}")
+            logger.error(f"Sanity API request failed (single product by ID): {response.status_code} {response.text[:500]}")
             return None
     except Exception as e:
-        print(f"Error fetching product by ID: {e}")
+        logger.error(f"Error fetching product by ID: {e}")
         return None
+
+@cached_query
+async def fetch_products_by_keys(ids: Tuple[str, ...] = (), slugs: Tuple[str, ...] = ()) -> List[Dict[str, Any]]:
+    """Products with any of the given IDs or slugs, in one query (order is not guaranteed)."""
+    if not ids and not slugs:
+        return []
+    query = textwrap.dedent("""
+    *[_type == "product" && (_id in $ids || slug.current in $slugs)]{
+        _id,
+        _createdAt,
+        name,
+        "slug": slug.current,
+        price,
+        description,
+        category->{
+            _id,
+            title,
+            "slug": slug.current
+        },
+        "imageUrl": mainImage.asset->url,
+        "alt": mainImage.alt,
+        stock,
+        isFeatured,
+        sku
+    }
+    """)
+    # GROQ parameters are passed as JSON, so keys are never spliced into the query text
+    url_params = {"query": query, "$ids": json.dumps(list(ids)), "$slugs": json.dumps(list(slugs))}
+    try:
+        response = await _sanity_get("products_by_keys", url_params)
+        if response.status_code == 200:
+            return response.json().get("result", [])
+        else:
+            logger.error(f"Sanity API request failed (products by keys): {response.status_code} {response.text[:500]}")
+            return []
+    except Exception as e:
+        logger.error(f"Error fetching products by keys: {e}")
+        return []
@@ -0,0 +1,235 @@
+import asyncio
+import logging
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, FrozenSet, List, Optional
+from sqlalchemy.engine import make_url
+from database.db import uses_pgbouncer
+from observability.metrics import SCHEDULER_JOB_DURATION, SCHEDULER_JOB_LAST_SUCCESS, SCHEDULER_JOB_RUNS, SCHEDULER_LEADER
+
+logger = logging.getLogger("main")
+
+# minute, hour, day of month, month, day of week (0 or 7 = Sunday)
+_FIELD_RANGES = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+_MAX_SEARCH_YEARS = 5
+
+
+def _parse_field(text: str, low: int, high: int) -> FrozenSet[int]:
+    values = set()
+    for part in text.split(","):
+        spec, _, step_text = part.partition("/")
+        step = int(step_text) if step_text else 1
+        if spec == "*":
+            start, end = low, high
+        elif "-" in spec:
+            start_text, end_text = spec.split("-", 1)
+            start, end = int(start_text), int(end_text)
+        else:
+            start = int(spec)
+            end = high if step_text else start
+        if step < 1 or not low <= start <= end <= high:
+            raise ValueError(f"'{part}' is out of range {low}-{high}")
+        values.update(range(start, end + 1, step))
+    return frozenset(values)
+
+
+class CronSchedule:
+    """
+    A five-field cron expression ("minute hour day-of-month month day-of-week", UTC).
+    Fields take *, numbers, ranges (a-b), steps (*/n, a-b/n) and comma-separated lists.
+    As in cron, when both day fields are restricted a day matching either one runs.
+    """
+
+    def __init__(self, expression: str):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron expression '{expression}' needs 5 fields, got {len(fields)}")
+        try:
+            parsed = [_parse_field(field, low, high) for field, (low, high) in zip(fields, _FIELD_RANGES)]
+        except ValueError as e:
+            raise ValueError(f"Invalid cron expression '{expression}': {e}") from None
+        self.expression = expression
+        self._minutes, self._hours, self._days, self._months, weekdays = parsed
+        self._weekdays = frozenset(day % 7 for day in weekdays)
+        self._any_day = fields[2] == "*"
+        self._any_weekday = fields[4] == "*"
+
+    def __repr__(self) -> str:
+        return f"CronSchedule({self.expression!r})"
+
+    def _day_matches(self, moment: datetime) -> bool:
+        day = moment.day in self._days
+        # datetime.weekday() counts from Monday = 0, cron from Sunday = 0
+        weekday = (moment.weekday() + 1) % 7 in self._weekdays
+        if self._any_day or self._any_weekday:
+            return day and weekday
+        return day or weekday
+
+    def next_after(self, moment: datetime) -> datetime:
+        """The first time after `moment` (an aware datetime) the schedule fires."""
+        candidate = moment.astimezone(timezone.utc).replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = candidate.year + _MAX_SEARCH_YEARS
+        while candidate.year <= limit:
+            if candidate.month not in self._months:
+                candidate = (candidate.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(candidate):
+                candidate = candidate.replace(hour=0, minute=0) + timedelta(days=1)
+            elif candidate.hour not in self._hours:
+                candidate = candidate.replace(minute=0) + timedelta(hours=1)
+            elif candidate.minute not in self._minutes:
+                candidate += timedelta(minutes=1)
+            else:
+                return candidate
+        raise ValueError(f"Cron expression '{self.expression}' never fires")
+
+
+class Job:
+    """
+    A scheduled coroutine function. Leader-only jobs run on one instance of a
+    multi-instance deployment; the others run on every worker (e.g. filling that
+    worker's in-process caches).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        schedule: CronSchedule,
+        func: Callable[[], Awaitable[Any]],
+        leader_only: bool = False,
+        timeout: Optional[float] = None,
+    ):
+        self.name = name
+        self.schedule = schedule
+        self.func = func
+        self.leader_only = leader_only
+        self.timeout = timeout
+
+
+class AdvisoryLockLeader:
+    """
+    Leader election over a Postgres session-level advisory lock. Every instance keeps
+    trying pg_try_advisory_lock(`key`) on a connection of its own; the one that gets it is
+    leader for as long as that connection lives (a heartbeat notices when it drops, and
+    Postgres releases the lock when the session ends, so another instance takes over).
+    """
+
+    def __init__(self, dsn: str, key: int, retry_seconds: float):
+        self._dsn = dsn
+        self._key = key
+        self._retry_seconds = retry_seconds
+        self._is_leader = False
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def is_leader(self) -> bool:
+        return self._is_leader
+
+    def start(self) -> None:
+        if self._task is None:
+            if uses_pgbouncer(make_url(self._dsn)):
+                logger.warning("SCHEDULER_LEADER_DSN looks like a transaction pooler; advisory locks need a direct connection.")
+            self._task = asyncio.create_task(self._run(), name="scheduler-leader")
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def _set_leader(self, is_leader: bool) -> None:
+        self._is_leader = is_leader
+        SCHEDULER_LEADER.set(1 if is_leader else 0)
+
+    async def _run(self) -> None:
+        import asyncpg
+
+        while True:
+            connection = None
+            try:
+                connection = await asyncpg.connect(self._dsn)
+                while not await connection.fetchval("SELECT pg_try_advisory_lock($1)", self._key):
+                    await asyncio.sleep(self._retry_seconds)
+                self._set_leader(True)
+                logger.info("This instance is now the scheduler leader.")
+                while True:
+                    await asyncio.sleep(self._retry_seconds)
+                    await asyncio.wait_for(connection.fetchval("SELECT 1"), self._retry_seconds)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Scheduler leader election connection failed: {e}")
+            finally:
+                if self._is_leader:
+                    logger.warning("This instance is no longer the scheduler leader.")
+                self._set_leader(False)
+                # Ending the session releases the lock
+                if connection is not None and not connection.is_closed():
+                    connection.terminate()
+            await asyncio.sleep(self._retry_seconds)
+
+
+class Scheduler:
+    """
+    Runs each job at its schedule's times, plus a random delay of up to `jitter`
+    seconds so instances and workers don't all call upstreams in the same second.
+    A job never overlaps itself: a run that overruns delays the job's next one.
+    Without a `leader`, this process is taken to be the only instance.
+    """
+
+    def __init__(self, jobs: List[Job], leader: Optional[AdvisoryLockLeader], jitter: float):
+        self._jobs = jobs
+        self._leader = leader
+        self._jitter = jitter
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    @property
+    def is_leader(self) -> bool:
+        return self._leader is None or self._leader.is_leader
+
+    def start(self) -> None:
+        if self._tasks:
+            return
+        if self._leader is not None:
+            self._leader.start()
+        else:
+            SCHEDULER_LEADER.set(1)
+        for job in self._jobs:
+            self._tasks[job.name] = asyncio.create_task(self._loop(job), name=f"job-{job.name}")
+        logger.info(f"Scheduler started: {', '.join(f'{job.name} ({job.schedule.expression})' for job in self._jobs) or 'no jobs'}.")
+
+    async def stop(self) -> None:
+        tasks, self._tasks = list(self._tasks.values()), {}
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if self._leader is not None:
+            await self._leader.stop()
+
+    async def _loop(self, job: Job) -> None:
+        while True:
+            now = datetime.now(timezone.utc)
+            delay = (job.schedule.next_after(now) - now).total_seconds() + random.uniform(0, self._jitter)
+            await asyncio.sleep(delay)
+            await self.run(job)
+
+    async def run(self, job: Job) -> None:
+        """Runs `job` once (unless it is leader-only and this instance isn't leader), recording the outcome."""
+        if job.leader_only and not self.is_leader:
+            return
+        started = time.perf_counter()
+        outcome = "success"
+        try:
+            await asyncio.wait_for(job.func(), job.timeout)
+        except asyncio.TimeoutError:
+            outcome = "timeout"
+            logger.warning(f"Job {job.name} timed out after {job.timeout:g}s.")
+        except Exception as e:
+            outcome = "error"
+            logger.error(f"Job {job.name} failed: {e}", exc_info=True)
+        duration = time.perf_counter() - started
+        SCHEDULER_JOB_RUNS.labels(job.name, outcome).inc()
+        SCHEDULER_JOB_DURATION.labels(job.name).observe(duration)
+        if outcome == "success":
+            SCHEDULER_JOB_LAST_SUCCESS.labels(job.name).set_to_current_time()
+            logger.debug(f"Job {job.name} finished in {duration:.2f}s.")
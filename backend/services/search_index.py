@@ -0,0 +1,157 @@
+import math
+import re
+import unicodedata
+from bisect import bisect_left, insort
+from typing import Any, Dict, List, Optional
+
+_TOKEN = re.compile(r"\w+")
+
+# Term frequencies are weighted by the field they occur in (a simple BM25F)
+FIELD_WEIGHTS = {"name": 3.0, "sku": 2.5, "category": 1.5, "description": 1.0}
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Typeahead: the last query word also matches longer terms, at most this many, scored a bit lower
+MAX_PREFIX_EXPANSIONS = 64
+PREFIX_MATCH_WEIGHT = 0.8
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased word tokens with accents stripped ("Crème" -> "creme")."""
+    if text.isascii():
+        return _TOKEN.findall(text.lower())
+    decomposed = unicodedata.normalize("NFKD", text)
+    return _TOKEN.findall("".join(c for c in decomposed if not unicodedata.combining(c)).lower())
+
+
+def portable_text_to_plain(value: Any) -> str:
+    """Flattens Sanity Portable Text (blocks of spans) to plain text; strings pass through."""
+    if value is None:
+        return ""
+    if isinstance(value, str):
+        return value
+    if isinstance(value, list):
+        return " ".join(filter(None, (portable_text_to_plain(item) for item in value)))
+    if isinstance(value, dict):
+        if "children" in value:
+            return portable_text_to_plain(value["children"])
+        text = value.get("text")
+        return text if isinstance(text, str) else ""
+    return ""
+
+
+class ProductSearchIndex:
+    """
+    Inverted index over product fields with BM25 ranking. Documents are added, replaced
+    and removed one at a time, so webhook updates don't need a rebuild. Every query
+    word must match; the last one also matches as a prefix for typeahead.
+    """
+
+    def __init__(self):
+        self._postings: Dict[str, Dict[str, float]] = {}
+        self._doc_terms: Dict[str, Dict[str, float]] = {}
+        self._doc_lengths: Dict[str, float] = {}
+        self._total_length = 0.0
+        # Sorted vocabulary for prefix lookups. Built on the first search, so a bulk
+        # build doesn't pay for a sorted insert per new term; maintained incrementally after.
+        self._terms: Optional[List[str]] = None
+
+    def __len__(self) -> int:
+        return len(self._doc_terms)
+
+    def add(self, doc_id: str, fields: Dict[str, str]) -> None:
+        """Indexes (or re-indexes) a document from its text fields, named as in FIELD_WEIGHTS."""
+        self.remove(doc_id)
+        frequencies: Dict[str, float] = {}
+        length = 0.0
+        for field, text in fields.items():
+            weight = FIELD_WEIGHTS.get(field, 1.0)
+            for token in tokenize(text or ""):
+                frequencies[token] = frequencies.get(token, 0.0) + weight
+                length += weight
+        self._doc_terms[doc_id] = frequencies
+        self._doc_lengths[doc_id] = length
+        self._total_length += length
+        for term, frequency in frequencies.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = {}
+                if self._terms is not None:
+                    insort(self._terms, term)
+            postings[doc_id] = frequency
+
+    def remove(self, doc_id: str) -> None:
+        frequencies = self._doc_terms.pop(doc_id, None)
+        if frequencies is None:
+            return
+        self._total_length -= self._doc_lengths.pop(doc_id)
+        for term in frequencies:
+            postings = self._postings[term]
+            del postings[doc_id]
+            if not postings:
+                del self._postings[term]
+                if self._terms is not None:
+                    del self._terms[bisect_left(self._terms, term)]
+
+    def _expand_prefix(self, prefix: str) -> List[str]:
+        # An exact match sorts first, so it is never crowded out by longer terms
+        if self._terms is None:
+            self._terms = sorted(self._postings)
+        vocabulary = self._terms
+        terms = []
+        position = bisect_left(vocabulary, prefix)
+        while position < len(vocabulary) and len(terms) < MAX_PREFIX_EXPANSIONS:
+            term = vocabulary[position]
+            if not term.startswith(prefix):
+                break
+            terms.append(term)
+            position += 1
+        return terms
+
+    def search(self, query: str, prefix: bool = True) -> Dict[str, float]:
+        """BM25 scores of the documents matching every word of `query`, by doc ID."""
+        tokens = tokenize(query)
+        if not tokens or not self._doc_terms:
+            return {}
+        doc_count = len(self._doc_terms)
+        average_length = self._total_length / doc_count or 1.0
+
+        token_terms = []
+        for position, token in enumerate(tokens):
+            if prefix and position == len(tokens) - 1:
+                terms = self._expand_prefix(token)
+            else:
+                terms = [token] if token in self._postings else []
+            if not terms:
+                return {}
+            token_terms.append((sum(len(self._postings[term]) for term in terms), token, terms))
+        # Rarest word first: later words only score the documents still in the running
+        token_terms.sort(key=lambda entry: entry[0])
+
+        scores: Optional[Dict[str, float]] = None
+        for _, token, terms in token_terms:
+            token_scores: Dict[str, float] = {}
+            for term in terms:
+                postings = self._postings[term]
+                idf = math.log(1 + (doc_count - len(postings) + 0.5) / (len(postings) + 0.5))
+                if term != token:
+                    idf *= PREFIX_MATCH_WEIGHT
+                if scores is not None and len(scores) < len(postings):
+                    candidates = ((doc_id, postings[doc_id]) for doc_id in scores if doc_id in postings)
+                else:
+                    candidates = postings.items()
+                for doc_id, frequency in candidates:
+                    if scores is not None and doc_id not in scores:
+                        continue
+                    length_norm = 1 - BM25_B + BM25_B * self._doc_lengths[doc_id] / average_length
+                    score = idf * frequency * (BM25_K1 + 1) / (frequency + BM25_K1 * length_norm)
+                    # A word matched through several expansions counts once, by its best term
+                    if score > token_scores.get(doc_id, 0.0):
+                        token_scores[doc_id] = score
+
+            if scores is None:
+                scores = token_scores
+            else:
+                scores = {doc_id: score + token_scores[doc_id] for doc_id, score in scores.items() if doc_id in token_scores}
+            if not scores:
+                return {}
+        return scores
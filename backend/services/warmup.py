@@ -0,0 +1,140 @@
+import asyncio
+import logging
+import math
+import time
+from typing import Any, Dict, List, Optional
+from sqlalchemy import text
+from config.settings import settings
+from database.db import async_engine
+from services.catalog_store import catalog_store
+from services.sanity_service import (
+    fetch_categories, fetch_content_blocks, fetch_featured_products, fetch_homepage_section, fetch_homepage_sections,
+    seed_sanity_cache,
+)
+
+logger = logging.getLogger("main")
+
+
+async def prefill_connection_pool() -> int:
+    """Opens up to pool_size connections at once so the first requests skip TCP/TLS/auth setup."""
+    pool_size = async_engine.pool.size() if hasattr(async_engine.pool, "size") else 1
+
+    async def touch():
+        async with async_engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+
+    results = await asyncio.gather(*(touch() for _ in range(pool_size)), return_exceptions=True)
+    return sum(1 for r in results if not isinstance(r, Exception))
+
+
+async def preload_catalog() -> None:
+    """Fills the Sanity query cache with what the storefront's landing pages ask for first."""
+    await asyncio.gather(
+        fetch_categories(),
+        fetch_content_blocks(),
+        fetch_featured_products(),
+        catalog_store.ensure_loaded(),  # also caches fetch_all_products()
+    )
+
+
+async def warm_up() -> None:
+    """
+    Background warm-up, started by lifespan when WARMUP_ON_START is set. Waits
+    WARMUP_DELAY_SECONDS so uvicorn finishes startup and binds the port first; the
+    warm-up then competes with real traffic instead of delaying it.
+    """
+    await asyncio.sleep(settings.WARMUP_DELAY_SECONDS)
+    started = time.perf_counter()
+    try:
+        connections, _ = await asyncio.gather(prefill_connection_pool(), preload_catalog())
+        logger.info(f"Warm-up finished in {time.perf_counter() - started:.2f}s ({connections} pooled connections).")
+    except Exception as e:
+        logger.warning(f"Warm-up failed after {time.perf_counter() - started:.2f}s: {e}")
+
+
+# --- Warm start from the persisted catalog (CATALOG_WARM_START_PATH) ---
+
+WARM_START_RETRY_MAX_SECONDS = 60.0
+
+# The content restore_warm_start() loaded, replaced by each revalidation: what the content
+# routes serve while Sanity doesn't answer, whether or not the query cache is on
+_fallback_content: Dict[str, Any] = {}
+
+
+def fallback_content(key: str) -> List[Dict[str, Any]]:
+    """The persisted "categories", "contentBlocks" or "homepageSections"; empty without a warm start."""
+    return _fallback_content.get(key) or []
+
+
+def fallback_homepage_section(slug: str) -> Optional[Dict[str, Any]]:
+    """The persisted homepage section `slug`, shaped like fetch_homepage_section()'s result."""
+    for section in fallback_content("homepageSections"):
+        if section.get("slug") == slug:
+            return {key: value for key, value in section.items() if key != "slug"}
+    return None
+
+
+async def fetch_warm_start_content(fresh: bool = False) -> Optional[Dict[str, Any]]:
+    """
+    The Sanity content persisted with the catalog: categories, content blocks and homepage
+    sections. `fresh` bypasses the query cache. None when Sanity didn't answer.
+    """
+    fetchers = (fetch_categories, fetch_content_blocks, fetch_homepage_sections)
+    if fresh:
+        fetchers = tuple(fetcher.__wrapped__ for fetcher in fetchers)
+    categories, content_blocks, homepage_sections = await asyncio.gather(*(fetcher() for fetcher in fetchers))
+    if not categories:
+        return None
+    return {"categories": categories, "contentBlocks": content_blocks or [], "homepageSections": homepage_sections or []}
+
+
+def _seed_content(content: Dict[str, Any], ttl: Optional[float] = None) -> None:
+    if content.get("categories"):
+        seed_sanity_cache(fetch_categories, (), content["categories"], ttl)
+    if content.get("contentBlocks"):
+        seed_sanity_cache(fetch_content_blocks, (), content["contentBlocks"], ttl)
+    sections = content.get("homepageSections") or []
+    if sections:
+        seed_sanity_cache(fetch_homepage_sections, (), sections, ttl)
+    for section in sections:
+        if section.get("slug"):
+            fields = {key: value for key, value in section.items() if key != "slug"}
+            seed_sanity_cache(fetch_homepage_section, (section["slug"],), fields, ttl)
+
+
+async def restore_warm_start() -> bool:
+    """
+    Loads the persisted catalog into catalog_store and its content into the fallback the
+    content routes serve when Sanity fails (and, when the Sanity query cache is on, into
+    the cache), where it stays until revalidate_warm_start() replaces it. Called by
+    lifespan before the app takes traffic.
+    """
+    started = time.perf_counter()
+    content = await catalog_store.load_persisted()
+    if content is None:
+        logger.info("No persisted catalog to warm-start from.")
+        return False
+    _fallback_content.update(content)
+    _seed_content(content, ttl=math.inf)
+    logger.info(f"Warm start from the persisted catalog took {time.perf_counter() - started:.2f}s.")
+    return True
+
+
+async def revalidate_warm_start() -> None:
+    """
+    Replaces what restore_warm_start() loaded with fresh Sanity data, retrying with backoff
+    while Sanity is unreachable. Each successful catalog refresh persists the next snapshot.
+    """
+    delay = 1.0
+    while True:
+        # The restored catalog is marked stale, so this refreshes it in the background
+        await catalog_store.ensure_loaded()
+        content = await fetch_warm_start_content(fresh=True)
+        if content is not None:
+            _fallback_content.update(content)
+            _seed_content(content)
+            logger.info("Revalidated the warm-start content against Sanity.")
+            return
+        logger.warning(f"Sanity content unavailable; serving the persisted copy, retrying in {delay:.0f}s.")
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, WARM_START_RETRY_MAX_SECONDS)
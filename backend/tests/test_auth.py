@@ -0,0 +1,213 @@
+import time
+import httpx
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from fastapi import HTTPException
+from jose import jwk, jwt as jose_jwt
+from starlette.requests import Request
+import services.auth_service as auth_service
+from services.auth_service import UNKNOWN_KID_REFETCH_SECONDS, ClerkAuthenticator, VerifiedClaimsCache
+
+ISSUER = "https://clerk.test"
+JWKS_URL = f"{ISSUER}/.well-known/jwks.json"
+SUPABASE_SECRET = "supabase-jwt-secret"
+
+
+def make_signing_key():
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    return key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    ).decode()
+
+
+class JWKSServer:
+    """Clerk's JWKS endpoint for httpx.MockTransport, serving the public halves of `keys` by kid."""
+
+    def __init__(self, keys):
+        self.keys = keys
+        self.requests = 0
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.requests += 1
+        public_keys = []
+        for kid, private_pem in self.keys.items():
+            public = jwk.construct(private_pem, "RS256").public_key().to_dict()
+            public_keys.append({**public, "kid": kid, "alg": "RS256", "use": "sig"})
+        return httpx.Response(200, json={"keys": public_keys})
+
+
+class FakeHTTPClients:
+    def __init__(self, server: JWKSServer):
+        self._client = httpx.AsyncClient(transport=httpx.MockTransport(server))
+
+    def client(self, upstream, name="default", **options):
+        return self._client
+
+
+def claims(**overrides):
+    return {"sub": "user_1", "iss": ISSUER, "exp": int(time.time()) + 300, **overrides}
+
+
+def rs256_token(private_pem: str, kid: str, **overrides) -> str:
+    return jose_jwt.encode(claims(**overrides), private_pem, algorithm="RS256", headers={"kid": kid})
+
+
+def hs256_token(secret: str = SUPABASE_SECRET, **overrides) -> str:
+    return jose_jwt.encode(claims(**overrides), secret, algorithm="HS256")
+
+
+def make_authenticator(jwks_url=JWKS_URL, supabase_jwt_secret=SUPABASE_SECRET, allow_unverified=False):
+    return ClerkAuthenticator(
+        jwks_url=jwks_url, issuer=ISSUER, supabase_jwt_secret=supabase_jwt_secret,
+        allow_unverified=allow_unverified, claims_cache_size=16, refresh_seconds=3600,
+    )
+
+
+@pytest.fixture
+def signing_key():
+    return make_signing_key()
+
+
+@pytest.fixture
+def jwks(monkeypatch, signing_key):
+    server = JWKSServer({"key-1": signing_key})
+    monkeypatch.setattr(auth_service, "http_clients", FakeHTTPClients(server))
+    return server
+
+
+async def assert_rejected(authenticator: ClerkAuthenticator, token: str):
+    with pytest.raises(HTTPException) as error:
+        await authenticator.verify(token)
+    assert error.value.status_code == 401
+
+
+@pytest.mark.asyncio
+async def test_rs256_token_is_verified_against_the_jwks(jwks, signing_key):
+    verified = await make_authenticator().verify(rs256_token(signing_key, "key-1"))
+
+    assert verified["sub"] == "user_1"
+    assert jwks.requests == 1
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("overrides", [{"iss": "https://evil.test"}, {"exp": int(time.time()) - 60}])
+async def test_rs256_token_with_wrong_issuer_or_expired_is_rejected(jwks, signing_key, overrides):
+    await assert_rejected(make_authenticator(), rs256_token(signing_key, "key-1", **overrides))
+
+
+@pytest.mark.asyncio
+async def test_rs256_token_signed_by_another_key_is_rejected(jwks):
+    await assert_rejected(make_authenticator(), rs256_token(make_signing_key(), "key-1"))
+
+
+@pytest.mark.asyncio
+async def test_hs256_token_is_verified_with_the_supabase_secret(jwks):
+    authenticator = make_authenticator()
+
+    verified = await authenticator.verify(hs256_token())
+
+    assert verified["sub"] == "user_1"
+    assert jwks.requests == 0
+    await assert_rejected(authenticator, hs256_token(secret="another-secret"))
+
+
+@pytest.mark.asyncio
+async def test_unknown_kid_refetches_the_jwks_at_most_once_per_interval(jwks, signing_key):
+    authenticator = make_authenticator()
+    await authenticator.verify(rs256_token(signing_key, "key-1"))
+    rotated = make_signing_key()
+    jwks.keys["key-2"] = rotated
+
+    # Fetched just now: an unknown kid doesn't refetch yet
+    await assert_rejected(authenticator, rs256_token(rotated, "key-2"))
+    await assert_rejected(authenticator, rs256_token(rotated, "key-3"))
+    assert jwks.requests == 1
+
+    authenticator._jwks._fetched_at -= UNKNOWN_KID_REFETCH_SECONDS
+    verified = await authenticator.verify(rs256_token(rotated, "key-2"))
+    await assert_rejected(authenticator, rs256_token(rotated, "key-3"))
+
+    assert verified["sub"] == "user_1"
+    assert jwks.requests == 2
+
+
+@pytest.mark.asyncio
+async def test_tokens_without_a_configured_verifier_are_rejected_outside_dev(signing_key):
+    authenticator = make_authenticator(jwks_url=None, supabase_jwt_secret=None)
+
+    await assert_rejected(authenticator, hs256_token())
+    await assert_rejected(authenticator, rs256_token(signing_key, "key-1"))
+
+
+@pytest.mark.asyncio
+async def test_dev_reads_claims_without_a_configured_verifier(signing_key):
+    authenticator = make_authenticator(jwks_url=None, supabase_jwt_secret=None, allow_unverified=True)
+
+    verified = await authenticator.verify(hs256_token(secret="whatever"))
+
+    assert verified["sub"] == "user_1"
+
+
+@pytest.mark.asyncio
+async def test_verified_claims_are_cached(jwks, signing_key):
+    authenticator = make_authenticator()
+    token = rs256_token(signing_key, "key-1")
+    await authenticator.verify(token)
+    jwks.keys.clear()
+    authenticator._jwks._keys.clear()
+
+    verified = await authenticator.verify(token)
+
+    assert verified["sub"] == "user_1"
+
+
+def test_claims_cache_entries_expire_at_exp():
+    cache = VerifiedClaimsCache(max_entries=16)
+    cache.put("live", claims(exp=time.time() + 60))
+    cache.put("expired", claims(exp=time.time() - 1))
+    cache.put("no-exp", {"sub": "user_1"})
+
+    assert cache.get("live")["sub"] == "user_1"
+    assert cache.get("expired") is None
+    assert cache.get("no-exp") is None
+
+
+def test_claims_cache_evicts_the_least_recently_used():
+    cache = VerifiedClaimsCache(max_entries=2)
+    cache.put("a", claims())
+    cache.put("b", claims())
+    cache.get("a")
+    cache.put("c", claims())
+
+    assert cache.get("a") is not None
+    assert cache.get("b") is None
+
+
+class CountingAuthenticator:
+    def __init__(self):
+        self.calls = 0
+
+    async def verify(self, token):
+        self.calls += 1
+        return claims()
+
+
+@pytest.mark.asyncio
+async def test_claims_are_memoized_on_the_request(monkeypatch):
+    authenticator = CountingAuthenticator()
+    monkeypatch.setattr(auth_service, "clerk_auth", authenticator)
+    request = Request({"type": "http", "headers": [(b"authorization", b"Bearer token")]})
+
+    assert await auth_service.get_current_user_id(request) == "user_1"
+    assert await auth_service.get_current_claims(request) is request.state.auth_claims
+
+    assert authenticator.calls == 1
+
+
+@pytest.mark.asyncio
+async def test_missing_bearer_token_is_rejected():
+    with pytest.raises(HTTPException) as error:
+        await auth_service.get_current_claims(Request({"type": "http", "headers": []}))
+
+    assert error.value.status_code == 401
@@ -0,0 +1,156 @@
+import numpy as np
+import pytest
+from services.catalog_columns import CatalogColumns
+from services.catalog_snapshot import CatalogSnapshot, SnapshotProducts, read_snapshot_header, write_snapshot
+
+MUGS = {"_id": "category-mugs", "title": "Mugs", "slug": "mugs"}
+TEAS = {"_id": "category-teas", "title": "Thés", "slug": "teas"}
+PRODUCTS = [
+    {"_id": "product-a", "name": "Blue mug", "price": 12.5, "stock": 3, "category": MUGS},
+    {"_id": "product-b", "name": "Green tea", "price": 4.0, "stock": 0, "category": TEAS},
+    {"_id": "product-c", "name": "Gift card", "price": None, "stock": 10, "category": None},
+    {"_id": "product-d", "name": "Red mug ☕", "price": 15.0, "stock": 1, "category": MUGS},
+]
+CONTENT = {"categories": [MUGS, TEAS], "contentBlocks": [], "homepageSections": [{"slug": "hero", "title": "Héro"}]}
+
+
+@pytest.fixture
+def snapshot_path(tmp_path):
+    path = str(tmp_path / "catalog.snapshot")
+    write_snapshot(path, PRODUCTS, 7, CONTENT)
+    return path
+
+
+def snapshot_of(path, products, version):
+    write_snapshot(path, list(products), version)
+    return CatalogSnapshot(path)
+
+
+def test_header_round_trips(snapshot_path):
+    header = read_snapshot_header(snapshot_path)
+
+    assert (header.version, header.count) == (7, len(PRODUCTS))
+    assert CatalogSnapshot(snapshot_path).header == header
+
+
+def test_missing_or_foreign_file_has_no_header(tmp_path):
+    foreign = tmp_path / "foreign"
+    foreign.write_bytes(b"not a snapshot" * 10)
+
+    assert read_snapshot_header(str(tmp_path / "missing")) is None
+    assert read_snapshot_header(str(foreign)) is None
+    with pytest.raises(ValueError):
+        CatalogSnapshot(str(foreign))
+
+
+def test_records_round_trip(snapshot_path):
+    snapshot = CatalogSnapshot(snapshot_path)
+
+    assert len(snapshot) == len(PRODUCTS)
+    assert snapshot.ids == [product["_id"] for product in PRODUCTS]
+    assert [snapshot.record(row) for row in range(len(snapshot))] == PRODUCTS
+
+
+def test_columns_match_the_ones_built_from_the_products(snapshot_path):
+    mapped = CatalogSnapshot(snapshot_path).columns()
+    built = CatalogColumns(PRODUCTS)
+
+    assert mapped.category_slugs == built.category_slugs == ["mugs", "teas"]
+    assert mapped.category_titles == built.category_titles
+    assert np.array_equal(mapped.category_codes, built.category_codes)
+    assert np.array_equal(mapped.prices, built.prices, equal_nan=True)
+    assert np.array_equal(mapped.in_stock, built.in_stock)
+    assert mapped.facets(None, None, None, [0, 10]) == built.facets(None, None, None, [0, 10])
+
+
+def test_content_round_trips(snapshot_path, tmp_path):
+    without_content = str(tmp_path / "bare.snapshot")
+    write_snapshot(without_content, PRODUCTS, 1)
+
+    assert CatalogSnapshot(snapshot_path).content() == CONTENT
+    assert CatalogSnapshot(without_content).content() is None
+
+
+def test_empty_catalog_round_trips(tmp_path):
+    path = str(tmp_path / "empty.snapshot")
+    write_snapshot(path, [], 1)
+
+    snapshot = CatalogSnapshot(path)
+    assert len(snapshot) == 0 and dict(SnapshotProducts(snapshot)) == {}
+
+
+def test_overlay_sets_deletes_and_re_adds(snapshot_path):
+    products = SnapshotProducts(CatalogSnapshot(snapshot_path))
+    assert not products.modified
+
+    updated = {**PRODUCTS[0], "price": 10.0}
+    added = {"_id": "product-e", "name": "Teapot", "price": 30.0, "stock": 2, "category": TEAS}
+    products["product-a"] = updated
+    products["product-e"] = added
+    del products["product-b"]
+
+    assert products.modified
+    assert products["product-a"] is updated
+    assert "product-b" not in products
+    with pytest.raises(KeyError):
+        products["product-b"]
+    with pytest.raises(KeyError):
+        del products["product-b"]
+    assert set(products) == {"product-a", "product-c", "product-d", "product-e"}
+    assert len(products) == 4
+    assert products.changes() == {"product-a": updated, "product-b": None, "product-e": added}
+
+    products["product-b"] = PRODUCTS[1]
+    del products["product-e"]
+
+    assert products["product-b"] == PRODUCTS[1]
+    assert "product-e" not in products
+    assert len(products) == 4
+    with pytest.raises(KeyError):
+        del products["product-missing"]
+
+
+def test_copy_is_independent(snapshot_path):
+    products = SnapshotProducts(CatalogSnapshot(snapshot_path))
+    copied = products.copy()
+
+    del products["product-a"]
+
+    assert "product-a" in copied and not copied.modified
+
+
+def test_rebase_keeps_only_changes_made_after_the_write(snapshot_path):
+    products = SnapshotProducts(CatalogSnapshot(snapshot_path))
+    # Before the write: update a, delete b, add e, update c
+    products["product-a"] = {**PRODUCTS[0], "price": 10.0}
+    del products["product-b"]
+    products["product-e"] = {"_id": "product-e", "name": "Teapot", "price": 30.0, "stock": 2, "category": TEAS}
+    products["product-c"] = {**PRODUCTS[2], "stock": 9}
+    written = products.copy()
+    snapshot = snapshot_of(snapshot_path, written.values(), 8)
+    # After the write: re-add b, delete d, change c again, delete e
+    readded = {**PRODUCTS[1], "stock": 5}
+    products["product-b"] = readded
+    del products["product-d"]
+    changed_again = {**PRODUCTS[2], "stock": 8}
+    products["product-c"] = changed_again
+    del products["product-e"]
+
+    rebased = products.rebased(snapshot, written)
+
+    assert dict(rebased) == dict(products)
+    assert rebased.changes() == {
+        "product-b": readded, "product-c": changed_again, "product-d": None, "product-e": None,
+    }
+
+
+def test_rebase_without_later_changes_leaves_an_empty_overlay(snapshot_path):
+    products = SnapshotProducts(CatalogSnapshot(snapshot_path))
+    products["product-a"] = {**PRODUCTS[0], "price": 10.0}
+    del products["product-b"]
+    written = products.copy()
+
+    rebased = products.rebased(snapshot_of(snapshot_path, written.values(), 8), written)
+
+    assert not rebased.modified
+    assert dict(rebased) == dict(products)
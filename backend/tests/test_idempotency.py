@@ -0,0 +1,60 @@
+import json
+import pytest
+import pytest_asyncio
+from fastapi import HTTPException
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
+from starlette.requests import Request
+from database.migrations import upgrade
+from services.idempotency_service import IdempotentRequest
+
+
+def make_request(body: dict, path: str = "/checkout") -> Request:
+    payload = json.dumps(body).encode()
+
+    async def receive():
+        return {"type": "http.request", "body": payload, "more_body": False}
+
+    return Request({"type": "http", "method": "POST", "path": path, "headers": [], "query_string": b""}, receive)
+
+
+@pytest_asyncio.fixture
+async def session(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'idempotency.db'}")
+    await upgrade(engine)
+    async with AsyncSession(engine, expire_on_commit=False) as session:
+        yield session
+    await engine.dispose()
+
+
+async def run(session, request: Request, body: dict):
+    async with IdempotentRequest(session, "key-1", "user-1", "checkout", request) as idem:
+        if idem.replay:
+            return idem.replay
+        return await idem.complete(body)
+
+
+@pytest.mark.asyncio
+async def test_same_request_replays_the_stored_response(session):
+    address = {"shipping_address": "1 Main St"}
+
+    first = await run(session, make_request(address), {"order_id": "order-1"})
+    second = await run(session, make_request(address), {"order_id": "order-2"})
+
+    assert first == {"order_id": "order-1"}
+    assert json.loads(second.body) == {"order_id": "order-1"}
+    assert second.headers["Idempotent-Replayed"] == "true"
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("body, path", [
+    ({"shipping_address": "2 Other St"}, "/checkout"),
+    ({"shipping_address": "1 Main St"}, "/api/orders/create"),
+])
+async def test_key_reused_for_another_request_is_refused(session, body, path):
+    await run(session, make_request({"shipping_address": "1 Main St"}), {"order_id": "order-1"})
+
+    with pytest.raises(HTTPException) as error:
+        await run(session, make_request(body, path), {"order_id": "order-2"})
+
+    assert error.value.status_code == 422
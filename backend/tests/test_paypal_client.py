@@ -0,0 +1,122 @@
+import asyncio
+import httpx
+import pytest
+import services.paypal_service as paypal_service
+import services.paypal_webhook_verifier as paypal_webhook_verifier
+from services.paypal_service import PayPalAPIError, PayPalClient
+
+
+class PayPalStandIn:
+    """
+    A local PayPal for httpx.MockTransport: hands out numbered access tokens, counts
+    token requests, and answers 401 to the first `revoke` API calls.
+    """
+
+    def __init__(self, expires_in: float = 3600, revoke: int = 0, token_delay: float = 0.0):
+        self.expires_in = expires_in
+        self.revoke = revoke
+        self.token_delay = token_delay
+        self.token_calls = 0
+        self.api_calls = []
+
+    async def __call__(self, request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/v1/oauth2/token":
+            self.token_calls += 1
+            await asyncio.sleep(self.token_delay)
+            return httpx.Response(200, json={"access_token": f"token-{self.token_calls}", "expires_in": self.expires_in})
+        self.api_calls.append(request.headers["Authorization"])
+        if self.revoke:
+            self.revoke -= 1
+            return httpx.Response(401, json={"name": "AUTHENTICATION_FAILURE"})
+        return httpx.Response(201, json={"id": "ORDER-1", "status": "CREATED"})
+
+
+def make_client(standin: PayPalStandIn, token_refresh_margin: float = 60.0) -> PayPalClient:
+    return PayPalClient(
+        "client-id", "client-secret", "https://paypal.test",
+        token_refresh_margin=token_refresh_margin, transport=httpx.MockTransport(standin),
+    )
+
+
+@pytest.mark.asyncio
+async def test_access_token_is_cached():
+    standin = PayPalStandIn()
+    client = make_client(standin)
+
+    await client.create_order({})
+    await client.create_order({})
+
+    assert standin.token_calls == 1
+    assert standin.api_calls == ["Bearer token-1", "Bearer token-1"]
+
+
+@pytest.mark.asyncio
+async def test_token_within_refresh_margin_is_refetched():
+    standin = PayPalStandIn(expires_in=30)
+    client = make_client(standin, token_refresh_margin=60)
+
+    await client.create_order({})
+    await client.create_order({})
+
+    assert standin.token_calls == 2
+
+
+@pytest.mark.asyncio
+async def test_concurrent_callers_share_one_refresh():
+    standin = PayPalStandIn(token_delay=0.05)
+    client = make_client(standin)
+
+    tokens = await asyncio.gather(*(client.get_access_token() for _ in range(20)))
+
+    assert standin.token_calls == 1
+    assert set(tokens) == {"token-1"}
+
+
+@pytest.mark.asyncio
+async def test_concurrent_forced_refreshes_share_one_refresh():
+    standin = PayPalStandIn(token_delay=0.05)
+    client = make_client(standin)
+    await client.get_access_token()
+
+    tokens = await asyncio.gather(*(client.get_access_token(force_refresh=True) for _ in range(20)))
+
+    assert standin.token_calls == 2
+    assert set(tokens) == {"token-2"}
+
+
+@pytest.mark.asyncio
+async def test_401_refreshes_the_token_and_retries_once():
+    standin = PayPalStandIn(revoke=1)
+    client = make_client(standin)
+
+    order = await client.create_order({})
+
+    assert order == {"id": "ORDER-1", "status": "CREATED"}
+    assert standin.token_calls == 2
+    assert standin.api_calls == ["Bearer token-1", "Bearer token-2"]
+
+
+@pytest.mark.asyncio
+async def test_second_401_is_raised():
+    standin = PayPalStandIn(revoke=2)
+    client = make_client(standin)
+
+    with pytest.raises(PayPalAPIError) as error:
+        await client.create_order({})
+
+    assert error.value.status_code == 401
+    assert len(standin.api_calls) == 2
+
+
+def test_close_paypal_clients_drops_the_singletons(monkeypatch):
+    monkeypatch.setattr(paypal_service.settings, "PAYPAL_CLIENT_ID", "client-id")
+    monkeypatch.setattr(paypal_service.settings, "PAYPAL_CLIENT_SECRET", "client-secret")
+    monkeypatch.setattr(paypal_webhook_verifier.settings, "PAYPAL_WEBHOOK_ID", "WH-TEST")
+    client = paypal_service.get_paypal_client()
+    verifier = paypal_webhook_verifier.get_paypal_webhook_verifier()
+
+    paypal_service.close_paypal_clients()
+
+    assert paypal_service.get_paypal_client() is not client
+    assert paypal_webhook_verifier.get_paypal_webhook_verifier() is not verifier
+    paypal_service.close_paypal_clients()
@@ -0,0 +1,218 @@
+import base64
+import zlib
+from datetime import datetime, timedelta, timezone
+import httpx
+import pytest
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import padding, rsa
+from cryptography.x509.oid import ExtendedKeyUsageOID, NameOID
+from cryptography.x509.verification import Store
+import services.paypal_webhook_verifier as verifier_module
+from services.paypal_webhook_verifier import PayPalWebhookVerifier, WebhookVerificationError
+
+WEBHOOK_ID = "WH-TEST"
+CERT_URL = "https://api.sandbox.paypal.com/v1/notifications/certs/CERT-1234abcd"
+SIGNING_NAME = "messageverificationcerts.sandbox.paypal.com"
+BODY = b'{"id": "WH-EVENT-1", "event_type": "PAYMENT.CAPTURE.COMPLETED"}'
+
+
+def make_key():
+    return rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+
+def make_cert(subject: str, key, issuer: str, issuer_key, ca: bool) -> x509.Certificate:
+    now = datetime.now(timezone.utc)
+    builder = (
+        x509.CertificateBuilder()
+        .subject_name(x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, subject)]))
+        .issuer_name(x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, issuer)]))
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - timedelta(days=1))
+        .not_valid_after(now + timedelta(days=30))
+        .add_extension(x509.BasicConstraints(ca=ca, path_length=0 if ca and subject != issuer else None), critical=True)
+        .add_extension(x509.SubjectKeyIdentifier.from_public_key(key.public_key()), critical=False)
+        .add_extension(x509.AuthorityKeyIdentifier.from_issuer_public_key(issuer_key.public_key()), critical=False)
+    )
+    if ca:
+        builder = builder.add_extension(
+            x509.KeyUsage(False, False, False, False, False, True, True, False, False), critical=True
+        )
+    else:
+        builder = (
+            builder
+            .add_extension(x509.KeyUsage(True, False, True, False, False, False, False, False, False), critical=True)
+            .add_extension(x509.ExtendedKeyUsage([ExtendedKeyUsageOID.SERVER_AUTH]), critical=False)
+            .add_extension(x509.SubjectAlternativeName([x509.DNSName(subject)]), critical=False)
+        )
+    return builder.sign(issuer_key, hashes.SHA256())
+
+
+class PKI:
+    """A test root and intermediate, and PayPal-style signing leaves issued through them."""
+
+    def __init__(self):
+        self.root_key, self.intermediate_key, self.leaf_key = make_key(), make_key(), make_key()
+        self.root = make_cert("Test Root", self.root_key, "Test Root", self.root_key, ca=True)
+        self.intermediate = make_cert("Test Intermediate", self.intermediate_key, "Test Root", self.root_key, ca=True)
+
+    def chain_pem(self, subject: str = SIGNING_NAME) -> bytes:
+        leaf = make_cert(subject, self.leaf_key, "Test Intermediate", self.intermediate_key, ca=False)
+        return b"".join(cert.public_bytes(serialization.Encoding.PEM) for cert in (leaf, self.intermediate))
+
+    def headers(self, body: bytes = BODY, cert_url: str = CERT_URL, transmission_id: str = "tx-1") -> dict:
+        transmission_time = "2024-01-01T00:00:00Z"
+        message = f"{transmission_id}|{transmission_time}|{WEBHOOK_ID}|{zlib.crc32(body) & 0xFFFFFFFF}".encode()
+        signature = self.leaf_key.sign(message, padding.PKCS1v15(), hashes.SHA256())
+        return {
+            "paypal-transmission-id": transmission_id,
+            "paypal-transmission-time": transmission_time,
+            "paypal-transmission-sig": base64.b64encode(signature).decode(),
+            "paypal-cert-url": cert_url,
+            "paypal-auth-algo": "SHA256withRSA",
+        }
+
+
+class CertServer:
+    """PayPal's certificate endpoint for httpx.MockTransport, counting downloads."""
+
+    def __init__(self, pem: bytes, status_code: int = 200):
+        self.pem = pem
+        self.status_code = status_code
+        self.requests = []
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(str(request.url))
+        return httpx.Response(self.status_code, content=self.pem)
+
+
+class RemoteVerifier:
+    """Stands in for PayPalClient.verify_webhook_signature."""
+
+    def __init__(self, verified: bool = True):
+        self.verified = verified
+        self.calls = []
+
+    async def verify_webhook_signature(self, payload):
+        self.calls.append(payload)
+        return self.verified
+
+
+@pytest.fixture
+def pki(monkeypatch):
+    pki = PKI()
+    monkeypatch.setattr(verifier_module, "_trust_store", lambda: Store([pki.root]))
+    return pki
+
+
+@pytest.fixture
+def remote(monkeypatch):
+    remote = RemoteVerifier()
+    monkeypatch.setattr(verifier_module, "get_paypal_client", lambda: remote)
+    return remote
+
+
+def make_verifier(server: CertServer) -> PayPalWebhookVerifier:
+    return PayPalWebhookVerifier(WEBHOOK_ID, transport=httpx.MockTransport(server))
+
+
+@pytest.mark.asyncio
+async def test_valid_delivery_is_verified_locally(pki, remote):
+    server = CertServer(pki.chain_pem())
+
+    event = await make_verifier(server).verify(pki.headers(), BODY)
+
+    assert event["id"] == "WH-EVENT-1"
+    assert server.requests == [CERT_URL]
+    assert remote.calls == []
+
+
+@pytest.mark.asyncio
+async def test_cached_certificate_is_not_downloaded_again(pki, remote):
+    server = CertServer(pki.chain_pem())
+    verifier = make_verifier(server)
+
+    await verifier.verify(pki.headers(transmission_id="tx-1"), BODY)
+    await verifier.verify(pki.headers(transmission_id="tx-2"), BODY)
+
+    assert server.requests == [CERT_URL]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("cert_url", [
+    "https://evil.example.com/v1/notifications/certs/CERT-1",
+    "https://paypal.com.evil.example.com/v1/notifications/certs/CERT-1",
+    "http://api.paypal.com/v1/notifications/certs/CERT-1",
+    "https://www.paypal.com/v1/notifications/certs/CERT-1",
+    "https://api.paypal.com/v1/oauth2/token",
+    f"{CERT_URL}?x=1",
+    f"{CERT_URL}#x",
+])
+async def test_untrusted_certificate_url_is_rejected_without_any_request(pki, remote, cert_url):
+    server = CertServer(pki.chain_pem())
+
+    with pytest.raises(WebhookVerificationError, match="Untrusted certificate URL"):
+        await make_verifier(server).verify(pki.headers(cert_url=cert_url), BODY)
+
+    assert server.requests == []
+    assert remote.calls == []
+
+
+@pytest.mark.asyncio
+async def test_certificate_for_another_name_is_rejected(pki, remote):
+    server = CertServer(pki.chain_pem(subject="evil.example.com"))
+
+    with pytest.raises(WebhookVerificationError, match="Untrusted PayPal webhook certificate"):
+        await make_verifier(server).verify(pki.headers(), BODY)
+
+    assert remote.calls == []
+
+
+@pytest.mark.asyncio
+async def test_certificate_from_an_untrusted_root_is_rejected(pki, remote, monkeypatch):
+    server = CertServer(pki.chain_pem())
+    monkeypatch.setattr(verifier_module, "_trust_store", lambda: Store([PKI().root]))
+
+    with pytest.raises(WebhookVerificationError, match="Untrusted PayPal webhook certificate"):
+        await make_verifier(server).verify(pki.headers(), BODY)
+
+    assert remote.calls == []
+
+
+@pytest.mark.asyncio
+async def test_modified_body_fails_the_crc(pki, remote):
+    server = CertServer(pki.chain_pem())
+
+    with pytest.raises(WebhookVerificationError, match="Signature mismatch"):
+        await make_verifier(server).verify(pki.headers(), BODY.replace(b"COMPLETED", b"DENIED"))
+
+
+@pytest.mark.asyncio
+async def test_signature_from_another_key_is_rejected(pki, remote):
+    server = CertServer(pki.chain_pem())
+    headers = pki.headers()
+    pki.leaf_key = make_key()
+    headers["paypal-transmission-sig"] = pki.headers()["paypal-transmission-sig"]
+
+    with pytest.raises(WebhookVerificationError, match="Signature mismatch"):
+        await make_verifier(server).verify(headers, BODY)
+
+
+@pytest.mark.asyncio
+async def test_unavailable_certificate_falls_back_to_remote_verification(pki, remote):
+    server = CertServer(b"", status_code=503)
+
+    event = await make_verifier(server).verify(pki.headers(), BODY)
+
+    assert event["id"] == "WH-EVENT-1"
+    assert [call["cert_url"] for call in remote.calls] == [CERT_URL]
+    assert remote.calls[0]["webhook_id"] == WEBHOOK_ID
+
+
+@pytest.mark.asyncio
+async def test_remote_rejection_fails_verification(pki, remote):
+    remote.verified = False
+
+    with pytest.raises(WebhookVerificationError, match="rejected"):
+        await make_verifier(CertServer(b"not a certificate")).verify(pki.headers(), BODY)
@@ -0,0 +1,147 @@
+import base64
+import hashlib
+import hmac
+import json
+import time
+import httpx
+import pytest
+import pytest_asyncio
+from postgrest import APIResponse
+from postgrest.exceptions import APIError
+import main
+import services.catalog_store as catalog_store_module
+from config.settings import settings
+from services.catalog_events import CatalogEventBroker
+from services.catalog_store import CatalogStore
+
+WEBHOOK_SECRET = "test-webhook-secret"
+CATEGORY = {"_id": "category-mugs", "title": "Mugs", "slug": "mugs"}
+PRODUCTS = [
+    {
+        "_id": f"product-{n}", "_createdAt": f"2024-01-0{n}T00:00:00Z", "name": f"Blue mug {n}",
+        "slug": f"blue-mug-{n}", "price": 10.0 * n, "stock": 5, "category": CATEGORY,
+        "imageUrl": "https://cdn.test/mug.png", "description": "A blue mug", "isFeatured": False,
+    }
+    for n in (1, 2)
+]
+
+
+class FakeProductTable:
+    """Supabase's product table as the webhook uses it: records deletes, optionally failing them."""
+
+    def __init__(self, fail: bool = False):
+        self.fail = fail
+        self.deleted = []
+
+    def delete(self):
+        return self
+
+    def eq(self, column, value):
+        self.deleted.append(value)
+        return self
+
+    async def execute(self):
+        if self.fail:
+            raise APIError({"message": "permission denied", "code": "42501"})
+        return APIResponse(data=[], count=None)
+
+
+class FakeSupabase:
+    def __init__(self, table: FakeProductTable):
+        self._table = table
+
+    def table(self, name):
+        return self._table
+
+
+def signed_headers(body: bytes) -> dict:
+    timestamp = str(int(time.time() * 1000))
+    digest = hmac.new(WEBHOOK_SECRET.encode(), f"{timestamp}.".encode() + body, hashlib.sha256).digest()
+    signature = base64.urlsafe_b64encode(digest).rstrip(b"=").decode()
+    return {"sanity-webhook-signature": f"t={timestamp},v1={signature}", "Content-Type": "application/json"}
+
+
+@pytest_asyncio.fixture
+async def catalog(monkeypatch):
+    async def fetch_all_products():
+        return [dict(product) for product in PRODUCTS]
+
+    monkeypatch.setattr(catalog_store_module, "fetch_all_products", fetch_all_products)
+    store = CatalogStore(refresh_seconds=3600)
+    assert await store.ensure_loaded()
+    monkeypatch.setattr(main, "catalog_store", store)
+    monkeypatch.setattr(settings, "SANITY_WEBHOOK_SECRET", WEBHOOK_SECRET)
+    return store
+
+
+@pytest_asyncio.fixture
+async def api():
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://test") as client:
+        yield client
+
+
+async def post_deletion(api, monkeypatch, table: FakeProductTable, ids):
+    monkeypatch.setattr(main, "get_supabase_admin", lambda: FakeSupabase(table))
+    body = json.dumps({"deleted": ids}).encode()
+    return await api.post("/webhook/sanity", content=body, headers=signed_headers(body))
+
+
+async def search_ids(api, query: str):
+    response = await api.get("/products/search", params={"q": query})
+    assert response.status_code == 200
+    return {product["id"] for product in response.json()}
+
+
+@pytest.mark.asyncio
+async def test_deletion_webhook_removes_the_product_from_search(catalog, api, monkeypatch):
+    assert await search_ids(api, "mug") == {"product-1", "product-2"}
+    table = FakeProductTable()
+
+    response = await post_deletion(api, monkeypatch, table, ["product-1"])
+
+    assert response.status_code == 200
+    assert table.deleted == ["product-1"]
+    assert catalog.get("product-1") is None
+    assert await search_ids(api, "mug") == {"product-2"}
+
+
+@pytest.mark.asyncio
+async def test_deletion_webhook_updates_the_catalog_when_supabase_fails(catalog, api, monkeypatch):
+    response = await post_deletion(api, monkeypatch, FakeProductTable(fail=True), ["product-2"])
+
+    assert response.status_code == 200
+    assert await search_ids(api, "mug") == {"product-1"}
+
+
+@pytest.mark.asyncio
+async def test_deletion_webhook_publishes_a_deleted_event(catalog, api, monkeypatch):
+    broker = CatalogEventBroker(buffer_size=8, max_subscribers=8)
+    monkeypatch.setattr(main, "catalog_events", broker)
+    subscriber = broker.subscribe({"product-1"})
+
+    response = await post_deletion(api, monkeypatch, FakeProductTable(), ["product-1", "drafts.product-2"])
+
+    assert response.status_code == 200
+    event = subscriber.queue.get_nowait()
+    assert (event["type"], event["productId"]) == ("product.deleted", "product-1")
+    assert subscriber.queue.empty()
+
+
+@pytest.mark.asyncio
+async def test_events_from_other_workers_reach_local_subscribers():
+    sender = CatalogEventBroker(buffer_size=8, max_subscribers=8, backend="postgres", dsn="postgresql://db/app")
+    receiver = CatalogEventBroker(buffer_size=8, max_subscribers=8, backend="postgres", dsn="postgresql://db/app")
+    payloads = []
+    for broker in (sender, receiver):
+        broker._channel.send_soon = payloads.append
+    own = sender.subscribe()
+    other = receiver.subscribe()
+
+    sender.publish_product_deleted("product-1")
+    for payload in payloads:
+        sender._on_payload(payload)
+        receiver._on_payload(payload)
+
+    assert own.queue.qsize() == 1
+    event = other.queue.get_nowait()
+    assert (event["type"], event["productId"], event["id"]) == ("product.deleted", "product-1", 1)
@@ -0,0 +1,109 @@
+from datetime import datetime, timedelta, timezone
+import pytest
+from services.scheduler import CronSchedule, Job, Scheduler
+
+
+def utc(*args) -> datetime:
+    return datetime(*args, tzinfo=timezone.utc)
+
+
+MONDAY = utc(2024, 1, 15, 10, 30)
+
+
+@pytest.mark.parametrize("expression, moment, expected", [
+    ("* * * * *", MONDAY, utc(2024, 1, 15, 10, 31)),
+    ("*/15 * * * *", MONDAY, utc(2024, 1, 15, 10, 45)),
+    ("0 * * * *", MONDAY, utc(2024, 1, 15, 11, 0)),
+    # Strictly after: the current minute doesn't count
+    ("30 10 * * *", MONDAY, utc(2024, 1, 16, 10, 30)),
+    ("30 10 * * *", MONDAY + timedelta(seconds=59), utc(2024, 1, 16, 10, 30)),
+    ("0 9-17/4 * * 1-5", MONDAY, utc(2024, 1, 15, 13, 0)),
+    ("0 9-17/4 * * 1-5", utc(2024, 1, 19, 17, 0), utc(2024, 1, 22, 9, 0)),
+    ("15,45 8 * * *", MONDAY, utc(2024, 1, 16, 8, 15)),
+    ("0 */6 * * *", MONDAY, utc(2024, 1, 15, 12, 0)),
+    ("0 20/2 * * *", MONDAY, utc(2024, 1, 15, 20, 0)),
+    # Sunday is 0 or 7
+    ("0 0 * * 0", MONDAY, utc(2024, 1, 21, 0, 0)),
+    ("0 0 * * 7", MONDAY, utc(2024, 1, 21, 0, 0)),
+    # Only one day field restricted: it alone decides
+    ("0 0 13 * *", MONDAY, utc(2024, 2, 13, 0, 0)),
+    ("0 0 * * 5", MONDAY, utc(2024, 1, 19, 0, 0)),
+    # Both restricted: either one matches
+    ("0 0 13 * 5", MONDAY, utc(2024, 1, 19, 0, 0)),
+    ("0 0 16 * 5", MONDAY, utc(2024, 1, 16, 0, 0)),
+    # Month and year rollover
+    ("0 0 1 * *", MONDAY, utc(2024, 2, 1, 0, 0)),
+    ("5 4 * 12 *", utc(2024, 11, 30, 12, 0), utc(2024, 12, 1, 4, 5)),
+    ("59 23 31 12 *", utc(2024, 12, 31, 23, 59), utc(2025, 12, 31, 23, 59)),
+    ("0 0 31 * *", utc(2024, 2, 1), utc(2024, 3, 31, 0, 0)),
+    ("0 0 29 2 *", utc(2024, 3, 1), utc(2028, 2, 29, 0, 0)),
+    ("0 0 1 3,6 *", utc(2024, 7, 1), utc(2025, 3, 1, 0, 0)),
+    # Schedules are in UTC whatever the moment's timezone
+    ("0 11 * * *", datetime(2024, 1, 15, 12, 30, tzinfo=timezone(timedelta(hours=2))), utc(2024, 1, 15, 11, 0)),
+])
+def test_next_after(expression, moment, expected):
+    assert CronSchedule(expression).next_after(moment) == expected
+
+
+@pytest.mark.parametrize("expression", [
+    "* * * *",
+    "* * * * * *",
+    "60 * * * *",
+    "* 24 * * *",
+    "* * 0 * *",
+    "* * * 13 *",
+    "* * * * 8",
+    "*/0 * * * *",
+    "5-1 * * * *",
+    "a * * * *",
+])
+def test_invalid_expression_is_rejected(expression):
+    with pytest.raises(ValueError):
+        CronSchedule(expression)
+
+
+def test_schedule_that_never_fires_is_rejected_by_next_after():
+    with pytest.raises(ValueError, match="never fires"):
+        CronSchedule("0 0 31 2 *").next_after(MONDAY)
+
+
+class FakeLeader:
+    def __init__(self, is_leader: bool):
+        self.is_leader = is_leader
+
+
+def make_jobs(ran):
+    async def record(name):
+        ran.append(name)
+
+    return [
+        Job("everywhere", CronSchedule("* * * * *"), lambda: record("everywhere")),
+        Job("leader", CronSchedule("* * * * *"), lambda: record("leader"), leader_only=True),
+    ]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("leader, expected", [
+    (FakeLeader(is_leader=False), ["everywhere"]),
+    (FakeLeader(is_leader=True), ["everywhere", "leader"]),
+    (None, ["everywhere", "leader"]),
+])
+async def test_run_skips_leader_only_jobs_unless_leader(leader, expected):
+    ran = []
+    jobs = make_jobs(ran)
+    scheduler = Scheduler(jobs, leader, jitter=0)
+
+    for job in jobs:
+        await scheduler.run(job)
+
+    assert ran == expected
+
+
+@pytest.mark.asyncio
+async def test_failing_job_does_not_raise():
+    async def fail():
+        raise RuntimeError("boom")
+
+    job = Job("failing", CronSchedule("* * * * *"), fail)
+
+    await Scheduler([job], None, jitter=0).run(job)
@@ -0,0 +1,70 @@
+import httpx
+import pytest
+import pytest_asyncio
+import main
+import services.warmup as warmup
+from services.catalog_snapshot import write_snapshot
+from services.catalog_store import CatalogStore
+
+CATEGORY = {"_id": "category-mugs", "title": "Mugs", "slug": "mugs", "order": 1}
+PRODUCTS = [
+    {
+        "_id": f"product-{n}", "_createdAt": f"2024-01-0{n}T00:00:00Z", "name": f"Mug {n}", "slug": f"mug-{n}",
+        "price": 10.0 * n, "stock": 5, "category": {"_id": "category-mugs", "title": "Mugs", "slug": "mugs"},
+        "imageUrl": "https://cdn.test/mug.png", "description": "A mug", "isFeatured": False,
+    }
+    for n in (1, 2, 3)
+]
+CONTENT = {
+    "categories": [CATEGORY],
+    "contentBlocks": [{"_id": "block-1", "title": "Welcome", "description": [], "imageLeft": True, "order": 1}],
+    "homepageSections": [{"slug": "hero", "title": "Hero", "description": []}],
+}
+
+
+@pytest_asyncio.fixture
+async def sanity_down(monkeypatch, tmp_path):
+    """A warm start from a persisted catalog, with every Sanity query failing as the fetchers do."""
+    async def empty(*args, **kwargs):
+        return []
+
+    async def missing(*args, **kwargs):
+        return None
+
+    for name in ("fetch_all_products", "fetch_content_blocks"):
+        monkeypatch.setattr(main, name, empty)
+    for name in ("fetch_categories", "fetch_homepage_section"):
+        monkeypatch.setattr(main, name, missing)
+
+    path = str(tmp_path / "catalog.snapshot")
+    write_snapshot(path, PRODUCTS, 1, CONTENT)
+    store = CatalogStore(refresh_seconds=3600, persist_path=path)
+    monkeypatch.setattr(warmup, "catalog_store", store)
+    monkeypatch.setattr(main, "catalog_store", store)
+    monkeypatch.setattr(warmup, "_fallback_content", {})
+    assert await warmup.restore_warm_start()
+
+
+@pytest_asyncio.fixture
+async def api():
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://test") as client:
+        yield client
+
+
+@pytest.mark.asyncio
+async def test_products_are_served_from_the_restored_catalog(sanity_down, api):
+    response = await api.get("/products", params={"sort": "price-desc", "maxPrice": 25})
+
+    assert response.status_code == 200
+    assert [product["id"] for product in response.json()] == ["product-2", "product-1"]
+
+
+@pytest.mark.asyncio
+async def test_content_is_served_from_the_restored_snapshot(sanity_down, api):
+    categories = await api.get("/categories")
+    blocks = await api.get("/content-blocks")
+    section = await api.get("/homepage/sections/hero")
+
+    assert [category["slug"] for category in categories.json()] == ["mugs"]
+    assert [block["title"] for block in blocks.json()] == ["Welcome"]
+    assert section.status_code == 200 and section.json()["title"] == "Hero"
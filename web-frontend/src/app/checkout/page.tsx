@@ -3,7 +3,7 @@
 
 import { useAuth, useUser } from "@clerk/nextjs";
 import { SignInButton } from '@/components/ClerkUI';
-import { useState, useCallback } from 'react'; // Import useCallback
+import { useState, useCallback, useRef } from 'react'; // Import useCallback
 import Link from 'next/link';
 import { useCart } from '@/context/CartContext';
 import { toast } from 'react-hot-toast';
@@ -18,6 +18,9 @@ export default function CheckoutPage() {
   const router = useRouter();
   const [isProcessing, setIsProcessing] = useState(false);
   const [errorMessage, setErrorMessage] = useState<string | null>(null);
+  // Idempotency-Key of the current PayPal order attempt: trying again for the same cart
+  // total after an error or timeout gets the order already created instead of a new one
+  const createAttempt = useRef<{ cartTotal: number; key: string } | null>(null);
 
   
   const backendBase = process.env.NEXT_PUBLIC_API_BASE_URL;
@@ -36,11 +39,19 @@ export default function CheckoutPage() {
     }
 
     setErrorMessage(null);
+    if (createAttempt.current?.cartTotal !== cartTotal) {
+      createAttempt.current = { cartTotal, key: `create-${crypto.randomUUID()}` };
+    }
+    const idempotencyKey = createAttempt.current.key;
     try {
       const token = await getToken({ template: "supabase" });
       const response = await fetch(`${backendBase}/api/orders/create`, {
         method: "POST",
-        headers: { "Content-Type": "application/json", "Authorization": `Bearer ${token}` },
+        headers: {
+          "Content-Type": "application/json",
+          "Authorization": `Bearer ${token}`,
+          "Idempotency-Key": idempotencyKey,
+        },
       });
       const order = await response.json();
       if (!response.ok) throw new Error(order.detail || "Failed to create PayPal order.");
@@ -85,7 +96,12 @@ export default function CheckoutPage() {
     const token = await getToken({ template: "supabase" });
     const response = await fetch(`${backendBase}/api/orders/${data.orderID}/capture`, {
       method: "POST",
-      headers: { "Content-Type": "application/json", "Authorization": `Bearer ${token}` },
+      headers: {
+        "Content-Type": "application/json",
+        "Authorization": `Bearer ${token}`,
+        // Retries of the same approval replay the stored result instead of capturing twice
+        "Idempotency-Key": `capture-${data.orderID}`,
+      },
     });
 
     const orderDetails = await response.json();
@@ -99,6 +115,7 @@ export default function CheckoutPage() {
     }
     
     toast.success("Payment successful! Redirecting...");
+    createAttempt.current = null;
     clearCart();
     router.refresh();
     router.push(`/order-confirmation/${orderDetails.orderId || orderDetails.id}`);
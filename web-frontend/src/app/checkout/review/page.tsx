@@ -2,7 +2,7 @@
 'use client';
 
 import Image from 'next/image';
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { useRouter } from 'next/navigation';
 import { useCart } from '@/context/CartContext';
 import { toast } from 'react-hot-toast';
@@ -34,6 +34,9 @@ export default function OrderReviewPage() {
   const [paymentMethod, setPaymentMethod] = useState<string | null>(null);
   const [isPlacingOrder, setIsPlacingOrder] = useState(false);
   const [orderError, setOrderError] = useState<string | null>(null);
+  // Idempotency-Key of the current order attempt: placing the same order again after an
+  // error or timeout replays the first result instead of creating a second order
+  const orderAttempt = useRef<{ body: string; key: string } | null>(null);
 
   // Constants for fixed costs (for now) - these would ideally come from backend config
   const SHIPPING_COST = 10.00;
@@ -115,10 +118,16 @@ export default function OrderReviewPage() {
         // e.g., created_at, status (initial), transaction_id (if payment gateway integrated)
       };
       
-      const response = await apiCheckout(orderData); // Call your backend's checkout API
+      const body = JSON.stringify(orderData);
+      if (orderAttempt.current?.body !== body) {
+        orderAttempt.current = { body, key: `checkout-${crypto.randomUUID()}` };
+      }
+      const idempotencyKey = orderAttempt.current.key;
+      const response = await apiCheckout(orderData, undefined, idempotencyKey); // Call your backend's checkout API
 
       if (response && response.order_id) {
         toast.success('Order placed successfully!');
+        orderAttempt.current = null;
         
         clearCart();
         sessionStorage.removeItem('shippingAddress'); // Clear session data
@@ -240,10 +240,16 @@ export async function updateCartItemQuantity(productId: string, quantity: number
 
 // -------- CHECKOUT AND ORDER FUNCTIONS --------
 
-export async function checkout(payload: CheckoutPayload, token?: string): Promise<{ order_id: string }> {
+export async function checkout(
+  payload: CheckoutPayload,
+  token?: string,
+  idempotencyKey?: string,
+): Promise<{ order_id: string }> {
   try {
     const headers: Record<string, string> = { 'Content-Type': 'application/json' };
     if (token) headers['Authorization'] = `Bearer ${token}`;
+    // Sending the same key again replays the first response instead of placing a second order
+    if (idempotencyKey) headers['Idempotency-Key'] = idempotencyKey;
     const res = await fetch(`${FASTAPI_URL}/checkout`, {
       method: 'POST',
       headers,